@@ -23,28 +23,247 @@
 #
 # General permission to copy or modify is hereby granted.
 
+import collections
 import math
+import threading
+import time
 
 try:
     from PySide6.QtWidgets import QGraphicsView, QGraphicsScene, QWidget
-    from PySide6.QtGui import QImage, QPainter
-    from PySide6.QtCore import QRectF, Slot
+    from PySide6.QtGui import QImage, QPainter, QGuiApplication
+    from PySide6.QtCore import Qt, QRectF, Slot, Signal, QTimer
 except ImportError:
     from PySide2.QtWidgets import QGraphicsView, QGraphicsScene, QWidget
-    from PySide2.QtGui import QImage, QPainter
-    from PySide2.QtCore import QRectF, Slot
+    from PySide2.QtGui import QImage, QPainter, QGuiApplication
+    from PySide2.QtCore import Qt, QRectF, Slot, Signal, QTimer
+
+DEFAULT_REFRESH_RATE = 60.0
+# Edge length of the tiles the zoomable view is rendered from
+TILE_SIZE = 512
+TILE_CACHE_BYTES = 256 * 1024 * 1024
+MAX_ZOOM = 16.0
+ZOOM_STEP = 1.25
+
+
+class FrameMailbox:
+    """
+    Thread-safe single-slot mailbox between the acquisition and the display.
+    Posting a new frame replaces a frame that has not been painted yet, so a
+    slow display can never build up a backlog.
+    """
+
+    def __init__(self):
+        self.posted = 0
+        self.overwritten = 0
+        self._image = None
+        self._lock = threading.Lock()
+
+    def post(self, image):
+        with self._lock:
+            if self._image is not None:
+                self.overwritten += 1
+            self._image = image
+            self.posted += 1
+
+    def take(self):
+        """
+        :return: the latest unpainted frame, or None if there is none
+        """
+        with self._lock:
+            image = self._image
+            self._image = None
+            return image
 
 
 class Display(QGraphicsView):
+    # Emitted once per second with (displayed fps, acquired fps)
+    frame_rates_changed = Signal(float, float)
+
     def __init__(self, parent: QWidget = None):
         super().__init__(parent)
         self.__scene = CustomGraphicsScene(self)
         self.setScene(self.__scene)
 
+        self.__mailbox = FrameMailbox()
+        self.__displayed = 0
+        self.__rate_start = time.monotonic()
+        self.__rate_displayed = 0
+        self.__rate_posted = 0
+        self.displayed_fps = 0.0
+        self.acquired_fps = 0.0
+
+        # Repaints are coalesced to the monitor refresh rate
+        screen = QGuiApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None else 0
+        if not refresh_rate or refresh_rate <= 0:
+            refresh_rate = DEFAULT_REFRESH_RATE
+        self.__refresh_timer = QTimer(self)
+        self.__refresh_timer.setInterval(int(1000 / refresh_rate))
+        self.__refresh_timer.timeout.connect(self.__on_refresh)
+        self.__refresh_timer.start()
+
+        # None: fit the whole image to the widget, otherwise display pixels per image pixel
+        self.__zoom = None
+        self.__center_x = 0.0
+        self.__center_y = 0.0
+        self.__drag_position = None
+        self.setToolTip("Mouse wheel: zoom, drag: pan, double click: fit, 1: 1:1 pixels")
+
     @Slot(QImage)
     def on_image_received(self, image: QImage):
-        self.__scene.set_image(image)
-        self.update()
+        """
+        Hand a frame to the display. Safe to call from any thread, the image
+        must not share memory that the caller re-uses (pass a copy).
+        """
+        self.__mailbox.post(image)
+
+    def __on_refresh(self):
+        image = self.__mailbox.take()
+        if image is not None:
+            self.__scene.set_image(image)
+            self.viewport().update()
+            self.__displayed += 1
+
+        now = time.monotonic()
+        elapsed = now - self.__rate_start
+        if elapsed >= 1.0:
+            posted = self.__mailbox.posted
+            self.displayed_fps = (self.__displayed - self.__rate_displayed) / elapsed
+            self.acquired_fps = (posted - self.__rate_posted) / elapsed
+            self.__rate_displayed = self.__displayed
+            self.__rate_posted = posted
+            self.__rate_start = now
+            self.frame_rates_changed.emit(self.displayed_fps, self.acquired_fps)
+
+    def __fit_zoom(self):
+        image_width, image_height = self.__scene.image_size()
+        if image_width == 0 or image_height == 0:
+            return 1.0
+        return min(self.width() / image_width, self.height() / image_height)
+
+    def view_transform(self):
+        """
+        :return: (zoom, center x, center y) - display pixels per image pixel
+                 and the image coordinate shown in the middle of the display
+        """
+        image_width, image_height = self.__scene.image_size()
+        if self.__zoom is None:
+            return self.__fit_zoom(), image_width / 2.0, image_height / 2.0
+        # Keep the center inside the image when the frame size changes
+        self.__center_x = min(max(self.__center_x, 0.0), float(image_width))
+        self.__center_y = min(max(self.__center_y, 0.0), float(image_height))
+        return self.__zoom, self.__center_x, self.__center_y
+
+    def set_zoom(self, zoom: float = None, anchor_x: float = None, anchor_y: float = None):
+        """
+        :param zoom: display pixels per image pixel, None to fit the image to the widget
+        :param anchor_x: widget position that stays on the same image pixel
+        :param anchor_y: widget position that stays on the same image pixel
+        """
+        old_zoom, center_x, center_y = self.view_transform()
+        if zoom is not None:
+            zoom = min(max(zoom, self.__fit_zoom()), MAX_ZOOM)
+            if anchor_x is not None:
+                offset_x = anchor_x - self.width() / 2.0
+                offset_y = anchor_y - self.height() / 2.0
+                center_x += offset_x / old_zoom - offset_x / zoom
+                center_y += offset_y / old_zoom - offset_y / zoom
+        self.__zoom = zoom
+        self.__center_x = center_x
+        self.__center_y = center_y
+        self.viewport().update()
+
+    def wheelEvent(self, event):
+        position = event.position() if hasattr(event, "position") else event.pos()
+        zoom = self.view_transform()[0]
+        zoom = zoom * ZOOM_STEP if event.angleDelta().y() > 0 else zoom / ZOOM_STEP
+        self.set_zoom(zoom, position.x(), position.y())
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton and self.__zoom is not None:
+            self.__drag_position = event.pos()
+        super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self.__drag_position is not None:
+            position = event.pos()
+            self.__center_x -= (position.x() - self.__drag_position.x()) / self.__zoom
+            self.__center_y -= (position.y() - self.__drag_position.y()) / self.__zoom
+            self.__drag_position = position
+            self.viewport().update()
+        super().mouseMoveEvent(event)
+
+    def mouseReleaseEvent(self, event):
+        self.__drag_position = None
+        super().mouseReleaseEvent(event)
+
+    def mouseDoubleClickEvent(self, event):
+        self.set_zoom(None)
+
+    def keyPressEvent(self, event):
+        if event.key() == Qt.Key_1:
+            self.set_zoom(1.0)
+        elif event.key() == Qt.Key_0:
+            self.set_zoom(None)
+        else:
+            super().keyPressEvent(event)
+
+
+class ImagePyramid:
+    """
+    Lazily built resolution pyramid of one frame. Level 0 is the frame
+    itself, every following level halves width and height. Levels are only
+    computed when a view at that zoom level is painted.
+    """
+
+    def __init__(self, image: QImage):
+        self.__levels = {0: image}
+
+    def max_level(self):
+        image = self.__levels[0]
+        size = max(image.width(), image.height(), 1)
+        return max(int(math.log2(size / TILE_SIZE)), 0) + 1
+
+    def level(self, level: int) -> QImage:
+        image = self.__levels.get(level)
+        if image is None:
+            # Scale down from the nearest finer level that is already built
+            finer = max(existing for existing in self.__levels if existing < level)
+            source = self.__levels[finer]
+            factor = 1 << (level - finer)
+            image = source.scaled(max(source.width() // factor, 1),
+                                  max(source.height() // factor, 1),
+                                  Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            self.__levels[level] = image
+        return image
+
+
+class TileCache:
+    """
+    LRU cache of pyramid tiles, bounded by the number of bytes it holds
+    """
+
+    def __init__(self, max_bytes: int = TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.__tiles = collections.OrderedDict()
+
+    def get(self, key):
+        tile = self.__tiles.get(key)
+        if tile is not None:
+            self.__tiles.move_to_end(key)
+        return tile
+
+    def put(self, key, tile: QImage):
+        self.__tiles[key] = tile
+        self.bytes += tile.sizeInBytes() if hasattr(tile, "sizeInBytes") else tile.byteCount()
+        while self.bytes > self.max_bytes and len(self.__tiles) > 1:
+            _, evicted = self.__tiles.popitem(last=False)
+            self.bytes -= evicted.sizeInBytes() if hasattr(evicted, "sizeInBytes") else evicted.byteCount()
+
+    def clear(self):
+        self.__tiles.clear()
+        self.bytes = 0
 
 
 class CustomGraphicsScene(QGraphicsScene):
@@ -52,11 +271,40 @@ class CustomGraphicsScene(QGraphicsScene):
         super().__init__(parent)
         self.__parent = parent
         self.__image = QImage()
+        self.__pyramid = None
+        self.__tiles = TileCache()
+        self.__generation = 0
+        # Generation of the tiles in the cache and of the last painted frame
+        self.__tiles_generation = 0
+        self.__painted_generation = 0
 
     def set_image(self, image: QImage):
         self.__image = image
+        # Pyramid levels are built on demand for the new frame, tiles only
+        # once the frame is painted again without a newer one (see drawBackground)
+        self.__pyramid = ImagePyramid(image)
+        self.__generation += 1
         self.update()
 
+    def image_size(self):
+        return self.__image.width(), self.__image.height()
+
+    def __tile(self, level: int, tile_x: int, tile_y: int) -> QImage:
+        if self.__tiles_generation != self.__generation:
+            self.__tiles.clear()
+            self.__tiles_generation = self.__generation
+        key = (level, tile_x, tile_y)
+        tile = self.__tiles.get(key)
+        if tile is None:
+            # Edge tiles are cropped to the image, `copy` would pad them
+            level_image = self.__pyramid.level(level)
+            x = tile_x * TILE_SIZE
+            y = tile_y * TILE_SIZE
+            tile = level_image.copy(x, y, min(TILE_SIZE, level_image.width() - x),
+                                    min(TILE_SIZE, level_image.height() - y))
+            self.__tiles.put(key, tile)
+        return tile
+
     def drawBackground(self, painter: QPainter, rect: QRectF):
         # Display size
         display_width = self.__parent.width()
@@ -70,27 +318,51 @@ class CustomGraphicsScene(QGraphicsScene):
         if image_width == 0 or image_height == 0:
             return
 
-        # Calculate aspect ratio of display
-        ratio1 = display_width / display_height
-        # Calculate aspect ratio of image
-        ratio2 = image_width / image_height
+        # Scene (0, 0) is the center of the display, one scene unit is one
+        # display pixel. `zoom` is display pixels per image pixel
+        zoom, center_x, center_y = self.__parent.view_transform()
 
-        if ratio1 > ratio2:
-            # The height with must fit to the display height.So h remains and w must be scaled down
-            image_width = display_height * ratio2
-            image_height = display_height
-        else:
-            # The image with must fit to the display width. So w remains and h must be scaled down
-            image_width = display_width
-            image_height = display_height / ratio2
+        # Pick the coarsest pyramid level that still has at least one pixel
+        # per display pixel, and only the tiles of it that are visible
+        level = min(max(int(math.floor(math.log2(1.0 / zoom))), 0), self.__pyramid.max_level())
+        scale = 1 << level
+        level_image = self.__pyramid.level(level)
 
-        image_pos_x = -1.0 * (image_width / 2.0)
-        image_pox_y = -1.0 * (image_height / 2.0)
+        left = max(center_x - display_width / 2.0 / zoom, 0.0) / scale
+        top = max(center_y - display_height / 2.0 / zoom, 0.0) / scale
+        right = min(center_x + display_width / 2.0 / zoom, image_width) / scale
+        bottom = min(center_y + display_height / 2.0 / zoom, image_height) / scale
+        right = min(right, level_image.width())
+        bottom = min(bottom, level_image.height())
+        if right <= left or bottom <= top:
+            return
 
-        # Remove digits after point
-        image_pos_x = math.trunc(image_pos_x)
-        image_pox_y = math.trunc(image_pox_y)
+        # Level pixels may be a rounded down fraction of the image size
+        scale_x = image_width / level_image.width()
+        scale_y = image_height / level_image.height()
 
-        rect = QRectF(image_pos_x, image_pox_y, image_width, image_height)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, zoom < 1.0)
+        repaint = self.__painted_generation == self.__generation
+        self.__painted_generation = self.__generation
+        if not repaint:
+            # Live: a frame is painted once, cutting it into tiles would cost
+            # more than drawing its visible part straight from the level
+            source = QRectF(left, top, right - left, bottom - top)
+            target = QRectF((left * scale_x - center_x) * zoom,
+                            (top * scale_y - center_y) * zoom,
+                            (right - left) * scale_x * zoom,
+                            (bottom - top) * scale_y * zoom)
+            painter.drawImage(target, level_image, source)
+            return
 
-        painter.drawImage(rect, self.__image)
+        # The same frame again (pan, zoom, resize while paused): tiles are cached
+        for tile_y in range(int(top) // TILE_SIZE, int(math.ceil(bottom)) // TILE_SIZE + 1):
+            for tile_x in range(int(left) // TILE_SIZE, int(math.ceil(right)) // TILE_SIZE + 1):
+                if tile_x * TILE_SIZE >= level_image.width() or tile_y * TILE_SIZE >= level_image.height():
+                    continue
+                tile = self.__tile(level, tile_x, tile_y)
+                target = QRectF((tile_x * TILE_SIZE * scale_x - center_x) * zoom,
+                                (tile_y * TILE_SIZE * scale_y - center_y) * zoom,
+                                tile.width() * scale_x * zoom,
+                                tile.height() * scale_y * zoom)
+                painter.drawImage(target, tile)
@@ -0,0 +1,225 @@
+# \file    focus.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Focus metrics (Laplacian variance, Tenengrad, normalised variance)
+#          on a region of interest of the preview frames and a Z-sweep
+#          recorder that finds the best-focus frame
+#
+# \version 1.0
+
+import time
+
+import numpy as np
+
+
+METRICS = ("laplacian", "tenengrad", "normalized_variance")
+# Default ROI edge length, centred in the frame
+DEFAULT_ROI_SIZE = 512
+
+
+def parse_roi(text: str):
+    """
+    :param text: "x,y,width,height", empty or None for the default centred ROI
+    """
+    if not text:
+        return None
+    x, y, width, height = (int(value) for value in text.split(","))
+    if width <= 2 or height <= 2:
+        raise ValueError("The focus ROI must be larger than 2x2 pixels")
+    return x, y, width, height
+
+
+def centered_roi(width: int, height: int, size: int = DEFAULT_ROI_SIZE):
+    roi_width, roi_height = min(size, width), min(size, height)
+    return (width - roi_width) // 2, (height - roi_height) // 2, roi_width, roi_height
+
+
+def _variance(array: np.ndarray) -> float:
+    """
+    Variance of a contiguous float32 array via BLAS dot products, without
+    the temporary deviation array of ndarray.var
+    """
+    flat = array.reshape(-1)
+    mean = float(flat.sum(dtype=np.float64)) / flat.size
+    return max(float(np.dot(flat, flat)) / flat.size - mean * mean, 0.0)
+
+
+def _scratch(work, shape):
+    if work is None or work.shape != shape:
+        return np.empty(shape, np.float32)
+    return work
+
+
+def laplacian_variance(gray: np.ndarray, work: np.ndarray = None) -> float:
+    """
+    Variance of the 4-neighbour Laplacian
+
+    :param gray: float32 (h, w) frame
+    :param work: optional (h - 2, w - 2) float32 scratch buffer
+    """
+    laplacian = _scratch(work, (gray.shape[0] - 2, gray.shape[1] - 2))
+    np.add(gray[1:-1, :-2], gray[1:-1, 2:], out=laplacian)
+    laplacian += gray[:-2, 1:-1]
+    laplacian += gray[2:, 1:-1]
+    laplacian -= 4 * gray[1:-1, 1:-1]
+    return _variance(laplacian)
+
+
+def tenengrad(gray: np.ndarray, work=None) -> float:
+    """
+    Mean squared Sobel gradient magnitude
+
+    :param gray: float32 (h, w) frame
+    :param work: optional pair of (h - 2, w - 2) float32 scratch buffers
+    """
+    shape = (gray.shape[0] - 2, gray.shape[1] - 2)
+    gx, gy = (None, None) if work is None else work
+    gx, gy = _scratch(gx, shape), _scratch(gy, shape)
+    # Separable Sobel: [1 2 1] smoothing across, [-1 0 1] difference along
+    np.subtract(gray[:-2, 2:], gray[:-2, :-2], out=gx)
+    gx += gray[2:, 2:]
+    gx -= gray[2:, :-2]
+    np.subtract(gray[1:-1, 2:], gray[1:-1, :-2], out=gy)
+    gy *= 2
+    gx += gy
+    np.subtract(gray[2:, :-2], gray[:-2, :-2], out=gy)
+    gy += gray[2:, 2:]
+    gy -= gray[:-2, 2:]
+    smooth = gray[2:, 1:-1] - gray[:-2, 1:-1]
+    smooth *= 2
+    gy += smooth
+    flat_x, flat_y = gx.reshape(-1), gy.reshape(-1)
+    return (float(np.dot(flat_x, flat_x)) + float(np.dot(flat_y, flat_y))) / flat_x.size
+
+
+def normalized_variance(gray: np.ndarray) -> float:
+    """
+    Intensity variance divided by the mean, independent of the illumination level
+    """
+    mean = float(gray.mean(dtype=np.float64))
+    if mean == 0:
+        return 0.0
+    return _variance(np.ascontiguousarray(gray)) / mean
+
+
+class FocusStage:
+    """
+    Computes all focus metrics on the ROI of a frame. Only the ROI is
+    converted to float32, into a buffer that is re-used between frames,
+    so the cost does not depend on the sensor size.
+    """
+
+    def __init__(self, roi=None, channel: int = 1):
+        """
+        :param roi: (x, y, width, height), None for a DEFAULT_ROI_SIZE square in the centre
+        :param channel: channel evaluated in (h, w, c) frames, 1 is green in BGRa8
+        """
+        self.roi = roi
+        self.channel = channel
+        self.last = None
+        self.elapsed_us = 0.0
+        self._gray = None
+        self._work = None
+
+    def process(self, array: np.ndarray) -> dict:
+        """
+        :param array: (h, w) or (h, w, c) frame
+        :return: metric name -> score, larger is sharper
+        """
+        start = time.perf_counter()
+        height, width = array.shape[:2]
+        x, y, roi_width, roi_height = self.roi or centered_roi(width, height)
+        region = array[y:y + roi_height, x:x + roi_width]
+        if region.ndim == 3:
+            region = region[..., self.channel]
+        if self._gray is None or self._gray.shape != region.shape:
+            self._gray = np.empty(region.shape, np.float32)
+            work_shape = (region.shape[0] - 2, region.shape[1] - 2)
+            self._work = (np.empty(work_shape, np.float32), np.empty(work_shape, np.float32))
+        np.copyto(self._gray, region, casting="unsafe")
+
+        self.last = {
+            "laplacian": laplacian_variance(self._gray, self._work[0]),
+            "tenengrad": tenengrad(self._gray, self._work),
+            "normalized_variance": normalized_variance(self._gray),
+        }
+        self.elapsed_us = (time.perf_counter() - start) * 1e6
+        return self.last
+
+    def status_text(self):
+        if self.last is None:
+            return ""
+        return "Focus: Laplacian {:.1f}, Tenengrad {:.0f}, NormVar {:.2f} ({:.1f} ms)".format(
+            self.last["laplacian"], self.last["tenengrad"], self.last["normalized_variance"],
+            self.elapsed_us / 1000)
+
+
+class LinearStage:
+    """
+    Stand-in for a Z stage that moves a constant step per frame during a
+    sweep. Replace with a callable that reads the real stage position.
+    """
+
+    def __init__(self, start: float = 0.0, step: float = 1.0):
+        self.start = start
+        self.step = step
+
+    def __call__(self, frame_index: int) -> float:
+        return self.start + self.step * frame_index
+
+
+class FocusSweep:
+    """
+    Records focus scores against the stage position while the focus is
+    moved through the sample, then picks the sharpest frame
+    """
+
+    def __init__(self, position=None):
+        """
+        :param position: callable(frame_index) -> stage position,
+                         None to use the frame index itself
+        """
+        self.position = position
+        self.samples = []
+
+    def add(self, frame_index: int, scores: dict):
+        position = self.position(frame_index) if self.position is not None else frame_index
+        self.samples.append((frame_index, position, dict(scores)))
+
+    def curve(self, metric: str = "laplacian"):
+        """
+        :return: (positions, scores) arrays of `metric`
+        """
+        positions = np.array([position for _, position, _ in self.samples], np.float64)
+        scores = np.array([scores[metric] for _, _, scores in self.samples], np.float64)
+        return positions, scores
+
+    def best(self, metric: str = "laplacian"):
+        """
+        :return: (frame index, position, score) of the sharpest frame, the
+                 position refined by a parabola through the peak and its neighbours
+        """
+        if not self.samples:
+            raise ValueError("The sweep has no samples")
+        positions, scores = self.curve(metric)
+        peak = int(np.argmax(scores))
+        position = positions[peak]
+        if 0 < peak < len(scores) - 1:
+            left, centre, right = scores[peak - 1:peak + 2]
+            denominator = left - 2 * centre + right
+            # Only for evenly spaced positions, e.g. a stage moving at constant speed
+            step = positions[peak + 1] - positions[peak]
+            if denominator < 0 and np.isclose(positions[peak] - positions[peak - 1], step):
+                position += 0.5 * (left - right) / denominator * step
+        return self.samples[peak][0], float(position), float(scores[peak])
+
+    def save(self, path: str):
+        """
+        Write the sweep as CSV: frame index, position and one column per metric
+        """
+        with open(path, "w") as file:
+            file.write("frame_index,position," + ",".join(METRICS) + "\n")
+            for frame_index, position, scores in self.samples:
+                file.write(f"{frame_index},{position}," + ",".join(
+                    f"{scores[metric]:.6g}" for metric in METRICS) + "\n")
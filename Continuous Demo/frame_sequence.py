@@ -0,0 +1,146 @@
+# \file    frame_sequence.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Detects dropped and duplicated frames from the FrameID and device
+#          timestamp of each buffer
+#
+# \version 1.0
+
+
+class SequenceTracker:
+    """
+    Tracks the FrameID/timestamp sequence of an acquisition run.
+
+    The first frame of a run gets sequence index 0, every following frame
+    advances the index by its FrameID step, so `missing_indices` lists
+    exactly the LED positions that have to be re-captured. FrameIDs wrap
+    around at `id_bits` bits; GigE Vision 16-bit block IDs skip 0 when
+    they wrap.
+
+    If the transport layer does not report FrameIDs (frame_id None), gaps
+    are estimated from the timestamps against the median frame interval
+    instead.
+    """
+
+    def __init__(self, gap_tolerance: float = 1.5, interval_history: int = 32, id_bits: int = 64):
+        """
+        :param gap_tolerance: a timestamp interval larger than this multiple of
+                              the median interval counts as a gap
+        :param interval_history: number of intervals used for the median
+        :param id_bits: FrameID width, 64 for USB3 Vision, 16 for GigE Vision block IDs
+        """
+        self.gap_tolerance = gap_tolerance
+        self.interval_history = interval_history
+        self.id_bits = id_bits
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.gaps = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.incomplete = 0
+        self.missing_indices = []
+        self._last_id = None
+        self._last_index = -1
+        self._last_timestamp = None
+        self._intervals = []
+
+    def _median_interval(self):
+        if not self._intervals:
+            return None
+        intervals = sorted(self._intervals)
+        return intervals[len(intervals) // 2]
+
+    def _id_step(self, frame_id: int) -> int:
+        """
+        :return: FrameID steps from the last frame, <= 0 for a repeated or older ID
+        """
+        modulus = 1 << self.id_bits
+        step = (frame_id - self._last_id) % modulus
+        if step > modulus // 2:
+            # Far more than half the ID range ahead is an older frame
+            return step - modulus
+        if self.id_bits == 16 and 0 < step and frame_id < self._last_id:
+            # Wrapped past the never used block ID 0
+            step -= 1
+        return step
+
+    def update(self, frame_id, timestamp_ns: int, incomplete: bool = False):
+        """
+        Register a received buffer
+
+        :param frame_id: buffer FrameID, None if the transport layer does not
+                         report one. 0 is a valid FrameID
+        :param timestamp_ns: device timestamp in nanoseconds, 0 if not supported
+        :param incomplete: True if the transport layer flagged the buffer incomplete
+        :return: per-frame metadata dict with the sequence information
+        """
+        self.frames += 1
+        if incomplete:
+            self.incomplete += 1
+
+        interval = None
+        if timestamp_ns and self._last_timestamp:
+            interval = timestamp_ns - self._last_timestamp
+
+        missing = 0
+        duplicate = False
+        if frame_id is not None and self._last_id is not None:
+            step = self._id_step(frame_id)
+            if step <= 0:
+                duplicate = True
+            missing = max(step - 1, 0)
+            index = self._last_index + step
+        elif frame_id is not None:
+            index = self._last_index + 1
+        else:
+            # No FrameID: estimate how many frames fit into the interval
+            median = self._median_interval()
+            if interval is not None and median and interval > self.gap_tolerance * median:
+                missing = max(round(interval / median) - 1, 1)
+            index = self._last_index + 1 + missing
+
+        if duplicate:
+            self.duplicates += 1
+        else:
+            if missing > 0:
+                self.gaps += 1
+                self.dropped += missing
+                self.missing_indices.extend(range(self._last_index + 1, index))
+            elif interval is not None and interval > 0:
+                # Only learn the frame interval from gap-free steps
+                self._intervals.append(interval)
+                if len(self._intervals) > self.interval_history:
+                    self._intervals.pop(0)
+            if frame_id is not None:
+                self._last_id = frame_id
+            self._last_index = index
+            if timestamp_ns:
+                self._last_timestamp = timestamp_ns
+
+        return {
+            "frame_id": frame_id,
+            "timestamp_ns": timestamp_ns,
+            "sequence_index": index,
+            "interval_ns": interval,
+            "missing_before": missing,
+            "duplicate": duplicate,
+            "incomplete": incomplete,
+        }
+
+    def counters(self):
+        return {
+            "frames": self.frames,
+            "gaps": self.gaps,
+            "dropped": self.dropped,
+            "duplicates": self.duplicates,
+            "incomplete": self.incomplete,
+        }
+
+    def run_ok(self):
+        """
+        :return: False if the run lost, repeated or truncated any frame
+        """
+        return self.dropped == 0 and self.duplicates == 0 and self.incomplete == 0
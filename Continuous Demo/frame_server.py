@@ -0,0 +1,361 @@
+# \file    frame_server.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Optional streaming server that pushes acquired frames and their
+#          metadata to remote consumers over TCP or a Unix socket
+#
+# \version 1.0
+#
+# Wire format, one message per frame:
+#   4 bytes  magic b"FPMF"
+#   4 bytes  header length (big endian)
+#   8 bytes  payload length (big endian)
+#   header   UTF-8 JSON (frame metadata plus "compression" and "raw_size")
+#   payload  frame bytes, compressed if "compression" is not null
+#
+# Run this file directly for a loopback self-test.
+
+import collections
+import json
+import os
+import socket
+import stat
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+MAGIC = b"FPMF"
+HEADER = struct.Struct("!4sIQ")
+DEFAULT_QUEUE_SIZE = 4
+
+
+def parse_address(address: str):
+    """
+    Parse "host:port" into a TCP address tuple or "unix:/path" into a socket path
+
+    :param address: address string as given on the command line or environment
+    :return: (family, address) usable with socket.bind/connect
+    """
+    if address.startswith("unix:"):
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix sockets are not supported on this platform")
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"Invalid stream address: `{address}`")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _compress(data, compression):
+    if compression is None:
+        return bytes(data)
+    if compression == "zlib":
+        return zlib.compress(data, 1)
+    if compression == "lz4":
+        return lz4_frame.compress(data)
+    raise ValueError(f"Unknown compression: `{compression}`")
+
+
+def _decompress(data, compression):
+    if compression is None:
+        return data
+    if compression == "zlib":
+        return zlib.decompress(data)
+    if compression == "lz4":
+        if lz4_frame is None:
+            raise ValueError("Received lz4 frame, but lz4 is not installed")
+        return lz4_frame.decompress(data)
+    raise ValueError(f"Unknown compression: `{compression}`")
+
+
+def _json_default(value):
+    """
+    Metadata values json cannot encode itself: numpy scalars and arrays
+    """
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Metadata value of type {type(value).__name__} is not JSON serializable")
+
+
+def _recv_exact(sock, size):
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:], size - received)
+        if count == 0:
+            raise ConnectionError("Connection closed by server")
+        received += count
+    return bytes(data)
+
+
+class _Message:
+    """
+    A published frame. The payload is encoded at most once, by whichever
+    client sender gets to it first, so compression never runs on the
+    camera thread and is never repeated per client.
+    """
+
+    def __init__(self, payload: bytes, metadata: dict, compression):
+        self._payload = payload
+        self._metadata = metadata
+        self._compression = compression
+        self._encoded = None
+        self._lock = threading.Lock()
+
+    def encode(self):
+        """
+        :return: (header, body) of the wire format
+        :raises ValueError: if the frame cannot be encoded, for every client
+        """
+        with self._lock:
+            if self._encoded is None:
+                try:
+                    body = _compress(self._payload, self._compression)
+                    header = dict(self._metadata)
+                    header["compression"] = self._compression
+                    header["raw_size"] = len(self._payload)
+                    header = json.dumps(header, default=_json_default).encode("utf-8")
+                    self._encoded = (HEADER.pack(MAGIC, len(header), len(body)) + header, body)
+                except Exception as e:
+                    # Remembered, the other clients do not try again
+                    self._encoded = f"{type(e).__name__}: {str(e)}"
+                self._payload = None
+            if isinstance(self._encoded, str):
+                raise ValueError(f"Cannot encode frame: {self._encoded}")
+            return self._encoded
+
+
+class _ClientConnection:
+    def __init__(self, sock, address, queue_size: int):
+        self.address = address
+        self.sent = 0
+        self.dropped = 0
+        self._sock = sock
+        self._queue = collections.deque(maxlen=queue_size)
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def alive(self):
+        return not self._closed
+
+    def push(self, message: _Message):
+        with self._condition:
+            if len(self._queue) == self._queue.maxlen:
+                # Slow client: the deque discards the oldest frame on append
+                self.dropped += 1
+            self._queue.append(message)
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                message = self._queue.popleft()
+            try:
+                header, body = message.encode()
+            except ValueError as e:
+                # Only this frame is lost, the connection stays usable
+                self.dropped += 1
+                print(f"Frame not streamed to {self.address}: {str(e)}")
+                continue
+            try:
+                self._sock.sendall(header)
+                self._sock.sendall(body)
+                self.sent += 1
+            except OSError:
+                self.close()
+                return
+
+
+def _remove_stale_socket(path: str):
+    """
+    Remove a socket file left over at `path`. Any other file is left alone,
+    bind() then fails instead of deleting it
+    """
+    try:
+        if stat.S_ISSOCK(os.lstat(path).st_mode):
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class FrameServer:
+    """
+    Pushes frames to every connected client. Each client has its own bounded
+    queue; when a client falls behind, its oldest queued frame is dropped so
+    acquisition is never blocked by the network.
+    """
+
+    def __init__(self, address: str, compression: str = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE):
+        """
+        :param address: "host:port" for TCP or "unix:/path" for a Unix socket
+        :param compression: None, "zlib" or "lz4"
+        :param queue_size: frames buffered per client before dropping the oldest
+        """
+        if compression == "lz4" and lz4_frame is None:
+            raise ValueError("lz4 compression requested, but lz4 is not installed")
+        _compress(b"", compression)
+
+        self.compression = compression
+        self.queue_size = queue_size
+        self.published = 0
+        self._family, self._address = parse_address(address)
+        self._clients = []
+        self._lock = threading.Lock()
+
+        if self._family != socket.AF_INET:
+            _remove_stale_socket(self._address)
+        self._socket = socket.socket(self._family, socket.SOCK_STREAM)
+        if self._family == socket.AF_INET:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind(self._address)
+        self._socket.listen()
+        self._running = True
+        self._accept_thread = threading.Thread(target=self._accept, daemon=True)
+        self._accept_thread.start()
+
+    @property
+    def address(self):
+        """
+        Address the server is bound to, with the real port if port 0 was requested
+        """
+        if self._family == socket.AF_INET:
+            host, port = self._socket.getsockname()[:2]
+            return f"{host}:{port}"
+        return "unix:" + self._address
+
+    def _accept(self):
+        while self._running:
+            try:
+                sock, address = self._socket.accept()
+            except OSError:
+                return
+            if self._family == socket.AF_INET:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._clients.append(
+                    _ClientConnection(sock, address, self.queue_size))
+
+    def publish(self, payload, metadata: dict = None):
+        """
+        Queue a frame for all connected clients. The payload is copied, so the
+        caller may re-use the underlying buffer as soon as this returns.
+
+        :param payload: bytes-like frame data (bytes, memoryview, numpy array)
+        :param metadata: JSON serializable per-frame metadata
+        """
+        with self._lock:
+            self._clients = [client for client in self._clients if client.alive]
+            if not self._clients:
+                return
+            clients = list(self._clients)
+        message = _Message(bytes(memoryview(payload).cast("B")), metadata or {},
+                           self.compression)
+        for client in clients:
+            client.push(message)
+        self.published += 1
+
+    def statistics(self):
+        with self._lock:
+            return {
+                "published": self.published,
+                "clients": [{"address": str(client.address),
+                             "sent": client.sent,
+                             "dropped": client.dropped}
+                            for client in self._clients if client.alive],
+            }
+
+    def close(self):
+        self._running = False
+        try:
+            self._socket.close()
+        except OSError:
+            pass
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+        if self._family != socket.AF_INET:
+            _remove_stale_socket(self._address)
+
+
+class FrameClient:
+    """
+    Minimal consumer for a FrameServer, used by the reconstruction machine
+    and for loopback testing
+    """
+
+    def __init__(self, address: str, timeout: float = None):
+        family, address = parse_address(address)
+        self._socket = socket.socket(family, socket.SOCK_STREAM)
+        self._socket.settimeout(timeout)
+        self._socket.connect(address)
+
+    def receive(self):
+        """
+        Block until the next frame arrives
+
+        :return: (payload bytes, metadata dict)
+        """
+        magic, header_size, body_size = HEADER.unpack(
+            _recv_exact(self._socket, HEADER.size))
+        if magic != MAGIC:
+            raise ConnectionError("Invalid frame header")
+        metadata = json.loads(_recv_exact(self._socket, header_size))
+        payload = _decompress(_recv_exact(self._socket, body_size),
+                              metadata.pop("compression"))
+        if len(payload) != metadata.pop("raw_size"):
+            raise ConnectionError("Frame size mismatch")
+        return payload, metadata
+
+    def close(self):
+        self._socket.close()
+
+
+if __name__ == "__main__":
+    # Loopback self-test: a slow client must see drops, never block publish
+    server = FrameServer("127.0.0.1:0", compression="zlib", queue_size=2)
+    client = FrameClient(server.address, timeout=5)
+    while not server.statistics()["clients"]:
+        time.sleep(0.01)
+
+    frame = bytes(range(256)) * 4096
+    for index in range(50):
+        server.publish(frame, {"frame_index": index})
+    received = []
+    while True:
+        payload, metadata = client.receive()
+        assert payload == frame
+        received.append(metadata["frame_index"])
+        if metadata["frame_index"] == 49:
+            break
+    print("Received frames:", received)
+    print("Server statistics:", server.statistics())
+    client.close()
+    server.close()
@@ -19,16 +19,21 @@
 #
 # General permission to copy or modify is hereby granted.
 
+import os
 import sys
+import threading
+import time
 
 try:
     # For Python 3.11 or later pyside6 terminal below(pip install PySide6)
-    from PySide6.QtWidgets import QHBoxLayout, QVBoxLayout, QLabel, QMainWindow, QMessageBox, QWidget
+    from PySide6.QtWidgets import QHBoxLayout, QVBoxLayout, QLabel, QMainWindow, QMessageBox, QWidget, QPushButton, \
+        QComboBox
     from PySide6.QtGui import QImage
     from PySide6.QtCore import Qt, Slot, QTimer
 except ImportError:
     # For Python 3.10 or earlier pyside2 terminal below(pip install PySide2)
-    from PySide2.QtWidgets import QHBoxLayout, QVBoxLayout, QLabel, QMainWindow, QMessageBox, QWidget
+    from PySide2.QtWidgets import QHBoxLayout, QVBoxLayout, QLabel, QMainWindow, QMessageBox, QWidget, QPushButton, \
+        QComboBox
     from PySide2.QtGui import QImage
     from PySide2.QtCore import Qt, Slot, QTimer
 
@@ -40,10 +45,35 @@ from ids_peak_ipl import ids_peak_ipl # terminal below(pip install ids_peak_ipl)
 from ids_peak import ids_peak_ipl_extension # terminal below(pip install ids_peak_afl)
 
 from display import Display
+from focus import FocusStage, FocusSweep, parse_roi
+from frame_server import FrameServer
+from frame_sequence import SequenceTracker
+from memory_budget import MemoryBudget
+from recorder import FrameRecorder
+from ring_buffer import FrameRingBuffer
+from wait_policy import AdaptiveTimeout
 
 VERSION = "1.4.0"
 FPS_LIMIT = 30 # TODO:Is this a variable which can be altered, I assume so. Look into this
+# The status bar counters are refreshed at this interval, frames are acquired on their own thread
+COUNTER_INTERVAL_MS = 200
 TARGET_PIXEL_FORMAT = ids_peak_ipl.PixelFormatName_BGRa8
+# Stream frames to a remote machine, e.g. FPM_STREAM_ADDRESS=0.0.0.0:5555 or unix:/tmp/fpm.sock
+STREAM_ADDRESS = os.environ.get("FPM_STREAM_ADDRESS")
+STREAM_COMPRESSION = os.environ.get("FPM_STREAM_COMPRESSION")  # None, "zlib" or "lz4"
+# Directory the record toggle writes to
+RECORD_DIRECTORY = os.environ.get("FPM_RECORD_DIRECTORY", os.path.join(os.getcwd(), "recordings"))
+# Pre-trigger ring buffer: keep the last RING_SECONDS of raw frames (capped at RING_MAX_MB) and
+# write them plus the next SNAPSHOT_POST_FRAMES frames when "Save snapshot" is clicked
+RING_SECONDS = float(os.environ.get("FPM_RING_SECONDS", 5))
+RING_MAX_MB = int(os.environ.get("FPM_RING_MAX_MB", 1024))
+SNAPSHOT_POST_FRAMES = int(os.environ.get("FPM_SNAPSHOT_POST_FRAMES", 30))
+# Global cap of the frames held in RAM by the ring buffer and the recording queues
+MEMORY_CAP_MB = int(os.environ.get("FPM_MEMORY_CAP_MB", 2048))
+# Focus metrics ROI "x,y,width,height" in preview pixels, default is a square in the centre
+FOCUS_ROI = os.environ.get("FPM_FOCUS_ROI")
+# Focus sweeps are written here as CSV
+SWEEP_DIRECTORY = os.environ.get("FPM_SWEEP_DIRECTORY", os.path.join(os.getcwd(), "focus_sweeps"))
 
 
 # Opens the Window for Camera viewing
@@ -61,17 +91,53 @@ class MainWindow(QMainWindow):
         self.__datastream = None
 
         self.__display = None
-        self.__acquisition_timer = QTimer()
+        self.__counter_timer = QTimer()
+        # Frames are waited for, recorded and converted on this thread, so the
+        # recorder keeps camera rate however busy the GUI thread is
+        self.__acquisition_thread = None
+        self.__acquisition_stop = threading.Event()
         self.__frame_counter = 0
         self.__error_counter = 0
         self.__acquisition_running = False
+        # FrameID/timestamp bookkeeping, sequence_index == LED position
+        self.__sequence = SequenceTracker()
+        # Buffer wait timeout from exposure, frame rate and observed wait times
+        self.__wait_policy = AdaptiveTimeout()
 
         self.__label_infos = None
+        self.__label_recording = None
+        self.__label_fps = None
+        self.__button_record = None
+        self.__combo_record_mode = None
+        self.__recorder = None
+        self.__record_raw = True
+        self.__memory = MemoryBudget(MEMORY_CAP_MB * 1024 * 1024)
+        # The recording queue may take at most half of the cap, the ring adds its own stage
+        self.__memory.add_stage("recorder", "drop", high=MEMORY_CAP_MB * 1024 * 1024 // 2)
+        self.__ring_buffer = FrameRingBuffer(max_seconds=RING_SECONDS, max_bytes=RING_MAX_MB * 1024 * 1024,
+                                             budget=self.__memory)
+        self.__button_snapshot = None
+        self.__label_focus = None
+        self.__button_sweep = None
+        self.__focus = FocusStage(parse_roi(FOCUS_ROI))
+        # Score vs frame index while a Z-sweep is running, see focus_sweep_position
+        self.__sweep = None
+        self.__sweep_frame = 0
+        # callable(frame index) -> stage position, None records the frame index
+        self.focus_sweep_position = None
         self.__label_version = None
         self.__label_aboutqt = None
 
         self.__image_converter = ids_peak_ipl.ImageConverter()
 
+        self.__frame_server = None
+        if STREAM_ADDRESS:
+            try:
+                self.__frame_server = FrameServer(STREAM_ADDRESS, STREAM_COMPRESSION)
+                print("Streaming frames on", self.__frame_server.address)
+            except (OSError, ValueError) as e:
+                QMessageBox.warning(self, "Warning", "Unable to start frame streaming: " + str(e))
+
         # initialize peak library
         ids_peak.Library.Initialize()
 
@@ -92,18 +158,32 @@ class MainWindow(QMainWindow):
         self.__create_statusbar()
 
         self.setMinimumSize(700, 500)
-        
+
+    @property
+    def sequence(self):
+        """
+        Dropped/duplicate frame counters and missing LED positions of the current run
+        """
+        return self.__sequence
+
     def __del__(self):
         self.__destroy_all()
 
     def __destroy_all(self):
         # Stop acquisition
         self.__stop_acquisition()
+        self.__stop_recording()
+        # Snapshots still being written are completed before the process exits
+        self.__ring_buffer.close()
 
         # Close device and peak library
         self.__close_device()
         ids_peak.Library.Close()
 
+        if self.__frame_server is not None:
+            self.__frame_server.close()
+            self.__frame_server = None
+
 # CODE FOR FINDING CONNECTED CAMERA
     def __open_device(self):
         try:
@@ -122,6 +202,11 @@ class MainWindow(QMainWindow):
             for device in device_manager.Devices():
                 if device.IsOpenable():
                     self.__device = device.OpenDevice(ids_peak.DeviceAccessType_Control)
+                    # GigE Vision block IDs are 16 bit and wrap much sooner than USB3 Vision frame IDs
+                    try:
+                        self.__sequence.id_bits = 16 if device.TLType() == "GEV" else 64
+                    except ids_peak.Exception:
+                        pass
                     print('Camera found')
                     break
 
@@ -241,6 +326,8 @@ class MainWindow(QMainWindow):
 
         # Get the maximum framerate possible, limit it to the configured FPS_LIMIT. If the limit can't be reached, set
         # acquisition interval to the maximum possible framerate
+        # Without the node the wait policy estimates the frame time from the limit
+        target_fps = FPS_LIMIT
         try:
             max_fps = self.__nodemap_remote_device.FindNode("AcquisitionFrameRate").Maximum()
             target_fps = min(max_fps, FPS_LIMIT)
@@ -251,10 +338,15 @@ class MainWindow(QMainWindow):
                                 "Unable to limit fps, since the AcquisitionFrameRate Node is"
                                 " not supported by the connected camera. Program will continue without limit.")
 
-        # Setup acquisition timer accordingly
-        self.__acquisition_timer.setInterval((1 / target_fps) * 1000) # (1/30)*1000 = 33.3ms Minimum exposure time
-        self.__acquisition_timer.setSingleShot(False)
-        self.__acquisition_timer.timeout.connect(self.on_acquisition_timer)
+        try:
+            self.__wait_policy.configure(self.__nodemap_remote_device.FindNode("ExposureTime").Value(), target_fps)
+        except ids_peak.Exception:
+            self.__wait_policy.configure(frame_rate_hz=target_fps)
+
+        # Setup the status bar refresh, the acquisition thread paces itself on the buffer waits
+        self.__counter_timer.setInterval(COUNTER_INTERVAL_MS)
+        self.__counter_timer.setSingleShot(False)
+        self.__counter_timer.timeout.connect(self.update_counters)
 
         try:
             # Lock critical features to prevent them from changing during acquisition
@@ -275,6 +367,7 @@ class MainWindow(QMainWindow):
                 image_width, image_height)
 
             # Start acquisition on camera
+            self.__sequence.reset()
             self.__datastream.StartAcquisition()
             self.__nodemap_remote_device.FindNode("AcquisitionStart").Execute()
             self.__nodemap_remote_device.FindNode("AcquisitionStart").WaitUntilDone()
@@ -282,28 +375,42 @@ class MainWindow(QMainWindow):
             print("Exception: " + str(e))
             return False
 
-        # Start acquisition timer
-        self.__acquisition_timer.start()
+        # Start the acquisition thread and the counter refresh
+        self.__acquisition_stop.clear()
+        self.__acquisition_thread = threading.Thread(target=self.__acquisition_loop, name="acquisition",
+                                                     daemon=True)
         self.__acquisition_running = True
+        self.__acquisition_thread.start()
+        self.__counter_timer.start()
 
         return True
 
     def __stop_acquisition(self):
         """
-        Stop acquisition timer and stop acquisition on camera
+        Stop the acquisition thread and stop acquisition on camera
         :return:
         """
         # Check that a device is opened and that the acquisition is running. If not, return.
         if self.__device is None or self.__acquisition_running is False:
             return
 
+        self.__counter_timer.stop()
+        # Wake the thread up from its buffer wait and wait until it is done with its frame
+        self.__acquisition_stop.set()
+        if self.__acquisition_thread is not None:
+            try:
+                self.__datastream.KillWait()
+            except ids_peak.Exception:
+                pass
+            self.__acquisition_thread.join()
+            self.__acquisition_thread = None
+
         # Otherwise try to stop acquisition
         try:
             remote_nodemap = self.__device.RemoteDevice().NodeMaps()[0]
             remote_nodemap.FindNode("AcquisitionStop").Execute()
 
             # Stop and flush datastream
-            self.__datastream.KillWait()
             self.__datastream.StopAcquisition(ids_peak.AcquisitionStopMode_Default)
             self.__datastream.Flush(ids_peak.DataStreamFlushMode_DiscardAll)
 
@@ -319,6 +426,21 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.information(self, "Exception", str(e), QMessageBox.Ok)
 
+    def __recover_datastream(self):
+        """
+        Flush the datastream and queue all buffers again after repeated timeouts.
+        Every buffer is re-queued right after processing, so none is in use here
+        """
+        print("Recovering datastream: flushing and re-queueing all buffers")
+        try:
+            self.__datastream.Flush(ids_peak.DataStreamFlushMode_DiscardAll)
+            for buffer in self.__datastream.AnnouncedBuffers():
+                self.__datastream.QueueBuffer(buffer)
+            self.__wait_policy.record_recovery(True)
+        except ids_peak.Exception as e:
+            print("Exception: Datastream recovery failed: " + str(e))
+            self.__wait_policy.record_recovery(False)
+
     def __create_statusbar(self):
         status_bar = QWidget(self.centralWidget())
         status_bar_layout = QHBoxLayout()
@@ -327,8 +449,44 @@ class MainWindow(QMainWindow):
         self.__label_infos = QLabel(status_bar)
         self.__label_infos.setAlignment(Qt.AlignLeft)
         status_bar_layout.addWidget(self.__label_infos)
+
+        self.__label_fps = QLabel(status_bar)
+        self.__label_fps.setAlignment(Qt.AlignLeft)
+        status_bar_layout.addWidget(self.__label_fps)
+        if self.__display is not None:
+            self.__display.frame_rates_changed.connect(self.on_frame_rates_changed)
+
+        self.__label_recording = QLabel(status_bar)
+        self.__label_recording.setAlignment(Qt.AlignLeft)
+        status_bar_layout.addWidget(self.__label_recording)
+
+        self.__label_focus = QLabel(status_bar)
+        self.__label_focus.setAlignment(Qt.AlignLeft)
+        status_bar_layout.addWidget(self.__label_focus)
         status_bar_layout.addStretch()
 
+        self.__button_sweep = QPushButton("Focus sweep", status_bar)
+        self.__button_sweep.setCheckable(True)
+        self.__button_sweep.setToolTip("Record focus scores while moving the focus, "
+                                       "stop to find the sharpest frame")
+        self.__button_sweep.toggled.connect(self.on_sweep_toggled)
+        status_bar_layout.addWidget(self.__button_sweep)
+
+        self.__combo_record_mode = QComboBox(status_bar)
+        self.__combo_record_mode.addItems(["Raw", "Converted"])
+        status_bar_layout.addWidget(self.__combo_record_mode)
+
+        self.__button_snapshot = QPushButton("Save snapshot", status_bar)
+        self.__button_snapshot.setToolTip("Write the last {:g} s plus the next {} frames to disk".format(
+            RING_SECONDS, SNAPSHOT_POST_FRAMES))
+        self.__button_snapshot.clicked.connect(self.on_snapshot_clicked)
+        status_bar_layout.addWidget(self.__button_snapshot)
+
+        self.__button_record = QPushButton("Record", status_bar)
+        self.__button_record.setCheckable(True)
+        self.__button_record.toggled.connect(self.on_record_toggled)
+        status_bar_layout.addWidget(self.__button_record)
+
         self.__label_version = QLabel(status_bar)
         self.__label_version.setText("simple_live_qtwidgets v" + VERSION)
         self.__label_version.setAlignment(Qt.AlignRight)
@@ -349,19 +507,68 @@ class MainWindow(QMainWindow):
         This function gets called when the frame and error counters have changed
         :return:
         """
-        self.__label_infos.setText("Acquired: " + str(self.__frame_counter) + ", Errors: " + str(self.__error_counter))
+        self.__label_infos.setText("Acquired: " + str(self.__frame_counter) + ", Errors: " + str(self.__error_counter)
+                                   + ", Dropped: " + str(self.__sequence.dropped)
+                                   + ", Duplicates: " + str(self.__sequence.duplicates)
+                                   + ", Timeouts: " + str(self.__wait_policy.timeouts)
+                                   + ", Recoveries: " + str(self.__wait_policy.recoveries))
+        if self.__recorder is not None and self.__recorder.error is not None:
+            error = self.__recorder.error
+            # Unchecking stops the recording
+            self.__button_record.setChecked(False)
+            QMessageBox.warning(self, "Warning", "Recording stopped: " + error)
+        elif self.__recorder is not None:
+            self.__label_recording.setText(self.__recorder.status_text())
+        else:
+            self.__label_recording.setText(self.__ring_buffer.status_text())
+        self.__label_recording.setToolTip(self.__memory.status_text())
+        self.__label_focus.setText(self.__focus.status_text())
 
-    @Slot()
-    def on_acquisition_timer(self):
+    def __acquisition_loop(self):
+        """
+        Body of the acquisition thread: wait for frames until the acquisition is stopped
+        """
+        while not self.__acquisition_stop.is_set():
+            try:
+                self.__acquire_frame()
+            except Exception as e:
+                # Keep acquiring, a frame that cannot be processed must not end the recording
+                self.__error_counter += 1
+                print("Exception (acquisition thread): " + str(e))
+
+    def __acquire_frame(self):
         """
-        This function gets called on every timeout of the acquisition timer
+        Wait for one frame and hand it to the ring buffer, recorder, streaming, focus and display
         """
         try:
-            # Get buffer from device's datastream
-            buffer = self.__datastream.WaitForFinishedBuffer(5000)
+            # Get buffer from device's datastream. The timeout follows exposure and frame rate,
+            # so a missed trigger is noticed after a few frame times
+            wait_start = time.perf_counter()
+            buffer = self.__datastream.WaitForFinishedBuffer(self.__wait_policy.timeout_ms())
+            self.__wait_policy.observe(time.perf_counter() - wait_start)
+            try:
+                frame_id = buffer.FrameID()
+            except ids_peak.Exception:
+                # The transport layer reports no FrameID, gaps are estimated from the timestamps
+                frame_id = None
+            metadata = self.__sequence.update(frame_id, buffer.Timestamp_ns(), buffer.IsIncomplete())
+            if metadata["missing_before"]:
+                print("Lost", metadata["missing_before"], "frame(s) before frame", metadata["sequence_index"])
 
             # Create IDS peak IPL image for debayering and convert it to RGBa8 format
             ipl_image = ids_peak_ipl_extension.BufferToImage(buffer)
+
+            # The raw image shares the buffer memory, so copy it before re-queueing.
+            # The copy is compact (raw sensor data) and is shared by the ring buffer and the recorder
+            raw_np_array = ipl_image.get_numpy_1D().copy()
+            raw_pixel_format = ipl_image.PixelFormat().Name()
+            self.__ring_buffer.push(raw_np_array, ipl_image.Width(), ipl_image.Height(),
+                                    raw_pixel_format, metadata)
+            # The GUI thread may start or stop the recording at any time
+            recorder = self.__recorder
+            if recorder is not None and self.__record_raw:
+                recorder.put(raw_np_array, ipl_image.Width(), ipl_image.Height(),
+                                    raw_pixel_format, metadata)
             # NOTE: Use `ImageConverter`, since the `ConvertTo` function re-allocates
             #       the converison buffers on every call
             converted_ipl_image = self.__image_converter.Convert(
@@ -372,6 +579,27 @@ class MainWindow(QMainWindow):
 
             # Get raw image data from converted image and construct a QImage from it
             image_np_array = converted_ipl_image.get_numpy_1D()
+
+            if self.__frame_server is not None:
+                self.__frame_server.publish(image_np_array, dict(
+                    metadata,
+                    frame_index=self.__frame_counter,
+                    width=converted_ipl_image.Width(),
+                    height=converted_ipl_image.Height(),
+                    pixel_format=converted_ipl_image.PixelFormat().Name()))
+
+            if recorder is not None and not self.__record_raw:
+                recorder.put(image_np_array.copy(),
+                                    converted_ipl_image.Width(), converted_ipl_image.Height(),
+                                    converted_ipl_image.PixelFormat().Name(), metadata)
+            # Focus metrics on the ROI of the preview frame
+            scores = self.__focus.process(image_np_array.reshape(
+                converted_ipl_image.Height(), converted_ipl_image.Width(), 4))
+            sweep = self.__sweep
+            if sweep is not None:
+                sweep.add(self.__sweep_frame, scores)
+                self.__sweep_frame += 1
+
             image = QImage(image_np_array,
                            converted_ipl_image.Width(), converted_ipl_image.Height(),
                            QImage.Format_RGB32)
@@ -379,18 +607,90 @@ class MainWindow(QMainWindow):
             # Make an extra copy of the QImage to make sure that memory is copied and can't get overwritten later on
             image_cpy = image.copy()
 
-            # Emit signal that the image is ready to be displayed
+            # Hand the image to the display, it is painted on the next screen refresh.
+            # Frames arriving faster than the refresh rate replace the unpainted one
             self.__display.on_image_received(image_cpy)
-            self.__display.update()
 
             # Increase frame counter
             self.__frame_counter += 1
+        except ids_peak.TimeoutException:
+            # No frame, e.g. no trigger on Line3. The loop simply waits again
+            if self.__wait_policy.on_timeout():
+                self.__recover_datastream()
+        except ids_peak.AbortedException:
+            # KillWait from __stop_acquisition
+            pass
         except ids_peak.Exception as e:
             self.__error_counter += 1
             print("Exception: " + str(e))
 
-        # Update counters
-        self.update_counters()
+    def __start_recording(self):
+        try:
+            # Raw frames are shared with the ring buffer and then count in both stages,
+            # the budget errs on the safe side
+            self.__recorder = FrameRecorder(RECORD_DIRECTORY, budget=self.__memory)
+        except OSError as e:
+            QMessageBox.warning(self, "Warning", "Unable to start recording: " + str(e))
+            return False
+        self.__record_raw = self.__combo_record_mode.currentText() == "Raw"
+        self.__combo_record_mode.setEnabled(False)
+        print("Recording to", self.__recorder.data_path)
+        return True
+
+    def __stop_recording(self):
+        if self.__recorder is None:
+            return
+        recorder = self.__recorder
+        self.__recorder = None
+        # Flushes the remaining backlog to disk
+        recorder.stop()
+        self.__combo_record_mode.setEnabled(True)
+        self.__label_recording.setText("Recorded {} frames ({} dropped) to {}".format(
+            recorder.frames_written, recorder.dropped, recorder.data_path))
+
+    @Slot(float, float)
+    def on_frame_rates_changed(self, displayed_fps, acquired_fps):
+        self.__label_fps.setText("Displayed: {:.1f} fps / Acquired: {:.1f} fps".format(displayed_fps, acquired_fps))
+
+    @Slot()
+    def on_snapshot_clicked(self):
+        try:
+            recorder = self.__ring_buffer.snapshot(RECORD_DIRECTORY, SNAPSHOT_POST_FRAMES)
+        except OSError as e:
+            QMessageBox.warning(self, "Warning", "Unable to save snapshot: " + str(e))
+            return
+        self.__label_recording.setText("Saving snapshot to " + recorder.data_path)
+
+    @Slot(bool)
+    def on_sweep_toggled(self, checked):
+        if checked:
+            self.__sweep = FocusSweep(self.focus_sweep_position)
+            self.__sweep_frame = 0
+            return
+        sweep = self.__sweep
+        self.__sweep = None
+        if sweep is None or not sweep.samples:
+            return
+        frame_index, position, score = sweep.best("laplacian")
+        try:
+            os.makedirs(SWEEP_DIRECTORY, exist_ok=True)
+            path = os.path.join(SWEEP_DIRECTORY, "sweep_{}.csv".format(time.strftime("%Y%m%d_%H%M%S")))
+            sweep.save(path)
+        except OSError as e:
+            QMessageBox.warning(self, "Warning", "Unable to save focus sweep: " + str(e))
+            path = None
+        message = "Best focus: frame {} of {} (position {:.2f}, score {:.1f})".format(
+            frame_index, len(sweep.samples), position, score)
+        print(message + ("" if path is None else ", sweep saved to " + path))
+        QMessageBox.information(self, "Focus sweep", message, QMessageBox.Ok)
+
+    @Slot(bool)
+    def on_record_toggled(self, checked):
+        if checked:
+            if not self.__start_recording():
+                self.__button_record.setChecked(False)
+        else:
+            self.__stop_recording()
 
     @Slot(str)
     def on_aboutqt_link_activated(self, link):
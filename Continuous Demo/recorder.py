@@ -0,0 +1,203 @@
+# \file    recorder.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Background writer that streams every acquired frame to disk at
+#          camera rate, independent of the preview
+#
+# \version 1.0
+#
+# A recording is one append-only data file plus a JSON-lines index:
+#   <name>.raw    frame payloads back to back
+#   <name>.jsonl  one line per frame: offset, size, width, height,
+#                 pixel_format and the per-frame metadata
+# Sequential appends into a single file keep up with the camera far better
+# than one image file per frame.
+
+import collections
+import json
+import os
+import queue
+import threading
+import time
+
+
+DEFAULT_BACKLOG = 256
+RATE_WINDOW = 2.0
+# Stage of the queued frames in a memory_budget.MemoryBudget
+BUDGET_STAGE = "recorder"
+
+
+class FrameRecorder:
+    def __init__(self, directory: str, name: str = None, max_backlog: int = DEFAULT_BACKLOG,
+                 budget=None, stage: str = BUDGET_STAGE):
+        """
+        :param directory: directory the recording is written to, created if needed
+        :param name: base file name, defaults to recording_<date>_<time>
+        :param max_backlog: frames queued for the writer before new frames are dropped
+        :param budget: memory_budget.MemoryBudget with a `stage` stage, queued
+                       frames are reserved against it and dropped when over budget
+        :param stage: budget stage of the queued frames
+        """
+        os.makedirs(directory, exist_ok=True)
+        if name is None:
+            name = time.strftime("recording_%Y%m%d_%H%M%S")
+        self.data_path = os.path.join(directory, name + ".raw")
+        self.index_path = os.path.join(directory, name + ".jsonl")
+
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self.budget = budget
+        self.stage = stage
+        # Set by the writer on the first write error, the recording ends there
+        self.error = None
+
+        # Opened here, so a bad directory fails the start of the recording
+        self._data_file = open(self.data_path, "ab")
+        try:
+            self._index_file = open(self.index_path, "a", encoding="utf-8")
+        except OSError:
+            self._data_file.close()
+            raise
+        self._queue = queue.Queue(max_backlog)
+        self._history = collections.deque()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    def put(self, data, width: int, height: int, pixel_format: str, metadata: dict = None):
+        """
+        Queue a frame for writing. Never blocks the acquisition; if the writer
+        falls behind by more than `max_backlog` frames the frame is dropped
+        and counted.
+
+        :param data: frame bytes, must not be modified after the call (pass a copy)
+        :return: False if the frame was dropped or the writer failed
+        """
+        if self.error is not None:
+            self.dropped += 1
+            return False
+        reservation = None
+        if self.budget is not None:
+            reservation = self.budget.reserve(self.stage, data.nbytes)
+            if reservation is None:
+                self.dropped += 1
+                return False
+        try:
+            self._queue.put_nowait((data, width, height, pixel_format, metadata, reservation))
+            return True
+        except queue.Full:
+            if reservation is not None:
+                reservation.release()
+            self.dropped += 1
+            return False
+
+    def write_rate(self):
+        """
+        :return: (frames per second, bytes per second) over the last RATE_WINDOW seconds
+        """
+        now = time.monotonic()
+        with self._lock:
+            while self._history and now - self._history[0][0] > RATE_WINDOW:
+                self._history.popleft()
+            if len(self._history) < 2:
+                return 0.0, 0.0
+            duration = now - self._history[0][0]
+            frames = len(self._history)
+            size = sum(entry[1] for entry in self._history)
+        return frames / duration, size / duration
+
+    def status_text(self):
+        fps, bps = self.write_rate()
+        text = "Recording: {:.1f} fps, {:.1f} MB/s, backlog {}".format(fps, bps / 1e6, self.backlog)
+        if self.dropped:
+            text += ", dropped " + str(self.dropped)
+        if self.error is not None:
+            text += ", error: " + self.error
+        return text
+
+    def _run(self):
+        data_file, index_file = self._data_file, self._index_file
+        offset = data_file.tell()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                data, width, height, pixel_format, metadata, reservation = item
+                if self.error is not None:
+                    # Keep draining, so put() and stop() never block on a dead writer
+                    self.dropped += 1
+                    if reservation is not None:
+                        reservation.release()
+                    continue
+                try:
+                    data_file.write(data)
+                    size = data_file.tell() - offset
+                    index_file.write(json.dumps({
+                        "index": self.frames_written,
+                        "offset": offset,
+                        "size": size,
+                        "width": width,
+                        "height": height,
+                        "pixel_format": pixel_format,
+                        "metadata": metadata or {},
+                    }) + "\n")
+                except (OSError, ValueError, TypeError) as e:
+                    self.error = str(e)
+                    self.dropped += 1
+                    print("Recording stopped after", self.frames_written, "frames:", self.error)
+                    # Cut a partially written frame, the index only refers to complete ones
+                    try:
+                        data_file.truncate(offset)
+                    except (OSError, ValueError):
+                        pass
+                    continue
+                finally:
+                    if reservation is not None:
+                        reservation.release()
+                offset += size
+                self.frames_written += 1
+                self.bytes_written += size
+                with self._lock:
+                    self._history.append((time.monotonic(), size))
+        finally:
+            for file in (data_file, index_file):
+                try:
+                    file.close()
+                except OSError as e:
+                    if self.error is None:
+                        self.error = str(e)
+
+    def stop(self, timeout: float = None):
+        """
+        Write all queued frames and close the recording
+
+        :param timeout: seconds to wait for the backlog, None waits until it is written
+        :return: True if the recording was closed, False if the writer is still busy
+        """
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return False
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+
+def read_recording(index_path: str):
+    """
+    Iterate over a recording written by FrameRecorder
+
+    :return: generator of (bytes, index entry) per frame
+    """
+    data_path = os.path.splitext(index_path)[0] + ".raw"
+    with open(index_path, "r", encoding="utf-8") as index_file, open(data_path, "rb") as data_file:
+        for line in index_file:
+            entry = json.loads(line)
+            data_file.seek(entry["offset"])
+            yield data_file.read(entry["size"]), entry
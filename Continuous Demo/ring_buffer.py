@@ -0,0 +1,204 @@
+# \file    ring_buffer.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   RAM ring buffer of the most recent raw frames ("capture the last
+#          N seconds") with asynchronous snapshots to disk
+#
+# \version 1.0
+
+import collections
+import os
+import threading
+import time
+
+from recorder import FrameRecorder
+
+
+DEFAULT_MAX_BYTES = 1 << 30
+# Stage of the frames held by the ring in a memory_budget.MemoryBudget
+BUDGET_STAGE = "ring"
+# Stage of the frames queued for snapshot writers
+SNAPSHOT_STAGE = "snapshot"
+
+
+class _Snapshot:
+    def __init__(self, recorder: FrameRecorder, post_frames: int):
+        self.recorder = recorder
+        self.remaining = post_frames
+
+
+class FrameRingBuffer:
+    """
+    Keeps the last frames in their compact raw form. The oldest frames are
+    evicted as soon as any of the limits (frame count, age, total bytes)
+    is exceeded.
+
+    A snapshot hands the frames currently in the ring plus the next
+    `post_frames` frames to a FrameRecorder, so writing happens on the
+    recorder thread and never interrupts acquisition.
+
+    With a memory budget every frame in the ring is reserved against the
+    "ring" stage. When the global cap is reached the oldest frames are
+    evicted early, and a frame is not kept at all if even an empty ring
+    does not fit. Snapshot writers reserve the frames they queue against
+    the "snapshot" stage, as the ring may evict a frame before it is
+    written; a snapshot frame that does not fit is dropped and counted by
+    its recorder, acquisition never waits for a snapshot.
+    """
+
+    def __init__(self, max_frames: int = None, max_seconds: float = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES, budget=None):
+        """
+        :param max_frames: keep at most this many frames, None for no limit
+        :param max_seconds: keep frames for at most this many seconds, None for no limit
+        :param max_bytes: memory cap for the frames held by the ring
+        :param budget: memory_budget.MemoryBudget the ring's frames are reserved against
+        """
+        if max_frames is None and max_seconds is None and max_bytes is None:
+            raise ValueError("The ring buffer needs at least one limit")
+        self.max_frames = max_frames
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.budget = budget
+        if budget is not None:
+            # The ring evicts down to its cap itself, so the stage is never throttled
+            budget.add_stage(BUDGET_STAGE, "drop", high=max_bytes)
+            budget.add_stage(SNAPSHOT_STAGE, "drop")
+        self.bytes = 0
+        self.refused = 0
+        self.snapshots_written = 0
+        self._snapshot_count = 0
+        self._frames = collections.deque()
+        self._snapshots = []
+        # Threads closing finished snapshots, joined by close()
+        self._writers = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def _drop_oldest(self):
+        item = self._frames.popleft()
+        self.bytes -= item[1].nbytes
+        if item[6] is not None:
+            item[6].release()
+
+    def _evict(self, now, incoming: int = 0):
+        """
+        Evict until the ring plus `incoming` new bytes are within the limits
+        """
+        while self._frames and (
+                (self.max_frames is not None and len(self._frames) + (incoming > 0) > self.max_frames)
+                or (self.max_bytes is not None and self.bytes + incoming > self.max_bytes)
+                or (self.max_seconds is not None and now - self._frames[0][0] > self.max_seconds)):
+            self._drop_oldest()
+
+    def _reserve(self, nbytes: int):
+        """
+        :return: (reserved, reservation), reserved is False if the frame does not fit the budget
+        """
+        if self.budget is None:
+            return True, None
+        reservation = self.budget.reserve(BUDGET_STAGE, nbytes)
+        while reservation is None and self._frames:
+            # Other stages use up the global cap, give memory back oldest first
+            self._drop_oldest()
+            reservation = self.budget.reserve(BUDGET_STAGE, nbytes)
+        return reservation is not None, reservation
+
+    def push(self, data, width: int, height: int, pixel_format: str, metadata: dict = None):
+        """
+        Add a frame. `data` must be a private copy (e.g. numpy array copied
+        from the buffer before it is re-queued) and is never modified later.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now, data.nbytes)
+            reserved, reservation = self._reserve(data.nbytes)
+            item = (now, data, width, height, pixel_format, metadata, reservation)
+            if reserved:
+                self._frames.append(item)
+                self.bytes += data.nbytes
+            else:
+                self.refused += 1
+            finished = []
+            for snapshot in self._snapshots:
+                snapshot.recorder.put(*item[1:6])
+                snapshot.remaining -= 1
+                if snapshot.remaining <= 0:
+                    finished.append(snapshot)
+            for snapshot in finished:
+                self._snapshots.remove(snapshot)
+        for snapshot in finished:
+            self._finish(snapshot)
+
+    def snapshot(self, directory: str, post_frames: int = 0):
+        """
+        Flush the ring plus the next `post_frames` frames to disk asynchronously
+
+        :return: the FrameRecorder writing the snapshot, for progress reporting
+        """
+        with self._lock:
+            frames = list(self._frames)
+            self._snapshot_count += 1
+            recorder = FrameRecorder(
+                directory, time.strftime("snapshot_%Y%m%d_%H%M%S_") + str(self._snapshot_count),
+                max_backlog=len(frames) + post_frames + 1, budget=self.budget, stage=SNAPSHOT_STAGE)
+            for item in frames:
+                recorder.put(*item[1:6])
+            snapshot = _Snapshot(recorder, post_frames)
+            if post_frames > 0:
+                self._snapshots.append(snapshot)
+        if post_frames <= 0:
+            self._finish(snapshot)
+        print("Snapshot of", len(frames), "+", post_frames, "frames to",
+              os.path.basename(recorder.data_path))
+        return recorder
+
+    def _finish(self, snapshot: _Snapshot):
+        def stop():
+            snapshot.recorder.stop()
+            self.snapshots_written += 1
+        writer = threading.Thread(target=stop, name="snapshot-writer", daemon=True)
+        with self._lock:
+            self._writers = [thread for thread in self._writers if thread.is_alive()]
+            self._writers.append(writer)
+        writer.start()
+
+    def close(self, timeout: float = None):
+        """
+        End snapshots still waiting for frames, wait until every snapshot is
+        written and release the ring's frames
+
+        :param timeout: seconds to wait for each snapshot writer, None waits until it is done
+        :return: True if all snapshots were written
+        """
+        with self._lock:
+            pending = self._snapshots
+            self._snapshots = []
+        for snapshot in pending:
+            self._finish(snapshot)
+        with self._lock:
+            writers = list(self._writers)
+        for writer in writers:
+            writer.join(timeout)
+        self.clear()
+        return not any(writer.is_alive() for writer in writers)
+
+    def clear(self):
+        with self._lock:
+            while self._frames:
+                self._drop_oldest()
+            self.bytes = 0
+
+    def status_text(self):
+        with self._lock:
+            if not self._frames:
+                return "Ring: empty"
+            seconds = time.monotonic() - self._frames[0][0]
+            text = "Ring: {} frames, {:.1f} s, {:.0f} MB".format(
+                len(self._frames), seconds, self.bytes / 1e6)
+            if self.refused:
+                text += ", over memory budget " + str(self.refused)
+            return text
@@ -0,0 +1,153 @@
+# \file    wait_policy.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Buffer wait timeouts derived from exposure time, frame rate and
+#          observed trigger-to-buffer latency, with a bounded retry and
+#          datastream recovery policy
+#
+# \version 1.0
+
+import collections
+import os
+
+
+# Readout estimate until the first frames have been observed
+DEFAULT_READOUT_S = 0.2
+# Timeout = FACTOR * expected frame time + SLACK
+FACTOR = 2.0
+SLACK_MS = 50
+MIN_TIMEOUT_MS = 100
+MAX_TIMEOUT_MS = 60000
+# Re-triggers per frame, and consecutive timeouts before the datastream is flushed
+MAX_RETRIES = int(os.environ.get("FPM_WAIT_RETRIES", 2))
+RECOVER_AFTER = int(os.environ.get("FPM_WAIT_RECOVER_AFTER", 2))
+
+
+class AdaptiveTimeout:
+    """
+    Timeout for the next WaitForFinishedBuffer. The expected time of a
+    frame is the larger of exposure + frame period and the 95th percentile
+    of the observed latencies, so a long exposure never times out
+    spuriously and a missed trigger is detected after a few frame times
+    instead of a fixed worst case.
+
+    Timeouts are counted per streak: the caller may retry (re-trigger) up
+    to `max_retries` times per frame, and after `recover_after` consecutive
+    timeouts the datastream should be flushed and its buffers re-queued.
+    Waits with a fixed timeout chosen by the caller are counted separately
+    and leave the streak and the latency estimate alone.
+    """
+
+    def __init__(self, max_retries: int = MAX_RETRIES, recover_after: int = RECOVER_AFTER,
+                 history: int = 64):
+        self.max_retries = max_retries
+        self.recover_after = recover_after
+        self.exposure_s = 0.0
+        self.frame_period_s = 0.0
+        self._latencies = collections.deque(maxlen=history)
+        self.waits = 0
+        self.timeouts = 0
+        self.consecutive_timeouts = 0
+        self.retries = 0
+        self.recoveries = 0
+        self.failed_recoveries = 0
+        self.stale_frames = 0
+        self.fixed_waits = 0
+        self.fixed_timeouts = 0
+
+    def configure(self, exposure_us: float = None, frame_rate_hz: float = None):
+        """
+        Update the expected frame time, e.g. after an exposure change
+        """
+        if exposure_us is not None:
+            exposure_s = exposure_us / 1e6
+            # Latencies observed at a very different exposure say nothing about the new one
+            if self.exposure_s and not 0.5 < exposure_s / self.exposure_s < 2:
+                self._latencies.clear()
+            self.exposure_s = exposure_s
+        if frame_rate_hz:
+            self.frame_period_s = 1.0 / frame_rate_hz
+
+    def latency_s(self) -> float:
+        """
+        :return: 95th percentile of the observed latencies, or the default
+                 readout on top of the exposure before any frame was seen
+        """
+        if not self._latencies:
+            return self.exposure_s + DEFAULT_READOUT_S
+        latencies = sorted(self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def timeout_ms(self) -> int:
+        expected_s = max(self.exposure_s + self.frame_period_s, self.latency_s())
+        timeout_ms = FACTOR * expected_s * 1000 + SLACK_MS
+        return int(min(max(timeout_ms, MIN_TIMEOUT_MS), MAX_TIMEOUT_MS))
+
+    def observe(self, latency_s: float = None, fixed: bool = False):
+        """
+        Register a received frame
+
+        :param latency_s: trigger (or wait start) to buffer time, None if unknown
+        :param fixed: the wait used a caller-chosen timeout
+        """
+        if fixed:
+            self.fixed_waits += 1
+            return
+        self.waits += 1
+        self.consecutive_timeouts = 0
+        if latency_s is not None:
+            self._latencies.append(latency_s)
+
+    def on_timeout(self, fixed: bool = False) -> bool:
+        """
+        Register a timed out wait
+
+        :param fixed: the wait used a caller-chosen timeout
+        :return: True if the datastream should be recovered now
+        """
+        if fixed:
+            self.fixed_waits += 1
+            self.fixed_timeouts += 1
+            return False
+        self.waits += 1
+        self.timeouts += 1
+        self.consecutive_timeouts += 1
+        # Once per streak, a stream without triggers does not need flushing over and over
+        return self.consecutive_timeouts == self.recover_after
+
+    def can_retry(self, attempt: int) -> bool:
+        """
+        :param attempt: retries already made for the current frame
+        """
+        return attempt < self.max_retries
+
+    def record_retry(self):
+        self.retries += 1
+
+    def record_stale(self):
+        self.stale_frames += 1
+
+    def record_recovery(self, success: bool):
+        if success:
+            self.recoveries += 1
+        else:
+            self.failed_recoveries += 1
+
+    def counters(self):
+        return {
+            "timeout_ms": self.timeout_ms(),
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "recoveries": self.recoveries,
+            "failed_recoveries": self.failed_recoveries,
+            "stale_frames": self.stale_frames,
+            "fixed_waits": self.fixed_waits,
+            "fixed_timeouts": self.fixed_timeouts,
+        }
+
+    def status_text(self):
+        return (f"Timeout {self.timeout_ms()} ms, {self.timeouts} timeouts, "
+                f"{self.retries} retries, {self.recoveries} recoveries, "
+                f"{self.stale_frames} stale, {self.fixed_timeouts} fixed-wait timeouts")
@@ -0,0 +1,89 @@
+# \file    accumulation.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   In-place accumulation of N frames per LED position into a mean
+#          (and optionally variance) frame
+#
+# \version 1.0
+
+import numpy as np
+
+
+class FrameAccumulator:
+    """
+    Sums integer frames into preallocated 64 bit accumulators, so N frames
+    cost N vector adds in RAM instead of N image writes. Integer sums are
+    exact, the variance is therefore free of the cancellation error of
+    float accumulators.
+
+    The accumulators are allocated once per frame shape and re-used.
+    """
+
+    def __init__(self):
+        self._shape = None
+        self._sum = None
+        self._sum_squares = None
+        self._square = None
+        self.count = 0
+        self.variance_enabled = False
+
+    def reset(self, shape, variance: bool = False):
+        """
+        Start a new accumulation
+
+        :param shape: shape of the frames to accumulate
+        :param variance: also accumulate the sum of squares
+        """
+        if self._shape != shape:
+            self._shape = shape
+            self._sum = np.empty(shape, np.uint64)
+            self._sum_squares = None
+            self._square = None
+        if variance and self._sum_squares is None:
+            self._sum_squares = np.empty(shape, np.uint64)
+            self._square = np.empty(shape, np.uint64)
+        self._sum.fill(0)
+        if variance:
+            self._sum_squares.fill(0)
+        self.variance_enabled = variance
+        self.count = 0
+
+    def add(self, frame: np.ndarray):
+        """
+        :param frame: integer frame, may be a view of the camera buffer
+        """
+        if frame.shape != self._shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the "
+                             f"accumulator shape {self._shape}")
+        np.add(self._sum, frame, out=self._sum, casting="unsafe")
+        if self.variance_enabled:
+            np.copyto(self._square, frame, casting="unsafe")
+            np.multiply(self._square, self._square, out=self._square)
+            self._sum_squares += self._square
+        self.count += 1
+
+    def mean(self) -> np.ndarray:
+        """
+        :return: float32 mean frame (a new array)
+        """
+        if self.count == 0:
+            raise ValueError("No frames accumulated")
+        mean = np.empty(self._shape, np.float32)
+        np.divide(self._sum, self.count, out=mean, casting="unsafe")
+        return mean
+
+    def variance(self) -> np.ndarray:
+        """
+        :return: float32 population variance per pixel (a new array)
+        """
+        if not self.variance_enabled:
+            raise ValueError("Variance accumulation is disabled")
+        if self.count == 0:
+            raise ValueError("No frames accumulated")
+        # E[x^2] - E[x]^2 from exact integer sums, evaluated in float64
+        mean = self._sum / self.count
+        variance = self._sum_squares / self.count
+        variance -= mean * mean
+        np.maximum(variance, 0, out=variance)
+        return variance.astype(np.float32)
@@ -0,0 +1,540 @@
+# \file    acquisition_server.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Acquisition server process that owns the camera and the write
+#          pipeline, and RemoteCamera, the thin client used by the GUI/CLI
+#
+# \version 1.0
+#
+# The server runs Camera, its wait_for_signal thread and all file writing.
+# Clients talk to it over a local multiprocessing connection (control
+# channel) and read the preview from shared memory, so Qt painting and
+# the CLI never hold the GIL of the process that captures.
+#
+#     python acquisition_server.py --listen localhost:6010
+#
+# With FPM_ACQUISITION_SERVER=1, main.py spawns the server itself and the
+# interface drives a RemoteCamera instead of a Camera.
+
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+
+AUTHKEY_ENV = "FPM_SERVER_AUTHKEY"
+DEFAULT_ADDRESS = ("localhost", 6010)
+# The client checks for preview frames and events at this rate
+PREVIEW_INTERVAL = 1 / 30
+SPAWN_TIMEOUT = 30
+# Preview header: sequence (uint64), width, height, channels (uint32)
+HEADER_SIZE = 24
+
+
+def parse_address(text: str):
+    host, _, port = text.rpartition(":")
+    return host or "localhost", int(port)
+
+
+class RemoteError(Exception):
+    """
+    An exception raised in the acquisition server
+    """
+
+
+class _HandleReference:
+    """
+    A RemoteObject passed back to the server as an argument
+    """
+
+    def __init__(self, handle: int):
+        self.handle = handle
+
+
+class SharedPreview:
+    """
+    Latest preview frame in shared memory. The writer makes the sequence
+    odd while copying, readers retry until they see the same even sequence
+    before and after their copy (seqlock), so neither side ever blocks.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool):
+        self.memory = memory
+        self.owner = owner
+        self._sequence = np.ndarray((1,), np.uint64, memory.buf, 0)
+        self._shape = np.ndarray((3,), np.uint32, memory.buf, 8)
+        self._data = np.ndarray((memory.size - HEADER_SIZE,), np.uint8, memory.buf, HEADER_SIZE)
+        self._last_read = 0
+
+    @classmethod
+    def create(cls, capacity: int):
+        memory = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + capacity)
+        preview = cls(memory, True)
+        preview._sequence[0] = 0
+        return preview
+
+    @classmethod
+    def attach(cls, name: str):
+        return cls(shared_memory.SharedMemory(name=name), False)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def write(self, array: np.ndarray):
+        """
+        :param array: (h, w, c) uint8 frame
+        """
+        size = array.size
+        if size > self._data.size:
+            print(f"Preview frame of {size} bytes does not fit the shared memory")
+            return
+        self._sequence[0] += 1
+        self._shape[:] = array.shape
+        self._data[:size].reshape(array.shape)[...] = array
+        self._sequence[0] += 1
+
+    def read(self):
+        """
+        :return: copy of the latest frame, None if there is no new one
+        """
+        for _ in range(10):
+            sequence = int(self._sequence[0])
+            if sequence == self._last_read or sequence == 0:
+                return None
+            if sequence % 2:
+                time.sleep(0.001)
+                continue
+            shape = tuple(int(value) for value in self._shape)
+            frame = self._data[:shape[0] * shape[1] * shape[2]].reshape(shape).copy()
+            if int(self._sequence[0]) == sequence:
+                self._last_read = sequence
+                return frame
+        return None
+
+    def close(self):
+        # Release the numpy views before closing the mapping
+        self._sequence = self._shape = self._data = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class PreviewImage:
+    """
+    Stand-in for a converted ids_peak_ipl image, so the interfaces' existing
+    on_image_received works with frames read from the shared preview
+    """
+
+    def __init__(self, array: np.ndarray):
+        self._array = array
+
+    def get_numpy_1D(self):
+        return self._array.reshape(-1)
+
+    def Width(self):
+        return self._array.shape[1]
+
+    def Height(self):
+        return self._array.shape[0]
+
+
+class ServerInterface:
+    """
+    Camera interface of the server process: the preview goes to shared
+    memory, messages and statistics are queued for the client
+    """
+
+    def __init__(self):
+        self.preview = None
+        self._events = []
+        self._lock = threading.Lock()
+
+    def set_camera(self, camera):
+        pass
+
+    def on_image_received(self, image):
+        if self.preview is not None:
+            self.preview.write(image.get_numpy_1D().reshape(image.Height(), image.Width(), 4))
+
+    def on_statistics(self, stats):
+        with self._lock:
+            # Only the latest statistics are of interest
+            self._events = [event for event in self._events if event[0] != "statistics"]
+            self._events.append(("statistics", stats))
+
+    def warning(self, message: str):
+        print(f"Warning: {message}")
+        with self._lock:
+            self._events.append(("warning", message))
+
+    def information(self, message: str):
+        with self._lock:
+            self._events.append(("information", message))
+
+    def take_events(self):
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+
+def _is_value(value):
+    """
+    Values are sent to the client as copies, everything else as a handle
+    """
+    if value is None or isinstance(value, (bool, int, float, str, bytes, type,
+                                           np.ndarray, np.generic)):
+        return True
+    if isinstance(value, (list, tuple, set)):
+        return all(_is_value(item) for item in value)
+    if isinstance(value, dict):
+        return all(_is_value(key) and _is_value(item) for key, item in value.items())
+    return False
+
+
+class _Dispatcher:
+    """
+    Executes control requests on the server's objects. Objects that cannot
+    be copied (node maps, the sequence tracker, ...) are kept in a handle
+    table and used by the client through RemoteObject proxies, until every
+    proxy of them was released. Methods are not exported: the client calls
+    them by name on their object.
+    """
+
+    def __init__(self, camera, interface: ServerInterface):
+        self._interface = interface
+        self._handles = {0: camera}
+        # handle -> proxies the client holds
+        self._references = {}
+
+    def _export(self, value, owner=None):
+        if _is_value(value):
+            return "value", value
+        if isinstance(value, (list, tuple)):
+            return "list", [self._export(item) for item in value]
+        if owner is not None and callable(value) and getattr(value, "__self__", None) is owner:
+            # A bound method would be a new object, and a new handle, on every access
+            return "method", None
+        handle = id(value)
+        self._handles[handle] = value
+        self._references[handle] = self._references.get(handle, 0) + 1
+        return "object", handle
+
+    def _release(self, handle: int):
+        references = self._references.get(handle, 0) - 1
+        if references > 0:
+            self._references[handle] = references
+        else:
+            self._references.pop(handle, None)
+            if handle != 0:
+                self._handles.pop(handle, None)
+
+    def _import(self, value):
+        if isinstance(value, _HandleReference):
+            return self._handles[value.handle]
+        return value
+
+    def handle(self, request):
+        operation, handle, name, args, kwargs = request
+        if operation == "events":
+            return "value", self._interface.take_events()
+        if operation == "release":
+            for released in args:
+                self._release(released)
+            return "value", None
+        target = self._handles[handle]
+        if operation == "get":
+            return self._export(getattr(target, name), target)
+        if operation == "set":
+            setattr(target, name, self._import(args[0]))
+            return "value", None
+        if operation == "call":
+            # `name` calls a method of the target in the same request
+            function = target if name is None else getattr(target, name)
+            args = [self._import(arg) for arg in args]
+            return self._export(function(*args, **kwargs))
+        raise ValueError(f"Unknown operation {operation!r}")
+
+
+def serve(connection):
+    """
+    Open the camera and answer control requests on `connection` until the
+    client closes it. Runs in the acquisition server process.
+    """
+    from ids_peak import ids_peak
+    import camera
+
+    ids_peak.Library.Initialize()
+    interface = ServerInterface()
+    camera_device = None
+    preview = None
+    thread = None
+    try:
+        try:
+            camera_device = camera.Camera(ids_peak.DeviceManager.Instance(), interface)
+            camera_device.init_software_trigger()
+            if os.environ.get("FPM_STREAM_ADDRESS"):
+                try:
+                    camera_device.start_frame_server(os.environ["FPM_STREAM_ADDRESS"],
+                                                     os.environ.get("FPM_STREAM_COMPRESSION"))
+                except (OSError, ValueError) as e:
+                    # Streaming is optional, capture works without it
+                    interface.warning(f"Cannot start streaming: {str(e)}")
+            capacity = (camera_device.node_map.FindNode("WidthMax").Value()
+                        * camera_device.node_map.FindNode("HeightMax").Value() * 4)
+            preview = SharedPreview.create(capacity)
+            interface.preview = preview
+        except Exception as e:
+            connection.send(("error", f"Cannot open the camera: {str(e)}"))
+            return
+        connection.send(("ready", preview.name))
+
+        thread = threading.Thread(target=camera_device.wait_for_signal, args=())
+        thread.start()
+        dispatcher = _Dispatcher(camera_device, interface)
+        while True:
+            try:
+                request = connection.recv()
+            except EOFError:
+                break
+            if request[0] == "close":
+                connection.send(("value", None))
+                break
+            try:
+                reply = dispatcher.handle(request)
+            except Exception as e:
+                reply = ("error", f"{type(e).__name__}: {str(e)}")
+            connection.send(reply)
+    finally:
+        if camera_device is not None:
+            camera_device.killed = True
+            if thread is not None:
+                thread.join()
+            camera_device.close()
+        if preview is not None:
+            preview.close()
+        ids_peak.Library.Close()
+        connection.close()
+
+
+class RemoteMethod:
+    """
+    Method of an object in the acquisition server, a call is one request.
+    Holds its proxy, so the server keeps the object while the method can
+    still be called, e.g. in camera.node_map.FindNode("Width").Value()
+    """
+
+    def __init__(self, owner, name: str):
+        self._owner = owner
+        self._name = name
+
+    def __call__(self, *args, **kwargs):
+        owner = self._owner
+        return object.__getattribute__(owner, "_client")._request(
+            "call", object.__getattribute__(owner, "_handle"), self._name, args, kwargs)
+
+
+class RemoteObject:
+    """
+    Proxy of an object in the acquisition server. Attribute access, attribute
+    assignment and calls are forwarded over the control channel; plain
+    values come back as copies. The server keeps the object until the proxy
+    is garbage collected.
+    """
+
+    def __init__(self, client, handle: int):
+        object.__setattr__(self, "_client", client)
+        object.__setattr__(self, "_handle", handle)
+        # Attribute names known to be methods, called without looking them up again
+        object.__setattr__(self, "_methods", set())
+
+    def __getattr__(self, name):
+        client = object.__getattribute__(self, "_client")
+        handle = object.__getattribute__(self, "_handle")
+        methods = object.__getattribute__(self, "_methods")
+        if name in methods:
+            return RemoteMethod(self, name)
+        value = client._request("get", handle, name, owner=self)
+        if isinstance(value, RemoteMethod):
+            methods.add(name)
+        return value
+
+    def __del__(self):
+        try:
+            handle = object.__getattribute__(self, "_handle")
+            if handle != 0:
+                # Sent with the next request, no I/O from the garbage collector
+                object.__getattribute__(self, "_client")._released.append(handle)
+        except AttributeError:
+            pass
+
+    def __setattr__(self, name, value):
+        object.__getattribute__(self, "_client")._request(
+            "set", object.__getattribute__(self, "_handle"), name, (value,))
+
+    def __call__(self, *args, **kwargs):
+        return object.__getattribute__(self, "_client")._request(
+            "call", object.__getattribute__(self, "_handle"), None, args, kwargs)
+
+    def __reduce__(self):
+        return _HandleReference, (object.__getattribute__(self, "_handle"),)
+
+
+class RemoteCamera(RemoteObject):
+    """
+    Client side of the acquisition server, used by the interfaces in place
+    of Camera. wait_for_signal pumps preview frames and messages from the
+    server to the interface instead of capturing.
+    """
+
+    def __init__(self, connection, preview_name: str, interface, process=None):
+        super().__init__(self, 0)
+        object.__setattr__(self, "_released", [])
+        object.__setattr__(self, "_connection", connection)
+        object.__setattr__(self, "_lock", threading.Lock())
+        object.__setattr__(self, "_process", process)
+        object.__setattr__(self, "_preview", SharedPreview.attach(preview_name))
+        object.__setattr__(self, "_interface", interface)
+        object.__setattr__(self, "_killed", False)
+        interface.set_camera(self)
+
+    @classmethod
+    def connect(cls, address, interface, authkey: bytes = None):
+        """
+        Connect to a server started with --listen
+        """
+        authkey = authkey or bytes.fromhex(os.environ[AUTHKEY_ENV])
+        connection = Client(address, authkey=authkey)
+        return cls._handshake(connection, interface)
+
+    @classmethod
+    def spawn(cls, interface):
+        """
+        Start an acquisition server process for this client
+        """
+        authkey = secrets.token_bytes(16)
+        with Listener(("localhost", 0), authkey=authkey) as listener:
+            host, port = listener.address
+            environment = dict(os.environ, **{AUTHKEY_ENV: authkey.hex()})
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--connect", f"{host}:{port}"],
+                env=environment)
+            # accept() cannot time out, a watchdog closes the listener instead
+            watchdog = threading.Timer(SPAWN_TIMEOUT, listener.close)
+            watchdog.start()
+            try:
+                connection = listener.accept()
+            except OSError:
+                process.kill()
+                raise RemoteError("The acquisition server did not start")
+            finally:
+                watchdog.cancel()
+        return cls._handshake(connection, interface, process)
+
+    @classmethod
+    def _handshake(cls, connection, interface, process=None):
+        status, value = connection.recv()
+        if status != "ready":
+            connection.close()
+            raise RemoteError(value)
+        return cls(connection, value, interface, process)
+
+    def _import(self, reply, owner, name: str):
+        kind, value = reply
+        if kind == "error":
+            raise RemoteError(value)
+        if kind == "list":
+            return [self._import(item, owner, name) for item in value]
+        if kind == "object":
+            return RemoteObject(self, value)
+        if kind == "method":
+            return RemoteMethod(owner, name)
+        return value
+
+    def _request(self, operation, handle=0, name=None, args=(), kwargs=None, owner=None):
+        """
+        :param owner: proxy of `handle`, kept by the methods a "get" returns
+        """
+        with object.__getattribute__(self, "_lock"):
+            connection = object.__getattribute__(self, "_connection")
+            released = object.__getattribute__(self, "_released")
+            if released:
+                handles = [released.pop() for _ in range(len(released))]
+                connection.send(("release", 0, None, handles, {}))
+                connection.recv()
+            connection.send((operation, handle, name, args, kwargs or {}))
+            reply = connection.recv()
+        return self._import(reply, owner, name)
+
+    def __getattr__(self, name):
+        if name == "killed":
+            return object.__getattribute__(self, "_killed")
+        return super().__getattr__(name)
+
+    def __setattr__(self, name, value):
+        if name == "killed":
+            # Stops the local pump; the server's capture thread stops on close()
+            object.__setattr__(self, "_killed", value)
+            return
+        self._request("set", 0, name, (value,))
+
+    def wait_for_signal(self):
+        interface = object.__getattribute__(self, "_interface")
+        preview = object.__getattribute__(self, "_preview")
+        while not object.__getattribute__(self, "_killed"):
+            try:
+                for kind, value in self._request("events"):
+                    if kind == "statistics":
+                        interface.on_statistics(value)
+                    elif kind == "warning":
+                        interface.warning(value)
+                    else:
+                        interface.information(value)
+                frame = preview.read()
+                if frame is not None:
+                    interface.on_image_received(PreviewImage(frame))
+            except (RemoteError, OSError, EOFError) as e:
+                interface.warning(f"Acquisition server: {str(e)}")
+                break
+            time.sleep(PREVIEW_INTERVAL)
+
+    def close(self):
+        """
+        Shut the server down, closes the camera in the server process
+        """
+        try:
+            self._request("close")
+        except (OSError, EOFError):
+            pass
+        object.__getattribute__(self, "_connection").close()
+        object.__getattribute__(self, "_preview").close()
+        process = object.__getattribute__(self, "_process")
+        if process is not None:
+            process.wait()
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--connect":
+        connection = Client(parse_address(sys.argv[2]), authkey=bytes.fromhex(os.environ[AUTHKEY_ENV]))
+        serve(connection)
+        return
+
+    address = parse_address(sys.argv[2]) if len(sys.argv) == 3 and sys.argv[1] == "--listen" \
+        else DEFAULT_ADDRESS
+    if AUTHKEY_ENV not in os.environ:
+        os.environ[AUTHKEY_ENV] = secrets.token_hex(16)
+    print(f"Acquisition server on {address[0]}:{address[1]}, {AUTHKEY_ENV}={os.environ[AUTHKEY_ENV]}")
+    with Listener(address, authkey=bytes.fromhex(os.environ[AUTHKEY_ENV])) as listener:
+        # One client per camera session
+        serve(listener.accept())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# \file    async_camera.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   asyncio facade for Camera: the blocking ids_peak calls run on a
+#          dedicated single-thread executor, cancellation aborts the wait
+#          for the buffer
+#
+# \version 1.0
+#
+# Usage:
+#     async with AsyncCamera(cam) as acam:
+#         await asyncio.gather(leds.switch(position), acam.capture())
+#         async for frame in acam.stream(count=100):
+#             ...
+# Leaving the block stops the acquisition and shuts the camera thread down.
+# Do not run Camera.wait_for_signal at the same time, the facade replaces
+# the make_image flag polling.
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from ids_peak import ids_peak
+
+from camera import Camera, bgra_array
+
+
+class Frame:
+    def __init__(self, image, metadata: dict, statistics):
+        """
+        :param image: converted BGRa8 ids_peak_ipl image, owns its memory
+        :param metadata: per-frame metadata, see Camera._frame_metadata
+        :param statistics: image_stats.FrameStatistics of the frame
+        """
+        self.image = image
+        self.metadata = metadata
+        self.statistics = statistics
+
+    @property
+    def array(self):
+        """
+        (h, w, 4) numpy view of the image
+        """
+        return bgra_array(self.image)
+
+
+class _Call:
+    """
+    One call queued on the camera thread. Its state tells a cancelling
+    task whether the call has not started yet, is running or is done.
+    """
+
+    def __init__(self, lock, function, args):
+        self._lock = lock
+        self._function = function
+        self._args = args
+        self.started = False
+        self.finished = False
+        self.cancelled = False
+
+    def run(self):
+        with self._lock:
+            if self.cancelled:
+                return None
+            self.started = True
+        try:
+            return self._function(*self._args)
+        finally:
+            with self._lock:
+                self.finished = True
+
+
+class AsyncCamera:
+    def __init__(self, camera: Camera):
+        self.camera = camera
+        # All ids_peak calls of the camera run on this thread, in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="camera")
+        self._lock = threading.Lock()
+
+    async def __aenter__(self):
+        try:
+            await self.start()
+        except BaseException:
+            self._executor.shutdown(wait=True)
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        await self.close()
+
+    async def _run(self, function, *args, waits: bool = False):
+        """
+        Run `function` on the camera thread. If the awaiting task is
+        cancelled before the call started, the call is skipped. A running
+        call is allowed to finish, so the next call never overlaps with it;
+        if it `waits` for a buffer, its WaitForFinishedBuffer is aborted.
+        Another task's call is never affected.
+        """
+        call = _Call(self._lock, function, args)
+        future = asyncio.get_running_loop().run_in_executor(self._executor, call.run)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            with self._lock:
+                if not call.started:
+                    call.cancelled = True
+                elif waits and not call.finished:
+                    self.camera.kill_wait()
+            if call.started:
+                try:
+                    await future
+                except ids_peak.AbortedException:
+                    # The killed wait
+                    pass
+            raise
+
+    async def start(self):
+        if not await self._run(self.camera.start_acquisition):
+            raise RuntimeError("Unable to start acquisition")
+
+    async def stop(self):
+        await self._run(self.camera.stop_acquisition)
+
+    async def close(self):
+        await self.stop()
+        self._executor.shutdown(wait=True)
+
+    async def set_exposure(self, exposure_us: float):
+        await self._run(self.camera.set_exposure, exposure_us)
+
+    async def trigger(self, use_exposure_table: bool = True):
+        """
+        Start the exposure of the next frame. Returns as soon as the
+        trigger is executed, so e.g. the next LED can be prepared while
+        the frame is read out; collect it with receive().
+        """
+        await self._run(self._trigger, use_exposure_table)
+
+    def _trigger(self, use_exposure_table: bool):
+        if use_exposure_table:
+            self.camera.apply_exposure_table()
+        self.camera.software_trigger()
+
+    async def receive(self, timeout_ms: int = None) -> Frame:
+        """
+        Wait for the next frame, convert it and re-queue its buffer
+        """
+        return Frame(*await self._run(self.camera.acquire, timeout_ms, waits=True))
+
+    async def capture(self, timeout_ms: int = None, save: bool = False) -> Frame:
+        """
+        Trigger and receive one frame
+
+        :param save: write and journal the frame like a triggered capture
+                     with saving enabled (Camera.save_image)
+        :return: the frame. With save=True the quality gate is applied and
+                 None is returned if it rejected every attempt
+        """
+        return await self._run(self._capture, timeout_ms, save, waits=True)
+
+    def _capture(self, timeout_ms: int, save: bool):
+        self._trigger(True)
+        if save:
+            result = self.camera.save_image(timeout_ms)
+            return None if result is None else Frame(*result)
+        return Frame(*self.camera.acquire(timeout_ms))
+
+    async def stream(self, count: int = None, timeout_ms: int = None):
+        """
+        Software-triggered frames as an async iterator. The next frame is
+        triggered and read out while the consumer processes the current one.
+
+        :param count: number of frames, None for an endless stream
+        """
+        loop = asyncio.get_running_loop()
+        pending = None
+        received = 0
+        try:
+            while count is None or received < count:
+                if pending is None:
+                    pending = loop.create_task(self.capture(timeout_ms))
+                frame = await pending
+                received += 1
+                pending = None
+                if count is None or received < count:
+                    pending = loop.create_task(self.capture(timeout_ms))
+                yield frame
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+                try:
+                    await pending
+                except (asyncio.CancelledError, ids_peak.Exception):
+                    pass
@@ -0,0 +1,200 @@
+# \file    bitpack.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Bit-packed storage of 10/12-bit mono frames: vectorized pack and
+#          unpack in the GenICam Mono10p/Mono12p layout and the .bitpack
+#          frame file
+#
+# \version 1.0
+#
+# Mono10p/Mono12p pack the pixels LSB first without gaps: 4 pixels in 5
+# bytes, or 2 pixels in 3 bytes. A 12-bit frame takes 75 % of the bytes of
+# its uint16 form, a 10-bit frame 62.5 %. Frames the camera already sends
+# packed are stored byte for byte.
+
+import os
+import struct
+
+import numpy as np
+
+
+# Pixel format name -> significant bits
+PACKED_FORMATS = {"Mono10p": 10, "Mono12p": 12}
+UNPACKED_FORMATS = {"Mono10": 10, "Mono12": 12}
+# bits -> (pixels, bytes) of one packing group
+_GROUPS = {10: (4, 5), 12: (2, 3)}
+
+EXTENSION = ".bitpack"
+# magic, version, bits, reserved, width, height
+_HEADER = struct.Struct("<4sBBHII")
+_MAGIC = b"FPMP"
+
+
+def packed_size(count: int, bits: int) -> int:
+    """
+    :return: bytes of `count` packed pixels
+    """
+    return (count * bits + 7) // 8
+
+
+def _groups(count: int, bits: int):
+    if bits not in _GROUPS:
+        raise ValueError(f"Unsupported packing of {bits} bits, use one of {sorted(_GROUPS)}")
+    pixels, nbytes = _GROUPS[bits]
+    return pixels, nbytes, -(-count // pixels)
+
+
+def pack(array: np.ndarray, bits: int) -> np.ndarray:
+    """
+    :param array: frame with `bits` significant bits per pixel, e.g. uint16 Mono12
+    :return: the packed bytes as a flat uint8 array
+    """
+    count = array.size
+    pixels, nbytes, groups = _groups(count, bits)
+    flat = np.ascontiguousarray(array).reshape(-1)
+    if count != groups * pixels:
+        flat = np.concatenate([flat, np.zeros(groups * pixels - count, flat.dtype)])
+    columns = flat.reshape(groups, pixels)
+    mask = (1 << bits) - 1
+
+    packed = np.empty((groups, nbytes), np.uint8)
+    value = np.empty(groups, np.uint16)
+    byte = np.empty(groups, np.uint16)
+    # Byte j of a group holds bits 8j..8j+7 of the concatenated pixels
+    for j in range(nbytes):
+        byte.fill(0)
+        for k in range(pixels):
+            offset = bits * k - 8 * j
+            if offset >= 8 or offset + bits <= 0:
+                continue
+            np.bitwise_and(columns[:, k], mask, out=value, casting="unsafe")
+            if offset >= 0:
+                np.left_shift(value, offset, out=value)
+            else:
+                np.right_shift(value, -offset, out=value)
+            np.bitwise_or(byte, value, out=byte)
+        np.copyto(packed[:, j], byte, casting="unsafe")
+    return packed.reshape(-1)[:packed_size(count, bits)]
+
+
+def unpack(data, bits: int, shape, out: np.ndarray = None) -> np.ndarray:
+    """
+    :param data: packed bytes (uint8 array, bytes or a buffer)
+    :param shape: frame shape, e.g. (height, width)
+    :param out: preallocated uint16 output of `shape`
+    :return: the uint16 frame
+    """
+    count = int(np.prod(shape))
+    pixels, nbytes, groups = _groups(count, bits)
+    data = np.frombuffer(data, np.uint8) if not isinstance(data, np.ndarray) else data.reshape(-1)
+    if data.size < packed_size(count, bits):
+        raise ValueError(f"{data.size} bytes are too few for {count} pixels of {bits} bits")
+    if out is None:
+        out = np.empty(shape, np.uint16)
+    elif out.shape != tuple(shape) or out.dtype != np.uint16:
+        raise ValueError(f"Output must be uint16 of shape {tuple(shape)}")
+
+    exact = count == groups * pixels
+    if data.size < groups * nbytes:
+        # Partial last group
+        data = np.concatenate([data, np.zeros(groups * nbytes - data.size, np.uint8)])
+    packed = data[:groups * nbytes].reshape(groups, nbytes)
+    target = out.reshape(-1) if exact else np.empty(groups * pixels, np.uint16)
+    columns = target.reshape(groups, pixels)
+    mask = (1 << bits) - 1
+
+    # A 10 or 12 bit pixel spans at most two bytes: low bits from byte i
+    # shifted down, high bits from byte i + 1 shifted up
+    value = np.empty(groups, np.uint16)
+    high = np.empty(groups, np.uint16)
+    for k in range(pixels):
+        first, shift = divmod(bits * k, 8)
+        np.right_shift(packed[:, first], shift, out=value, dtype=np.uint16)
+        np.left_shift(packed[:, first + 1], 8 - shift, out=high, dtype=np.uint16)
+        np.bitwise_or(value, high, out=value)
+        np.bitwise_and(value, mask, out=value)
+        columns[:, k] = value
+    if not exact:
+        out.reshape(-1)[:] = target[:count]
+    return out
+
+
+def unpack_rows(data, bits: int, shape, step: int) -> np.ndarray:
+    """
+    Unpack every `step`-th row only, e.g. for a subsampled look at a frame
+
+    :param shape: frame shape (height, width)
+    :return: uint16 array of the rows 0, step, 2 * step, ...
+    """
+    height, width = shape
+    pixels, nbytes, _ = _groups(width, bits)
+    if width % pixels:
+        # Rows do not start on a packing group boundary
+        return unpack(data, bits, shape)[::step]
+    data = np.frombuffer(data, np.uint8) if not isinstance(data, np.ndarray) else data.reshape(-1)
+    row_bytes = width // pixels * nbytes
+    if data.size < height * row_bytes:
+        raise ValueError(f"{data.size} bytes are too few for {width * height} pixels of {bits} bits")
+    rows = data[:height * row_bytes].reshape(height, row_bytes)[::step]
+    return unpack(np.ascontiguousarray(rows), bits, (rows.shape[0], width))
+
+
+class PackedFrame:
+    """
+    Packed bytes of one frame, ready to be written
+    """
+
+    def __init__(self, data: np.ndarray, bits: int, shape):
+        self.data = data
+        self.bits = bits
+        self.shape = tuple(shape)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def unpack(self, out: np.ndarray = None) -> np.ndarray:
+        return unpack(self.data, self.bits, self.shape, out)
+
+    def write(self, path_base: str) -> str:
+        """
+        :param path_base: file path without extension
+        :return: path of the written .bitpack file
+        """
+        return write_packed(path_base, self.data, self.bits, self.shape)
+
+
+def write_packed(path_base: str, data: np.ndarray, bits: int, shape) -> str:
+    """
+    :param shape: (height, width) of the frame, the file holds single-channel frames only
+    :return: path of the written .bitpack file
+    """
+    shape = tuple(shape)
+    if len(shape) != 2:
+        raise ValueError(f"Bit-packed frames must be 2-D (height, width), got shape {shape}")
+    height, width = shape
+    # Raises for unsupported bit depths
+    _groups(width * height, bits)
+    data = np.ascontiguousarray(data)
+    if data.nbytes != packed_size(width * height, bits):
+        raise ValueError(f"{data.nbytes} bytes do not match {width}x{height} pixels of {bits} bits")
+    path = path_base + EXTENSION
+    with open(path, "wb") as file:
+        file.write(_HEADER.pack(_MAGIC, 1, bits, 0, width, height))
+        file.write(memoryview(data))
+    return path
+
+
+def read_packed(path: str, out: np.ndarray = None) -> np.ndarray:
+    """
+    Read and unpack a .bitpack frame
+
+    :return: uint16 (height, width) frame
+    """
+    with open(path, "rb") as file:
+        magic, version, bits, _, width, height = _HEADER.unpack(file.read(_HEADER.size))
+        if magic != _MAGIC or version != 1:
+            raise ValueError(f"{os.path.basename(path)} is not a bitpack frame")
+        data = np.fromfile(file, np.uint8, packed_size(width * height, bits))
+    return unpack(data, bits, (height, width), out)
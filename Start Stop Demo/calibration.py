@@ -0,0 +1,131 @@
+# \file    calibration.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Dark-frame and flat-field calibration: master frame building, an
+#          on-disk cache and the per-frame correction stage
+#
+# \version 1.0
+#
+# Darks depend on the exposure time and are cached per exposure. The flat is
+# stored dark-subtracted and is exposure independent, so one flat per camera
+# configuration serves every LED position of a run.
+
+import os
+
+import numpy as np
+
+
+CALIBRATION_DIRECTORY = "calibration"
+
+
+def _key_name(key: dict, exposure_us: float = None):
+    name = "{serial}_{pixel_format}_{width}x{height}+{offset_x}+{offset_y}".format(**key)
+    if exposure_us is not None:
+        name += f"_{exposure_us:.0f}us"
+    return name
+
+
+class CalibrationCache:
+    def __init__(self, directory: str = CALIBRATION_DIRECTORY):
+        self.directory = directory
+
+    def path(self, kind: str, key: dict, exposure_us: float = None):
+        """
+        :param kind: "dark" or "flat"
+        :param key: camera configuration, see Camera.configuration_key
+        :param exposure_us: exposure of the master frame, None for exposure independent frames
+        """
+        return os.path.join(self.directory, f"{kind}_{_key_name(key, exposure_us)}.npy")
+
+    def save(self, kind: str, key: dict, master: np.ndarray, exposure_us: float = None):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(kind, key, exposure_us)
+        # np.save appends .npy to names that do not end with it
+        temp_path = path[:-len(".npy")] + ".tmp.npy"
+        np.save(temp_path, master)
+        os.replace(temp_path, path)
+        return path
+
+    def load(self, kind: str, key: dict, exposure_us: float = None):
+        """
+        :return: the cached master frame, or None if it has not been captured
+        """
+        path = self.path(kind, key, exposure_us)
+        if not os.path.exists(path):
+            return None
+        return np.load(path)
+
+
+def build_master(frames) -> np.ndarray:
+    """
+    Average a stack of frames into a float32 master frame
+
+    :param frames: iterable of equally shaped frames
+    """
+    master = None
+    count = 0
+    for frame in frames:
+        if master is None:
+            master = np.zeros(frame.shape, np.float64)
+        master += frame
+        count += 1
+    if count == 0:
+        raise ValueError("Cannot build a master frame from zero frames")
+    master /= count
+    return master.astype(np.float32)
+
+
+def normalize_flat(flat: np.ndarray, dark: np.ndarray = None) -> np.ndarray:
+    """
+    Dark-subtract a flat master frame for caching
+    """
+    if dark is not None:
+        flat = flat - dark
+    return np.maximum(flat, 0).astype(np.float32)
+
+
+class FlatFieldCorrector:
+    """
+    (frame - dark) * mean(flat) / flat, computed in place in preallocated
+    float32 buffers. The gain map is computed once when the corrector is
+    built, so the per-frame cost is one subtract and one multiply.
+    """
+
+    def __init__(self, dark: np.ndarray = None, flat: np.ndarray = None):
+        """
+        :param dark: dark master at the exposure of the frames, None to skip
+        :param flat: dark-subtracted flat master, None to skip
+        """
+        if dark is None and flat is None:
+            raise ValueError("Need a dark and/or a flat frame")
+        self.dark = None if dark is None else dark.astype(np.float32)
+        self.gain = None
+        if flat is not None:
+            flat = flat.astype(np.float32)
+            valid = flat > 0
+            self.gain = np.zeros(flat.shape, np.float32)
+            # Dead pixels in the flat get gain 0 instead of infinity
+            np.divide(flat[valid].mean(), flat, out=self.gain, where=valid)
+        shape = (self.dark if self.dark is not None else self.gain).shape
+        self._work = np.empty(shape, np.float32)
+
+    def apply(self, frame: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        """
+        :param frame: raw frame, may be a view of the camera buffer
+        :param out: float32 output array, defaults to an internal buffer that
+                    is overwritten by the next call
+        :return: the corrected frame
+        """
+        if frame.shape != self._work.shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match the "
+                             f"calibration shape {self._work.shape}")
+        out = self._work if out is None else out
+        if self.dark is not None:
+            np.subtract(frame, self.dark, out=out, casting="unsafe")
+            np.maximum(out, 0, out=out)
+        else:
+            np.copyto(out, frame, casting="unsafe")
+        if self.gain is not None:
+            np.multiply(out, self.gain, out=out)
+        return out
@@ -10,20 +10,103 @@
 import sys
 import os
 from os.path import exists
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 from ids_peak import ids_peak
 from ids_peak_ipl import ids_peak_ipl
 from ids_peak import ids_peak_ipl_extension
 
+from frame_bus import FrameBus
+from frame_server import FrameServer
+from memory_budget import MemoryBudget, spill_array, unspill
+from frame_sequence import SequenceTracker
+from chunk_data import ChunkReader
+from wait_policy import AdaptiveTimeout
+from bitpack import PACKED_FORMATS, UNPACKED_FORMATS, PackedFrame, pack, packed_size, unpack, unpack_rows
+from capture_journal import CaptureJournal
+from image_stats import StatisticsStage
+from exposure_table import ExposureTable, calibrate_exposure_table, DEFAULT_TARGET
+from hdr import HdrFuser
+from frame_writer import write_array
+from accumulation import FrameAccumulator
+from converter_cache import ConverterCache
+from quality_gate import QualityGate, log_rejected
+from calibration import CalibrationCache, FlatFieldCorrector, build_master, normalize_flat
+from profiling import profiler, start_from_environment
+
 ###### My package imports ######
 from PIL import Image
 import time
-import glob
-import re
 ###### My package imports ######
 
 
 TARGET_PIXEL_FORMAT = ids_peak_ipl.PixelFormatName_BGRa8
+# Buffers on top of the datastream minimum and the frame bus subscribers: the frame being captured
+CAPTURE_BUFFERS = 1
+# Cap of the bytes held by the frame bus queues and the write queue
+MEMORY_CAP_MB = int(os.environ.get("FPM_MEMORY_CAP_MB", 2048))
+# "block" (the trigger waits), "drop" or "spill" (to FPM_SPILL_DIRECTORY)
+WRITER_MEMORY_POLICY = os.environ.get("FPM_WRITER_MEMORY_POLICY", "block")
+# Single frames are saved as "converted" (PNG + TIF of the BGRa8 preview),
+# "raw" (sensor data, uint16 for 10/12 bit) or "packed" (10/12 bit mono bit-packed)
+RAW_STORAGE_MODES = ("converted", "raw", "packed")
+RAW_STORAGE = os.environ.get("FPM_RAW_STORAGE", "converted")
+
+
+def bgra_array(image):
+    """
+    (height, width, 4) numpy view of a BGRa8 image, sharing its memory
+    """
+    return image.get_numpy_1D().reshape(image.Height(), image.Width(), 4)
+
+
+def raw_array(image):
+    """
+    numpy view of an unconverted image, (height, width) for mono and bayer
+    formats, (height, width, channels) otherwise. Shares the buffer memory,
+    except for bit-packed formats, which are unpacked into a new uint16 array.
+    """
+    bits = PACKED_FORMATS.get(image.PixelFormat().Name())
+    if bits is not None:
+        shape = (image.Height(), image.Width())
+        return unpack(image.get_numpy_1D()[:packed_size(shape[0] * shape[1], bits)], bits, shape)
+    if image.PixelFormat().NumChannels() == 1:
+        return image.get_numpy_2D()
+    return image.get_numpy_3D()
+
+
+def raw_sample(image, step: int):
+    """
+    raw_array(image)[::step, ::step], bit-packed formats unpack the sampled rows only
+    """
+    bits = PACKED_FORMATS.get(image.PixelFormat().Name())
+    if bits is not None:
+        shape = (image.Height(), image.Width())
+        data = image.get_numpy_1D()[:packed_size(shape[0] * shape[1], bits)]
+        return unpack_rows(data, bits, shape, step)[:, ::step]
+    return raw_array(image)[::step, ::step]
+
+
+def raw_copy(image, raw=None):
+    """
+    raw_array(image) in memory of its own, copied only if it is a view of the buffer
+
+    :param raw: raw_array(image) if the caller already has it
+    """
+    if raw is None:
+        raw = raw_array(image)
+    # Bit-packed formats are already unpacked into a new array by raw_array
+    return raw if image.PixelFormat().Name() in PACKED_FORMATS else raw.copy()
+
+
+def pixel_max_value(image):
+    """
+    Full scale value of the image's pixel format, e.g. 255 or 4095
+    """
+    return (1 << image.PixelFormat().NumSignificantBitsPerChannel()) - 1
 
 
 class Camera:
@@ -40,16 +123,87 @@ class Camera:
         self.acquisition_running = False
         self.node_map = None
         self._interface = interface
-        self.make_image = False
+        # Notified whenever make_image changes, see wait_until_idle
+        self._make_image_changed = threading.Condition()
+        self._make_image = False
         self.keep_image = True
         self._buffer_list = []
+        # Display, streaming, ... consume frames on their own threads. The
+        # buffer returns to the datastream when the last one releases it
+        self.memory = MemoryBudget(MEMORY_CAP_MB * 2 ** 20)
+        if os.environ.get("FPM_SPILL_DIRECTORY"):
+            self.memory.spill_directory = os.environ["FPM_SPILL_DIRECTORY"]
+        # Frames queued for the display and streaming, counted once however many subscribers share them
+        self.memory.add_stage("frame_bus", "drop", high=384 * 2 ** 20)
+        self.memory.add_stage("writer", WRITER_MEMORY_POLICY, high=MEMORY_CAP_MB * 2 ** 20 // 2)
+        self.frame_bus = FrameBus(self.memory, "frame_bus")
+        self.frame_bus.subscribe("display", self._display_frame, queue_size=1)
+        self._stream_subscription = None
+        # Incremented per acquisition start, buffers released later are not re-queued
+        self._generation = 0
+        # BasePtr of the buffers frame bus subscribers still hold, guarded by the lock
+        self._held_buffers = set()
+        self._held_lock = threading.Lock()
+        self.frame_server = None
+        # FrameID/timestamp bookkeeping, sequence_index == LED position
+        self.sequence = SequenceTracker()
+        self.last_metadata = {}
+        # Exposure/gain/timestamp per frame from chunk data, FPM_CHUNK_DATA=0 disables chunks
+        self.chunks = ChunkReader()
+        self.chunk_data = os.environ.get("FPM_CHUNK_DATA", "1") != "0"
+        # Buffer wait timeouts from exposure, frame rate and observed latency
+        self.wait_policy = AdaptiveTimeout()
+        self._trigger_time = None
+        # Exposure statistics of every frame, subsampled to stay within budget
+        self.statistics = StatisticsStage()
+        # GenICam nodes are looked up once, see _node
+        self._nodes = {}
+        self._exposure_us = None
+        # LED position -> exposure time, applied before every software trigger
+        self.exposure_table = None
+        # Journal of the current run directory, see open_journal
+        self.journal = None
+        self.journal_fsync = os.environ.get("FPM_JOURNAL_FSYNC", "frame")
+        # Positions whose frames are still being processed by the worker
+        self._pending_positions = set()
+        # Guards _pending_positions, notified when the worker journaled a position
+        self._positions_changed = threading.Condition()
+        # Lowest position the next stored frame may take in the open run
+        self._position = 0
+        # Positions captured in this acquisition, rejected and retried frames excluded
+        self._accepted = 0
+        # Exposure bracketing: exposure times per position, None to disable
+        self.bracket_exposures = None
+        self.hdr_dtype = np.float32
+        self.keep_brackets = False
+        self._hdr_fuser = HdrFuser()
+        # Accumulation: frames averaged per position, 1 to disable
+        self.accumulate_frames = 1
+        self.accumulate_variance = False
+        self._accumulator = FrameAccumulator()
+        # Rejects blank/saturated/repeated frames before conversion and writing
+        self.quality_gate = QualityGate()
+        self.quality_retries = 0
+        # How save_image stores single frames, see RAW_STORAGE_MODES
+        self.raw_storage = RAW_STORAGE if RAW_STORAGE in RAW_STORAGE_MODES else "converted"
+        # Dark/flat master frames and the correction applied before writing
+        self.calibration = CalibrationCache()
+        self.flat_field = False
+        self._correctors = {}
+        # Fusion and writing of derived frames run here, off the camera thread
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        self._image_converter = ids_peak_ipl.ImageConverter()
+        # Pre-allocated converters of recently used pixel formats and ROIs,
+        # created before the device is opened, close() runs after a failed open too
+        self._converters = ConverterCache()
 
         self.killed = False
 
         self._get_device()
         self._interface.set_camera(self)
 
-        self._image_converter = ids_peak_ipl.ImageConverter()
+        # FPM_PROFILE=1 profiles the whole session, the report is written by close()
+        start_from_environment()
 
     def __del__(self):
         self.close()
@@ -87,8 +241,13 @@ class Camera:
                     continue
 
         # Opens the selected device in control mode
-        self._device = self.device_manager.Devices()[selected_device].OpenDevice(
-            ids_peak.DeviceAccessType_Control)
+        descriptor = self.device_manager.Devices()[selected_device]
+        self._device = descriptor.OpenDevice(ids_peak.DeviceAccessType_Control)
+        # GigE Vision block IDs are 16 bit and wrap much sooner than USB3 Vision frame IDs
+        try:
+            self.sequence.id_bits = 16 if descriptor.TLType() == "GEV" else 64
+        except ids_peak.Exception:
+            pass
         # Get device's control nodes
         self.node_map = self._device.RemoteDevice().NodeMaps()[0]
 
@@ -97,6 +256,10 @@ class Camera:
         self.node_map.FindNode("UserSetLoad").Execute()
         self.node_map.FindNode("UserSetLoad").WaitUntilDone()
 
+        # Before the buffers are allocated, chunks are part of the payload
+        if self.chunk_data:
+            self.chunks.enable(self.node_map)
+
         print("Finished opening device!")
 
     def _init_data_stream(self):
@@ -137,6 +300,13 @@ class Camera:
 
     def close(self):
         self.stop_acquisition()
+        # Finish writing frames that are still being fused
+        self._worker.shutdown(wait=True)
+        self.stop_frame_server()
+        self.frame_bus.close()
+        self.close_journal()
+        self._converters.clear()
+        profiler.stop()
 
         # If datastream has been opened, revoke and deallocate all buffers
         if self._datastream is not None:
@@ -177,6 +347,7 @@ class Camera:
         if self._datastream is None:
             self._init_data_stream()
 
+        self._generation += 1
         for buffer in self._buffer_list:
             self._datastream.QueueBuffer(buffer)
         try:
@@ -185,18 +356,23 @@ class Camera:
 
             image_width = self.node_map.FindNode("Width").Value()
             image_height = self.node_map.FindNode("Height").Value()
-            input_pixel_format = ids_peak_ipl.PixelFormat(
-                self.node_map.FindNode("PixelFormat").CurrentEntry().Value())
-
-            # Pre-allocate conversion buffers to speed up first image conversion
-            # while the acquisition is running
-            # NOTE: Re-create the image converter, so old conversion buffers
-            #       get freed
-            self._image_converter = ids_peak_ipl.ImageConverter()
-            self._image_converter.PreAllocateConversion(
-                input_pixel_format, TARGET_PIXEL_FORMAT,
-                image_width, image_height)
+            input_pixel_format = self.node_map.FindNode("PixelFormat").CurrentEntry().Value()
+
+            # Pre-allocated conversion buffers speed up the first image
+            # conversion. Converters are cached per format and size, so
+            # switching back to a recently used pixel format is free
+            self._image_converter = self._converters.get(
+                input_pixel_format, TARGET_PIXEL_FORMAT, image_width, image_height)
 
+            self.sequence.reset()
+            self._accepted = 0
+            self._exposure_us = None
+            self.chunks.refresh_cache(self.node_map)
+            self.wait_policy.configure(self.exposure(), self._frame_rate())
+            self._correctors = {}
+            self.quality_gate.reset()
+            if self.exposure_table is None:
+                self.load_exposure_table()
             self._datastream.StartAcquisition()
             self.node_map.FindNode("AcquisitionStart").Execute()
             self.node_map.FindNode("AcquisitionStart").WaitUntilDone()
@@ -230,12 +406,369 @@ class Camera:
         except Exception as e:
             self._interface.warning(str(e))
 
+    def start_frame_server(self, address: str, compression: str = None):
+        """
+        Stream every captured frame to remote consumers
+
+        :param address: "host:port" for TCP or "unix:/path" for a Unix socket
+        :param compression: None, "zlib" or "lz4"
+        """
+        self.stop_frame_server()
+        self.frame_server = FrameServer(address, compression)
+        self._stream_subscription = self.frame_bus.subscribe("stream", self._stream_frame, queue_size=2)
+        print(f"Streaming frames on {self.frame_server.address}")
+
+    def stop_frame_server(self):
+        if self._stream_subscription is not None:
+            self.frame_bus.unsubscribe(self._stream_subscription)
+            self._stream_subscription = None
+        if self.frame_server is not None:
+            self.frame_server.close()
+            self.frame_server = None
+
+    def _display_frame(self, frame):
+        with profiler.section("on_image_received"):
+            self._interface.on_image_received(frame.image)
+
+    def _stream_frame(self, frame):
+        image = frame.image
+        self.frame_server.publish(image.get_numpy_1D(), dict(
+            frame.metadata,
+            width=image.Width(),
+            height=image.Height(),
+            pixel_format=image.PixelFormat().Name()))
+
+    def _requeue(self, buffer):
+        """
+        :return: release callback of a frame bus frame that re-queues `buffer`
+        """
+        generation = self._generation
+        key = buffer.BasePtr()
+        with self._held_lock:
+            self._held_buffers.add(key)
+
+        def release():
+            with self._held_lock:
+                self._held_buffers.discard(key)
+                # After a stop the buffers are flushed and start_acquisition queues them all
+                if not self.acquisition_running or generation != self._generation:
+                    return
+                try:
+                    self._datastream.QueueBuffer(buffer)
+                except Exception as e:
+                    self._interface.warning(f"Cannot re-queue buffer: {str(e)}")
+        return release
+
+    def _publish(self, buffer, image, converted_ipl_image, metadata, raw=None):
+        """
+        Hand a frame to the frame bus subscribers. The buffer is re-queued
+        once every subscriber is done with the raw view, right away if no
+        subscriber reads raw.
+
+        :param raw: raw_array(image) if the caller already has it
+        """
+        if not self.frame_bus.needs_raw():
+            self.frame_bus.publish(converted_ipl_image, metadata).release()
+            self._requeue(buffer)()
+            return
+        self.frame_bus.publish(converted_ipl_image, metadata,
+                               raw_array(image) if raw is None else raw,
+                               self._requeue(buffer)).release()
+
+    def open_journal(self, run_dir: str):
+        """
+        Open (or re-open after a crash) the capture journal of `run_dir`
+
+        :return: the CaptureJournal of the run
+        """
+        if self.journal is not None and self.journal.run_dir == run_dir:
+            return self.journal
+        self.close_journal()
+        self.journal = CaptureJournal(run_dir, self.journal_fsync)
+        self._position = 0
+        if self.journal.entries:
+            print(f"Resuming run with {len(self.journal.entries)} journaled frames, "
+                  f"next frame: {self.journal.first_missing()}")
+        return self.journal
+
+    def close_journal(self):
+        # The worker still records frames into the journal
+        self.wait_for_pending()
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def resume_run(self, run_dir: str):
+        """
+        Point image saving back at an existing run directory and continue
+        capture from its first missing frame
+        """
+        if not os.path.isdir(run_dir):
+            raise ValueError(f"Run directory does not exist: {run_dir}")
+        with open("Metadata_path.txt", "w") as file:
+            file.write(repr(run_dir))
+        journal = self.open_journal(run_dir)
+        self.wait_for_pending()
+        self._position = 0
+        return journal.first_missing()
+
     def software_trigger(self):
         print("Executing software trigger...")
-        self.node_map.FindNode("TriggerSoftware").Execute()
-        self.node_map.FindNode("TriggerSoftware").WaitUntilDone()
+        self._trigger_time = time.perf_counter()
+        with profiler.section("trigger"):
+            self._node("TriggerSoftware").Execute()
+            self._node("TriggerSoftware").WaitUntilDone()
         print("Finished.")
 
+    def kill_wait(self):
+        """
+        Abort a WaitForFinishedBuffer that is blocking another thread
+        """
+        if self._datastream is not None:
+            self._datastream.KillWait()
+
+    def recover_datastream(self):
+        """
+        Flush the datastream and queue all buffers again, after repeated
+        buffer wait timeouts (lost buffers, a stalled transport layer)
+
+        :return: True if the datastream accepted the buffers again
+        """
+        print("Recovering datastream: flushing and re-queueing all buffers")
+        try:
+            # Buffers still held by frame bus subscribers are left to their
+            # release, which queues them once the subscribers are done
+            with self._held_lock:
+                self._datastream.Flush(ids_peak.DataStreamFlushMode_DiscardAll)
+                for buffer in self._buffer_list:
+                    if buffer.BasePtr() not in self._held_buffers:
+                        self._datastream.QueueBuffer(buffer)
+            success = True
+        except ids_peak.Exception as e:
+            self._interface.warning(f"Datastream recovery failed: {str(e)}")
+            success = False
+        self.wait_policy.record_recovery(success)
+        return success
+
+    def _node(self, name: str):
+        """
+        Cached `FindNode`, node handles stay valid while the device is open
+        """
+        node = self._nodes.get(name)
+        if node is None:
+            node = self.node_map.FindNode(name)
+            self._nodes[name] = node
+        return node
+
+    def configuration_key(self):
+        """
+        Camera configuration that calibration data (exposure tables,
+        dark/flat frames) is only valid for
+        """
+        return {
+            "serial": self._device.SerialNumber(),
+            "pixel_format": self._node("PixelFormat").CurrentEntry().SymbolicValue(),
+            "width": self._node("Width").Value(),
+            "height": self._node("Height").Value(),
+            "offset_x": self._node("OffsetX").Value(),
+            "offset_y": self._node("OffsetY").Value(),
+        }
+
+    def _frame_rate(self):
+        """
+        :return: the frame rate limit in Hz, None if the device has no AcquisitionFrameRate
+        """
+        try:
+            return self._node("AcquisitionFrameRate").Value()
+        except ids_peak.Exception:
+            return None
+
+    def exposure_limits(self):
+        node = self._node("ExposureTime")
+        return node.Minimum(), node.Maximum()
+
+    def set_exposure(self, exposure_us: float):
+        """
+        Set the exposure time, skipping the node write if it is already set
+        """
+        if self._exposure_us is not None and abs(self._exposure_us - exposure_us) < 0.5:
+            return
+        minimum, maximum = self.exposure_limits()
+        exposure_us = min(max(exposure_us, minimum), maximum)
+        self._node("ExposureTime").SetValue(exposure_us)
+        self._exposure_us = exposure_us
+        self.chunks.cache("exposure_us", exposure_us)
+        self.wait_policy.configure(exposure_us=exposure_us)
+
+    def exposure(self):
+        if self._exposure_us is None:
+            self._exposure_us = self._node("ExposureTime").Value()
+            self.chunks.cache("exposure_us", self._exposure_us)
+        return self._exposure_us
+
+    def next_position(self):
+        """
+        LED position of the next capture: the next position of the run that
+        is not journaled, or the number of positions captured in this acquisition
+        """
+        if self.keep_image and self.journal is not None:
+            return self._free_position(self.journal)
+        return self._accepted
+
+    def _free_position(self, journal: CaptureJournal):
+        with self._positions_changed:
+            index = journal.first_missing(self._position)
+            while index in self._pending_positions:
+                index = journal.first_missing(index + 1)
+            return index
+
+    def _claim_position(self, journal: CaptureJournal):
+        """
+        Claim the position of the next stored frame. Positions only move
+        forward from where the run was opened or resumed, skipping frames a
+        resumed run journaled already, so a hole left by a lost frame or a
+        failed write is re-shot on resume instead of being filled by a later
+        LED position.
+        """
+        with self._positions_changed:
+            index = self._free_position(journal)
+            self._position = index + 1
+        return index
+
+    def _reserve_position(self, journal: CaptureJournal):
+        """
+        Claim the next position for a frame that is written later by the
+        worker, so the following capture does not claim it too
+        """
+        with self._positions_changed:
+            index = self._claim_position(journal)
+            self._pending_positions.add(index)
+        return index
+
+    def _release_position(self, index: int):
+        """
+        The worker is done with `index`, journaled or failed
+        """
+        with self._positions_changed:
+            self._pending_positions.discard(index)
+            self._positions_changed.notify_all()
+
+    def wait_for_pending(self, timeout: float = None):
+        """
+        Wait until the worker has journaled all reserved positions
+
+        :return: False if positions are still pending after `timeout` seconds
+        """
+        with self._positions_changed:
+            return self._positions_changed.wait_for(lambda: not self._pending_positions, timeout)
+
+    def load_exposure_table(self):
+        """
+        Load the cached exposure table of the current camera configuration
+        """
+        try:
+            self.exposure_table = ExposureTable.load_cached(self.configuration_key())
+        except (OSError, ValueError, KeyError) as e:
+            self._interface.warning(f"Cannot load exposure table: {str(e)}")
+            self.exposure_table = None
+        if self.exposure_table is not None:
+            print(f"Loaded exposure table with {len(self.exposure_table)} positions")
+        return self.exposure_table
+
+    def calibrate_exposures(self, positions, target: float = DEFAULT_TARGET,
+                            set_position=None):
+        """
+        Auto-exposure pass: capture every LED position at trial exposures
+        until its bright percentile reaches `target`, then cache the table
+
+        :param positions: LED positions to calibrate
+        :param target: target level as a fraction of full scale
+        :param set_position: callable(position) that switches the LED array
+        """
+        def measure(exposure_us):
+            self.set_exposure(exposure_us)
+            self.software_trigger()
+            return self._acquire_image()[2]
+
+        table = calibrate_exposure_table(
+            measure, positions, self.exposure(), self.exposure_limits(),
+            self.configuration_key(), target, set_position=set_position)
+        print(f"Saved exposure table to {table.save()}")
+        self.exposure_table = table
+        # Calibration frames are not part of the run
+        self.sequence.reset()
+        self._accepted = 0
+        return table
+
+    def capture_stack(self, count: int):
+        """
+        Trigger `count` frames. Yields a raw view of each buffer, which is
+        queued again when the consumer asks for the next frame, so building
+        a master frame needs no per-frame copy.
+        """
+        for _ in range(count):
+            self.software_trigger()
+            buffer, image, _ = self._wait_for_image()
+            try:
+                yield raw_array(image)
+            finally:
+                self._datastream.QueueBuffer(buffer)
+
+    def calibrate_dark(self, count: int):
+        """
+        Capture a dark stack (illumination off) at the current exposure and
+        cache its master frame
+        """
+        master = build_master(self.capture_stack(count))
+        path = self.calibration.save("dark", self.configuration_key(), master, self.exposure())
+        self._correctors = {}
+        print(f"Saved dark master to {path}")
+        return path
+
+    def calibrate_flat(self, count: int):
+        """
+        Capture a flat stack (uniform illumination, no sample) and cache its
+        dark-subtracted master frame
+        """
+        key = self.configuration_key()
+        master = build_master(self.capture_stack(count))
+        dark = self.calibration.load("dark", key, self.exposure())
+        if dark is None:
+            self._interface.warning("No dark master for the flat's exposure, the flat is not dark-subtracted")
+        path = self.calibration.save("flat", key, normalize_flat(master, dark))
+        self._correctors = {}
+        print(f"Saved flat master to {path}")
+        return path
+
+    def _corrector(self):
+        """
+        Dark/flat corrector for the current exposure, built once per exposure
+        """
+        exposure_us = round(self.exposure())
+        if exposure_us not in self._correctors:
+            key = self.configuration_key()
+            dark = self.calibration.load("dark", key, exposure_us)
+            flat = self.calibration.load("flat", key)
+            if dark is None and flat is None:
+                self._interface.warning(f"No dark or flat calibration for {exposure_us} us, "
+                                        f"frames are stored uncorrected")
+                self._correctors[exposure_us] = None
+            else:
+                if dark is None:
+                    print(f"No dark master for {exposure_us} us, applying the flat only")
+                self._correctors[exposure_us] = FlatFieldCorrector(dark, flat)
+        return self._correctors[exposure_us]
+
+    def apply_exposure_table(self):
+        """
+        Set the calibrated exposure of the next LED position, if there is a table
+        """
+        if self.exposure_table is None:
+            return
+        exposure_us = self.exposure_table.get(self.next_position())
+        if exposure_us is not None:
+            self.set_exposure(exposure_us)
+
     def _valid_name(self, path: str, ext: str):
         num = 0
 
@@ -246,20 +779,33 @@ class Camera:
             num += 1
         return build_string()
 
-    def revoke_and_allocate_buffer(self):
+    def revoke_and_allocate_buffer(self, force: bool = False):
+        """
+        Make sure enough buffers for the current PayloadSize are announced.
+        Buffers that are large enough are kept, e.g. when switching to a
+        pixel format with the same or fewer bytes per pixel.
+
+        :param force: always revoke and re-allocate
+        """
         if self._datastream is None:
             return
 
         try:
-            # Check if buffers are already allocated
-            if self._datastream is not None:
-                # Remove buffers from the announced pool
-                for buffer in self._datastream.AnnouncedBuffers():
-                    self._datastream.RevokeBuffer(buffer)
-                self._buffer_list = []
-
             payload_size = self.node_map.FindNode("PayloadSize").Value()
-            buffer_amount = self._datastream.NumBuffersAnnouncedMinRequired()
+            # Subscribed raw consumers are counted when the buffers are allocated
+            buffer_amount = (self._datastream.NumBuffersAnnouncedMinRequired()
+                             + self.frame_bus.held_buffers() + CAPTURE_BUFFERS)
+
+            announced = self._datastream.AnnouncedBuffers()
+            if (not force and self._buffer_list and len(announced) >= buffer_amount
+                    and all(buffer.Size() >= payload_size for buffer in announced)):
+                print("Keeping allocated buffers!")
+                return
+
+            # Remove buffers from the announced pool
+            for buffer in announced:
+                self._datastream.RevokeBuffer(buffer)
+            self._buffer_list = []
 
             for _ in range(buffer_amount):
                 buffer = self._datastream.AllocAndAnnounceBuffer(payload_size)
@@ -276,7 +822,197 @@ class Camera:
         except Exception as e:
             self._interface.warning(f"Cannot change pixelformat: {str(e)}")
 
-    def save_image(self):
+    def _frame_metadata(self, buffer):
+        """
+        Build the per-frame metadata from the buffer and its chunk data and
+        check it for dropped or duplicated frames
+        """
+        chunk_metadata = self.chunks.read(self.node_map, buffer)
+        try:
+            frame_id = buffer.FrameID()
+        except ids_peak.Exception:
+            # The transport layer reports no FrameID, use the device's chunk frame ID if any
+            frame_id = chunk_metadata.get("device_frame_id")
+        metadata = self.sequence.update(
+            frame_id, buffer.Timestamp_ns(), buffer.IsIncomplete())
+        metadata.update(chunk_metadata)
+        metadata["time"] = time.time()
+        if metadata["missing_before"]:
+            self._interface.warning(
+                f"{metadata['missing_before']} frame(s) lost before frame "
+                f"{metadata['sequence_index']}, missing positions: "
+                f"{self.sequence.missing_indices}")
+        elif metadata["duplicate"]:
+            self._interface.warning(
+                f"Duplicate frame ID {metadata['frame_id']} received")
+        self.last_metadata = metadata
+        return metadata
+
+    def _wait_for_image(self, timeout_ms: int = None):
+        """
+        Wait for the next buffer. The returned image shares the buffer's
+        memory until the buffer is queued again.
+
+        :param timeout_ms: fixed timeout without retries or recovery, e.g. for
+                           load tests. None uses the adaptive timeout, re-triggers
+                           a missed frame and recovers the datastream after
+                           repeated timeouts, see wait_policy
+        :return: (buffer, image, per-frame metadata)
+        """
+        attempt = 0
+        while True:
+            # An explicit 0 polls
+            wait_ms = self.wait_policy.timeout_ms() if timeout_ms is None else timeout_ms
+            try:
+                with profiler.section("wait_buffer"):
+                    buffer = self._datastream.WaitForFinishedBuffer(wait_ms)
+                break
+            except ids_peak.TimeoutException:
+                if timeout_ms is not None:
+                    self.wait_policy.on_timeout(fixed=True)
+                    raise
+                if self.wait_policy.on_timeout():
+                    self.recover_datastream()
+                if not self.wait_policy.can_retry(attempt):
+                    raise
+                # A frame that is only late would come in right now, take it instead of re-triggering
+                buffer = self._poll_buffer()
+                if buffer is not None:
+                    break
+                attempt += 1
+                self.wait_policy.record_retry()
+                print(f"No frame after {wait_ms} ms, re-triggering "
+                      f"(retry {attempt} of {self.wait_policy.max_retries})")
+                self.software_trigger()
+        # Latencies of explicit waits (concurrent triggers) would skew the estimate
+        latency = None
+        if timeout_ms is None and self._trigger_time is not None:
+            latency = time.perf_counter() - self._trigger_time
+        self._trigger_time = None
+        self.wait_policy.observe(latency, fixed=timeout_ms is not None)
+        if attempt:
+            # The missed trigger's frame may still arrive after the re-trigger's.
+            # Both show the same position, the second one is discarded so the
+            # next capture does not receive it
+            stale = self._poll_buffer(self.wait_policy.timeout_ms())
+            if stale is not None:
+                self._datastream.QueueBuffer(stale)
+                self.wait_policy.record_stale()
+                print("Discarded the late frame of a re-triggered capture")
+        print("Buffered image!")
+        metadata = self._frame_metadata(buffer)
+
+        # Get image from buffer (shallow copy)
+        self.ipl_image = ids_peak_ipl_extension.BufferToImage(buffer)
+        return buffer, self.ipl_image, metadata
+
+    def _poll_buffer(self, timeout_ms: int = 1):
+        """
+        :return: a finished buffer if one arrives within `timeout_ms`, otherwise None
+        """
+        try:
+            return self._datastream.WaitForFinishedBuffer(timeout_ms)
+        except ids_peak.TimeoutException:
+            return None
+
+    def _acquire_image(self, timeout_ms: int = None, gate: QualityGate = None):
+        """
+        Wait for the next buffer, convert it for display and hand it to the interface
+
+        :param timeout_ms: see _wait_for_image
+        :param gate: quality gate checked on the raw buffer before any other work
+        :return: (converted image, per-frame metadata, statistics, the frame
+                  save_image writes instead of the converted image: the
+                  dark/flat corrected frame, a raw copy or a PackedFrame,
+                  None to write the converted image).
+                  The converted image is None if the gate rejected the frame.
+        """
+        buffer, _, metadata = self._wait_for_image(timeout_ms)
+        # A view of the buffer, taken once the first step needs it: bit-packed
+        # formats are unpacked into a new array, a frame nobody reads raw is not
+        raw = None
+
+        if gate is not None and gate.enabled:
+            # Subsampled first, the full frame is unpacked only if it passes
+            result = gate.check_sample(raw_sample(self.ipl_image, gate.step),
+                                       pixel_max_value(self.ipl_image))
+            metadata["quality"] = result.as_dict()
+            if not result.passed:
+                self._datastream.QueueBuffer(buffer)
+                return None, metadata, None, None
+
+        # Corrected straight from the buffer memory into the corrector's
+        # preallocated output, before the buffer is queued again
+        stored = None
+        if self.flat_field:
+            corrector = self._corrector()
+            if corrector is not None:
+                if raw is None:
+                    raw = raw_array(self.ipl_image)
+                with profiler.section("flat_field"):
+                    stored = corrector.apply(raw)
+                metadata["flat_field_corrected"] = True
+        if stored is None and self.keep_image and self.raw_storage != "converted":
+            with profiler.section("raw_copy"):
+                stored = self._raw_for_storage(self.ipl_image, raw, metadata)
+
+        # This creates a deep copy of the image, so the buffer is free to be used again
+        # NOTE: Use `ImageConverter`, since the `ConvertTo` function re-allocates
+        #       the converison buffers on every call
+        with profiler.section("convert"):
+            converted_ipl_image = self._image_converter.Convert(
+                self.ipl_image, TARGET_PIXEL_FORMAT)
+        with profiler.section("statistics"):
+            stats = self.statistics.process(bgra_array(converted_ipl_image), 255, channels=3)
+        metadata["saturated_fraction"] = stats.saturated_fraction
+        metadata["mean"] = stats.mean
+        self._interface.on_statistics(stats)
+        with profiler.section("publish"):
+            self._publish(buffer, self.ipl_image, converted_ipl_image, metadata, raw)
+        return converted_ipl_image, metadata, stats, stored
+
+    def _raw_for_storage(self, image, raw, metadata):
+        """
+        Copy the raw frame out of the buffer for save_image, bit-packed if
+        raw_storage is "packed" and the format has 10 or 12 bits
+
+        :param raw: raw_array(image) if the caller already has it
+        :return: a PackedFrame or a numpy array
+        """
+        name = image.PixelFormat().Name()
+        shape = (image.Height(), image.Width())
+        metadata["pixel_format"] = name
+        if self.raw_storage == "packed":
+            if name in PACKED_FORMATS:
+                # Packed by the camera already, stored byte for byte
+                bits = PACKED_FORMATS[name]
+                data = image.get_numpy_1D()[:packed_size(shape[0] * shape[1], bits)].copy()
+                metadata["storage"] = "packed"
+                return PackedFrame(data, bits, shape)
+            if name in UNPACKED_FORMATS:
+                bits = UNPACKED_FORMATS[name]
+                metadata["storage"] = "packed"
+                return PackedFrame(pack(raw_array(image) if raw is None else raw, bits), bits, shape)
+        metadata["storage"] = "raw"
+        return raw_copy(image, raw)
+
+    def packed_pixel_format(self):
+        """
+        :return: the camera's packed variant of the current Mono10/Mono12
+                 format, e.g. "Mono12p", None if there is none or it is in use
+        """
+        current = self._node("PixelFormat").CurrentEntry().SymbolicValue()
+        if current not in UNPACKED_FORMATS:
+            return None
+        for entry in self._node("PixelFormat").Entries():
+            if (entry.SymbolicValue() == current + "p"
+                    and entry.AccessStatus() != ids_peak.NodeAccessStatus_NotAvailable
+                    and entry.AccessStatus() != ids_peak.NodeAccessStatus_NotImplemented
+                    and self.conversion_supported(entry.Value())):
+                return entry.SymbolicValue()
+        return None
+
+    def _run_directory(self):
         # Then print current working directory.
         cwd = os.getcwd()
         print("Current working dir :", cwd)
@@ -289,68 +1025,262 @@ class Camera:
         # Then print directory the image is being saved to.
         cwd1 = lines
         print("Saving image to dir :", cwd1)
+        return cwd1
 
-        buffer = self._datastream.WaitForFinishedBuffer(1000)
-        print("Buffered image!")
+    def acquire(self, timeout_ms: int = None):
+        """
+        Receive the triggered frame without gating or saving it
 
-        # Get image from buffer (shallow copy)
-        self.ipl_image = ids_peak_ipl_extension.BufferToImage(buffer)
+        :param timeout_ms: see _wait_for_image
+        :return: (converted image, metadata, statistics)
+        """
+        return self._acquire_image(timeout_ms)[:3]
 
-        # This creates a deep copy of the image, so the buffer is free to be used again
-        # NOTE: Use `ImageConverter`, since the `ConvertTo` function re-allocates
-        #       the converison buffers on every call
-        converted_ipl_image = self._image_converter.Convert(
-            self.ipl_image, TARGET_PIXEL_FORMAT)
-        self._interface.on_image_received(converted_ipl_image)
+    def save_image(self, timeout_ms: int = None):
+        """
+        Acquire the triggered frame and, if keep_image is set, write and journal it
 
-        self._datastream.QueueBuffer(buffer)
+        :return: (converted image, metadata, statistics), None if the
+                 quality gate rejected the frame
+        """
+        cwd1 = self._run_directory()
+
+        for attempt in range(1 + self.quality_retries):
+            if attempt > 0:
+                print(f"Retrying frame, attempt {attempt + 1} of {1 + self.quality_retries}")
+                self.software_trigger()
+            converted_ipl_image, metadata, stats, stored = self._acquire_image(
+                timeout_ms, gate=self.quality_gate)
+            if converted_ipl_image is not None:
+                break
+            self._interface.warning(f"Frame {metadata['frame_id']} rejected: "
+                                    f"{', '.join(metadata['quality']['reasons'])}")
+            if self.keep_image:
+                log_rejected(cwd1, metadata)
+        else:
+            # The position stays the first missing one, so the next trigger re-shoots it
+            self._interface.warning("No frame passed the quality gate, nothing was written")
+            return None
+        self._accepted += 1
 
         if self.keep_image:
-            print("Saving image...")
-            ids_peak_ipl.ImageWriter.WriteAsPNG(
-                self._valid_name(cwd1 + "/image", ".png"), converted_ipl_image)
-            print(".PNG Saved!")
-
-            if cwd1.startswith('I'):
-                print('i:drive selected for image storage')
-                cwd2 = cwd1 + '\\*'
-                print(cwd2)
-            elif cwd1.startswith('C'):
-                print('c:drive selected for image storage')
-                cwd2 = cwd1 + '/*'
-                print(cwd2)
+            journal = self.open_journal(cwd1)
+            # The journal keys the file on its LED position, the metadata
+            # keeps the frame's sequence_index next to it
+            index = self._claim_position(journal)
+            # A copy, the frame bus subscribers share the published dict
+            metadata = dict(metadata, position=index)
+            image_path = os.path.join(cwd1, f"image_{index}")
+
+            if isinstance(stored, PackedFrame):
+                print(f"Saving {stored.bits}-bit packed image...")
+                with profiler.section("write_packed"):
+                    saved_path = stored.write(image_path)
+                print("Packed frame saved!")
+            elif stored is not None:
+                # Reconstruction-ready float32 frame or raw sensor data
+                print("Saving corrected image..." if metadata.get("flat_field_corrected")
+                      else "Saving raw image...")
+                with profiler.section("write_array"):
+                    saved_path = write_array(image_path, stored)
+                print("Frame saved!")
+            else:
+                print("Saving image...")
+                with profiler.section("write_png"):
+                    ids_peak_ipl.ImageWriter.WriteAsPNG(image_path + ".png", converted_ipl_image)
+                print(".PNG Saved!")
+
+                with profiler.section("write_tif"):
+                    img = Image.open(image_path + ".png")
+                    saved_path = image_path + ".tif"
+                    img.save(saved_path)  # Saves new image as a .TIF file in folder
+                print(".TIF Saved!")
+
+            with profiler.section("journal"):
+                journal.record(index, saved_path, metadata)
+            print(f"Frame {index} journaled")
+        return converted_ipl_image, metadata, stats
+
+    def capture_bracketed(self):
+        """
+        Capture one frame per exposure in `bracket_exposures` back to back
+        and fuse them into one HDR frame on the worker thread
+        """
+        exposures = list(self.bracket_exposures)
+        frames = []
+        bracket_metadata = []
+        for bracket, exposure_us in enumerate(exposures):
+            self.set_exposure(exposure_us)
+            self.software_trigger()
+            buffer, image, metadata = self._wait_for_image()
+            frames.append(raw_copy(image))
+            if bracket < len(exposures) - 1:
+                self._datastream.QueueBuffer(buffer)
             else:
-                print('Error2: Path not found in either i:drive or c:drive!')
-
-            list_of_files = glob.glob(cwd2)  # * means all if need specific format then *.csv
-            latest_file = max(list_of_files, key=os.path.getctime) # Finds the most recently uploaded file in folder
-            print('Latest file:', latest_file) # Prints file name
-
-
-            img = Image.open(latest_file) # Opens file
-            image_filename = os.path.basename(latest_file)
-            print('Most recent image in folder:', image_filename)
-            image_number = re.findall(r'\d+', image_filename)
-            print('Image number:', image_number)
-
-            if cwd1.startswith('I'):
-                print('i:drive selected for image storage')
-                cwd3 = cwd1 + '\\'
-                print(cwd3)
-                img.save(cwd3 + 'image_' + image_number[0] + '.tif')  # Saves new image as a .TIF file in folder
-            elif cwd1.startswith('C'):
-                print('c:drive selected for image storage')
-                cwd3 = cwd1 + '/'
-                print(cwd3)
-                img.save(cwd3 + 'image_' + image_number[0] + '.tif')  # Saves new image as a .TIF file in folder
+                # Only the last bracket is converted, for the preview
+                max_value = pixel_max_value(image)
+                with profiler.section("convert"):
+                    converted_ipl_image = self._image_converter.Convert(image, TARGET_PIXEL_FORMAT)
+                self._publish(buffer, image, converted_ipl_image, metadata)
+            bracket_metadata.append(metadata)
+        self._accepted += 1
+
+        if not self.keep_image:
+            return
+        held = self._hold_for_writer(frames)
+        if held is None:
+            return
+        reservation, frames = held
+        run_dir = self._run_directory()
+        journal = self.open_journal(run_dir)
+        index = self._reserve_position(journal)
+        self._worker.submit(self._fuse_and_save, reservation, frames, exposures, max_value,
+                            run_dir, journal, index, bracket_metadata)
+
+    def _hold_for_writer(self, arrays):
+        """
+        Reserve write queue memory for `arrays`, blocking, dropping or
+        spilling them to disk according to the writer's memory policy
+
+        :return: (reservation, the arrays or their spilled stand-ins), None if dropped
+        """
+        reservation = self.memory.reserve("writer", sum(array.nbytes for array in arrays
+                                                        if array is not None))
+        if reservation is None:
+            self._interface.warning("Write queue is over its memory budget, frame dropped")
+            return None
+        if reservation.spilled:
+            arrays = [None if array is None else spill_array(array, self.memory) for array in arrays]
+        return reservation, arrays
+
+    def _fuse_and_save(self, reservation, frames, exposures, max_value, run_dir, journal, index,
+                       bracket_metadata):
+        try:
+            frames = [unspill(frame) for frame in frames]
+            with profiler.section("hdr_fuse"):
+                fused = self._hdr_fuser.fuse(frames, exposures, max_value, self.hdr_dtype)
+            image_path = os.path.join(run_dir, f"image_{index}")
+            with profiler.section("write_array"):
+                if self.keep_brackets:
+                    for bracket, frame in enumerate(frames):
+                        write_array(f"{image_path}_bracket_{bracket}", frame)
+                path = write_array(image_path, fused)
+            journal.record(index, path, {
+                "hdr": True,
+                "exposures_us": exposures,
+                "brackets": bracket_metadata,
+            })
+            print(f"HDR frame {index} journaled")
+        except Exception as e:
+            self._interface.warning(f"HDR fusion of frame {index} failed: {str(e)}")
+        finally:
+            reservation.release()
+            self._release_position(index)
+
+    def capture_accumulated(self):
+        """
+        Capture `accumulate_frames` frames back to back, sum them straight
+        from the buffer memory and write only their mean (and variance)
+        """
+        count = self.accumulate_frames
+        frame_metadata = []
+        for frame in range(count):
+            self.software_trigger()
+            buffer, image, metadata = self._wait_for_image()
+            raw = raw_array(image)
+            if frame == 0:
+                self._accumulator.reset(raw.shape, self.accumulate_variance)
+            with profiler.section("accumulate"):
+                self._accumulator.add(raw)
+            frame_metadata.append(metadata)
+            if frame == count - 1:
+                # Only the last frame is converted, for the preview
+                with profiler.section("convert"):
+                    converted_ipl_image = self._image_converter.Convert(image, TARGET_PIXEL_FORMAT)
+                self._publish(buffer, image, converted_ipl_image, metadata)
             else:
-                print('Error3: Path not found in either i:drive or c:drive!')
-            print(".TIF Saved!")
+                self._datastream.QueueBuffer(buffer)
+        self._accepted += 1
+
+        if not self.keep_image:
+            return
+        mean = self._accumulator.mean()
+        variance = self._accumulator.variance() if self.accumulate_variance else None
+        metadata = {
+            "accumulated": count,
+            "variance": variance is not None,
+            "frames": frame_metadata,
+        }
+        if self.flat_field:
+            corrector = self._corrector()
+            if corrector is not None:
+                corrector.apply(mean, out=mean)
+                metadata["flat_field_corrected"] = True
+        held = self._hold_for_writer([mean, variance])
+        if held is None:
+            return
+        reservation, (mean, variance) = held
+        run_dir = self._run_directory()
+        journal = self.open_journal(run_dir)
+        index = self._reserve_position(journal)
+        self._worker.submit(self._save_accumulated, reservation, mean, variance, run_dir, journal,
+                            index, metadata)
+
+    def _save_accumulated(self, reservation, mean, variance, run_dir, journal, index, metadata):
+        try:
+            mean, variance = unspill(mean), unspill(variance)
+            image_path = os.path.join(run_dir, f"image_{index}")
+            with profiler.section("write_array"):
+                if variance is not None:
+                    write_array(f"{image_path}_variance", variance)
+                path = write_array(image_path, mean)
+            journal.record(index, path, metadata)
+            print(f"Mean of {metadata['accumulated']} frames journaled as frame {index}")
+        except Exception as e:
+            self._interface.warning(f"Saving accumulated frame {index} failed: {str(e)}")
+        finally:
+            reservation.release()
+            self._release_position(index)
+
+    @property
+    def make_image(self):
+        """
+        Set to request a capture, wait_for_signal clears it when the capture is done
+        """
+        return self._make_image
+
+    @make_image.setter
+    def make_image(self, value: bool):
+        with self._make_image_changed:
+            self._make_image = value
+            self._make_image_changed.notify_all()
+
+    def wait_until_idle(self, timeout: float = None):
+        """
+        Block until the requested capture is done
+
+        :return: False if it is still running after `timeout` seconds
+        """
+        with self._make_image_changed:
+            return self._make_image_changed.wait_for(lambda: not self._make_image, timeout)
 
     def wait_for_signal(self):
         while not self.killed:
+            with self._make_image_changed:
+                # The timeout only bounds how late `killed` is noticed
+                self._make_image_changed.wait_for(lambda: self._make_image, 0.1)
             try:
                 if self.make_image is True:
+                    if self.bracket_exposures:
+                        self.capture_bracketed()
+                        self.make_image = False
+                        continue
+                    # Use the calibrated exposure of the LED position
+                    self.apply_exposure_table()
+                    if self.accumulate_frames > 1:
+                        self.capture_accumulated()
+                        self.make_image = False
+                        continue
                     # Call software trigger to load image
                     self.software_trigger()
                     # Get image and save it as file, if that option is enabled
@@ -0,0 +1,198 @@
+# \file    capture_journal.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Append-only journal of the frames of an acquisition run, used to
+#          resume a run after a crash without re-shooting completed frames
+#
+# \version 1.0
+#
+# One JSON object per line. A frame is only journaled after its file has been
+# written (and, depending on the fsync policy, flushed to disk), so every
+# entry in the journal refers to a complete file. A torn last line from a
+# crash is ignored when the journal is re-opened.
+
+import json
+import os
+import time
+import zlib
+
+
+JOURNAL_NAME = "capture_journal.jsonl"
+FSYNC_POLICIES = ("frame", "batch", "none")
+CHUNK_SIZE = 1 << 20
+
+
+def file_checksum(path: str, offset: int = 0, size: int = None):
+    """
+    :return: (size, "crc32:xxxxxxxx") of `size` bytes of `path` starting at `offset`
+    """
+    crc = 0
+    total = 0
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while size is None or total < size:
+            chunk = f.read(CHUNK_SIZE if size is None else min(CHUNK_SIZE, size - total))
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+            total += len(chunk)
+    return total, f"crc32:{crc:08x}"
+
+
+def fsync_path(path: str):
+    """
+    Flush a file that was written by another library (ImageWriter, PIL) to disk
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_directory(path: str):
+    # Makes new directory entries durable, not possible on Windows
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def read_journal(path: str):
+    """
+    :param path: journal file
+    :return: frame index -> journal entry, the latest entry wins
+    """
+    entries = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Torn write from a crash, the frame will be re-captured
+                continue
+            entries[entry["index"]] = entry
+    return entries
+
+
+class CaptureJournal:
+    """
+    Journal of one run directory.
+
+    fsync policies:
+      "frame" - frame file and journal line are fsynced for every frame
+      "batch" - frame files are fsynced, the journal every `batch_size` frames
+      "none"  - rely on the OS, fastest but frames may be lost on power failure
+    """
+
+    def __init__(self, run_dir: str, fsync: str = "frame", batch_size: int = 16):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: `{fsync}`")
+        self.run_dir = run_dir
+        self.path = os.path.join(run_dir, JOURNAL_NAME)
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.entries = {}
+        self._unsynced = 0
+        # Files whose directory entry has been fsynced
+        self._durable_files = set()
+
+        self._load()
+        new_file = not os.path.exists(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        if new_file and self.fsync != "none":
+            _fsync_directory(run_dir)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        self.entries = read_journal(self.path)
+        # Make sure the next record starts on a fresh line
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def record(self, index: int, path: str, metadata: dict = None,
+               offset: int = 0, size: int = None):
+        """
+        Journal a frame whose file has been completely written
+
+        :param index: frame index within the run (LED position)
+        :param path: file holding the frame
+        :param metadata: JSON serializable per-frame metadata
+        :param offset: byte offset of the frame within `path`
+        :param size: byte size of the frame, None for the rest of the file
+        """
+        if self.fsync != "none":
+            fsync_path(path)
+            # A new file's directory entry has to be durable before the journal refers to it
+            path_key = os.path.abspath(path)
+            if path_key not in self._durable_files:
+                _fsync_directory(os.path.dirname(path_key))
+                self._durable_files.add(path_key)
+        size, checksum = file_checksum(path, offset, size)
+        entry = {
+            "index": index,
+            "file": os.path.relpath(path, self.run_dir),
+            "offset": offset,
+            "size": size,
+            "checksum": checksum,
+            "time": time.time(),
+            "metadata": metadata or {},
+        }
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self.fsync == "frame" or (self.fsync == "batch" and self._unsynced >= self.batch_size):
+            self.sync()
+        self.entries[index] = entry
+
+    def sync(self):
+        if self._unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def verify(self, index: int):
+        """
+        :return: True if the journaled file of `index` still matches its checksum
+        """
+        entry = self.entries.get(index)
+        if entry is None:
+            return False
+        path = os.path.join(self.run_dir, entry["file"])
+        if not os.path.exists(path):
+            return False
+        return file_checksum(path, entry["offset"], entry["size"])[1] == entry["checksum"]
+
+    def is_complete(self, index: int):
+        return index in self.entries
+
+    def first_missing(self, start: int = 0):
+        """
+        :return: the lowest frame index >= `start` that has not been journaled
+        """
+        index = start
+        while index in self.entries:
+            index += 1
+        return index
+
+    def missing(self, count: int):
+        """
+        :return: indices below `count` that still have to be captured
+        """
+        return [index for index in range(count) if index not in self.entries]
+
+    def close(self):
+        if self._file is not None:
+            if self.fsync != "none":
+                self.sync()
+            self._file.close()
+            self._file = None
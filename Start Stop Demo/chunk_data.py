@@ -0,0 +1,122 @@
+# \file    chunk_data.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Per-frame exposure, gain, timestamp and frame ID from GenICam chunk
+#          data, with cached node values for devices without chunks
+#
+# \version 1.0
+#
+# With chunk mode active the device appends the selected values to every
+# payload. UpdateChunkNodes parses them from the buffer on the host, so no
+# GenICam transaction happens on the capture path.
+
+from ids_peak import ids_peak
+
+
+# Chunk selector entry -> metadata key
+CHUNK_FIELDS = {
+    "ExposureTime": "exposure_us",
+    "Gain": "gain",
+    "Timestamp": "device_timestamp_ns",
+    "FrameID": "device_frame_id",
+}
+
+
+def _available(entry):
+    return (entry.AccessStatus() != ids_peak.NodeAccessStatus_NotAvailable
+            and entry.AccessStatus() != ids_peak.NodeAccessStatus_NotImplemented)
+
+
+class ChunkReader:
+    """
+    Reads the chunk values of each buffer. Without chunk data (unsupported
+    device, chunk mode off, or a buffer without chunks) the last cached
+    node values are reported instead, marked with metadata_source "cached".
+    """
+
+    def __init__(self):
+        self.active = False
+        self.fields = []
+        self._nodes = {}
+        self._cached = {}
+        self.chunk_frames = 0
+        self.cached_frames = 0
+
+    def enable(self, node_map, fields=tuple(CHUNK_FIELDS)):
+        """
+        Activate chunk mode and enable the supported `fields`. Has to run
+        while the transport layer parameters are unlocked and before the
+        buffers are allocated, chunks enlarge the PayloadSize.
+
+        :return: the enabled chunk fields, empty if the device has no chunk support
+        """
+        self.active = False
+        self.fields = []
+        self._nodes = {}
+        try:
+            selector = node_map.FindNode("ChunkSelector")
+            entries = {entry.SymbolicValue() for entry in selector.Entries() if _available(entry)}
+            node_map.FindNode("ChunkModeActive").SetValue(True)
+            for field in fields:
+                if field not in entries:
+                    continue
+                selector.SetCurrentEntry(field)
+                node_map.FindNode("ChunkEnable").SetValue(True)
+                self._nodes[field] = node_map.FindNode("Chunk" + field)
+                self.fields.append(field)
+        except ids_peak.Exception as e:
+            print(f"Chunk data not available, using cached node values: {str(e)}")
+            return []
+        self.active = bool(self.fields)
+        print(f"Chunk data: {', '.join(self.fields) if self.fields else 'none'}")
+        return self.fields
+
+    def disable(self, node_map):
+        try:
+            node_map.FindNode("ChunkModeActive").SetValue(False)
+        except ids_peak.Exception:
+            pass
+        self.active = False
+
+    def cache(self, key: str, value):
+        """
+        Remember a node value the application read or wrote anyway,
+        e.g. the exposure after set_exposure
+        """
+        self._cached[key] = value
+
+    def refresh_cache(self, node_map):
+        """
+        Read the fallback values from the nodes, once per acquisition start
+        """
+        for field, key in (("ExposureTime", "exposure_us"), ("Gain", "gain")):
+            try:
+                self._cached[key] = node_map.FindNode(field).Value()
+            except ids_peak.Exception:
+                pass
+
+    def read(self, node_map, buffer) -> dict:
+        """
+        :return: metadata of `buffer`, chunk values where available
+        """
+        if self.active and buffer.HasChunks():
+            try:
+                node_map.UpdateChunkNodes(buffer)
+                metadata = dict(self._cached)
+                for field, node in self._nodes.items():
+                    metadata[CHUNK_FIELDS[field]] = node.Value()
+                metadata["metadata_source"] = "chunk"
+                self.chunk_frames += 1
+                return metadata
+            except ids_peak.Exception as e:
+                print(f"Cannot parse chunk data: {str(e)}")
+        self.cached_frames += 1
+        return dict(self._cached, metadata_source="cached")
+
+    def counters(self):
+        return {
+            "chunk_fields": ",".join(self.fields) or "none",
+            "chunk_frames": self.chunk_frames,
+            "cached_frames": self.cached_frames,
+        }
@@ -21,9 +21,13 @@
 #
 # General permission to copy or modify is hereby granted.
 
+import numpy as np
 from ids_peak import ids_peak
 
-from camera import Camera
+from camera import Camera, RAW_STORAGE_MODES
+from exposure_table import DEFAULT_TARGET
+from load_test import DEFAULT_DURATION_S, LoadTest
+from profiling import profiler
 
 
 class Interface:
@@ -45,6 +49,24 @@ class Interface:
             "\"stop\" stop acquisition.\n"
             "\"save True|False\" wether captured images should be saved to a file.\n"
             "\"pixelformat\" change the pixelformat.\n"
+            "\"resume <run directory>\" continue an interrupted run at its first missing frame.\n"
+            "\"autoexposure <positions> [target]\" calibrate and cache an exposure per LED position.\n"
+            "\"exposuretable load|off\" use the cached exposure table or the current exposure.\n"
+            "\"bracket <exposure us>,<exposure us>,... [float32|uint16] [keep]|off\" HDR bracketing per trigger.\n"
+            "\"average <frames> [variance]|off\" save the mean of several frames per trigger.\n"
+            "\"quality on|off [min mean %] [max saturated %] [max similarity]\" reject bad frames before saving.\n"
+            "\"quality retries <n>\" re-trigger up to n times after a rejected frame.\n"
+            "\"calibrate dark|flat <frames>\" capture and cache a dark or flat master frame.\n"
+            "\"correction on|off\" dark/flat correct frames before saving.\n"
+            "\"storage converted|raw|packed\" save frames as PNG/TIF, raw sensor data or bit-packed 10/12 bit.\n"
+            "\"loadtest <Hz>|ramp <start Hz> <end Hz>|search <low Hz> <high Hz> [seconds] [save]\" trigger storm,\n"
+            "    search reports the highest sustainable trigger rate.\n"
+            "\"memory [policy <stage> block|drop|spill]\" show bytes in flight or set a stage's memory policy.\n"
+            "\"profile start [directory] [nomemory]|stop\" profile the acquisition hot path, stop writes\n"
+            "    a flamegraph-compatible .collapsed stack file and a section/allocation report.\n"
+            "\"stats\" show exposure statistics of the last frame.\n"
+            "\"frames\" show dropped/duplicate frame counters, missing positions and frame bus subscribers.\n"
+            "\"stream host:port|unix:/path [zlib|lz4]|off\" stream frames to remote consumers.\n"
             "\"exit\" close the program\n"
             "\"help\" display this text"
         )
@@ -94,6 +116,45 @@ class Interface:
                 selected = -1
         self.__camera.change_pixel_format(available_options[selected])
 
+    def load_test(self, args):
+        save = "save" in args
+        args = [arg for arg in args if arg != "save"]
+        try:
+            if args and args[0] in ("ramp", "search"):
+                mode, rates, duration = args[0], [float(arg) for arg in args[1:3]], args[3:4]
+                if len(rates) != 2:
+                    raise ValueError
+            else:
+                mode, rates, duration = "rate", [float(args[0])], args[1:2]
+            duration_s = float(duration[0]) if duration else DEFAULT_DURATION_S
+        except (ValueError, IndexError):
+            print("Missing argument! Usage: loadtest <Hz>|ramp <start Hz> <end Hz>|"
+                  "search <low Hz> <high Hz> [seconds] [save]")
+            return
+        if not self.acquisition_check_and_set():
+            return
+        if save and not self.__camera.keep_image:
+            print("Saving is disabled, use \"save True\" for a save mode load test")
+            return
+
+        test = LoadTest(self.__camera, save)
+        key = self.__camera.configuration_key()
+        configuration = ("{pixel_format}, ROI {width}x{height}+{offset_x}+{offset_y}, ".format(**key)
+                         + ("saving" if save else "no saving"))
+        try:
+            if mode == "search":
+                capacity = test.find_capacity(rates[0], rates[1], duration_s)
+                print(f"Capacity: {capacity:.1f} Hz ({configuration})")
+            elif mode == "ramp":
+                result = test.run(rates[0], duration_s, end_rate_hz=rates[1])
+                print(result.summary())
+                if result.first_drop_rate_hz is not None:
+                    print(f"First frame lost at {result.first_drop_rate_hz:.1f} Hz ({configuration})")
+            else:
+                print(test.run(rates[0], duration_s).summary() + f" ({configuration})")
+        except Exception as e:
+            print(f"Load test failed: {str(e)}")
+
     def start_interface(self):
         self.print_help()
         try:
@@ -110,8 +171,9 @@ class Interface:
                         print("Acquisition not started... Skipping trigger command!")
                         continue
                     self.__camera.make_image = True
-                    # wait until image has been made
-                    while self.__camera.make_image:
+                    # wait until image has been made, in short waits so a
+                    # remote camera's preview pump is not held up meanwhile
+                    while not self.__camera.wait_until_idle(0.1):
                         pass
 
                 elif var[0] == "save":
@@ -140,6 +202,200 @@ class Interface:
                         continue
                     self.change_pixelformat()
 
+                elif var[0] == "resume":
+                    if len(var) < 2:
+                        print("Missing argument! Usage: resume <run directory>")
+                        continue
+                    try:
+                        index = self.__camera.resume_run(" ".join(var[1:]))
+                        print(f"Resuming run at frame {index}")
+                    except ValueError as e:
+                        print(str(e))
+
+                elif var[0] == "autoexposure":
+                    if len(var) < 2 or not var[1].isdigit():
+                        print("Missing argument! Usage: autoexposure <positions> [target 0..1]")
+                        continue
+                    if not self.acquisition_check_and_set():
+                        continue
+                    try:
+                        target = float(var[2]) if len(var) > 2 else DEFAULT_TARGET
+                        self.__camera.calibrate_exposures(
+                            range(int(var[1])), target,
+                            lambda position: input(f"Switch to LED position {position} and press Enter"))
+                    except Exception as e:
+                        print(f"Auto-exposure failed: {str(e)}")
+
+                elif var[0] == "exposuretable":
+                    if len(var) > 1 and var[1] == "off":
+                        self.__camera.exposure_table = None
+                        print("Exposure table: Disabled")
+                    elif self.__camera.load_exposure_table() is None:
+                        print("No cached exposure table for this camera configuration.")
+
+                elif var[0] == "bracket":
+                    if len(var) < 2:
+                        print("Missing argument! Usage: bracket <exposure us>,<exposure us>,... "
+                              "[float32|uint16] [keep]|off")
+                        continue
+                    if var[1] == "off":
+                        self.__camera.bracket_exposures = None
+                        print("Exposure bracketing: Disabled")
+                        continue
+                    try:
+                        exposures = [float(value) for value in var[1].split(",")]
+                    except ValueError:
+                        print("Exposures must be comma separated numbers in microseconds")
+                        continue
+                    self.__camera.hdr_dtype = np.uint16 if "uint16" in var[2:] else np.float32
+                    self.__camera.keep_brackets = "keep" in var[2:]
+                    self.__camera.bracket_exposures = exposures
+                    print(f"Exposure bracketing: {len(exposures)} exposures per trigger")
+
+                elif var[0] == "average":
+                    if len(var) < 2 or not (var[1] == "off" or var[1].isdigit()):
+                        print("Missing argument! Usage: average <frames> [variance]|off")
+                        continue
+                    if var[1] == "off" or int(var[1]) <= 1:
+                        self.__camera.accumulate_frames = 1
+                        print("Frame averaging: Disabled")
+                        continue
+                    self.__camera.accumulate_variance = "variance" in var[2:]
+                    self.__camera.accumulate_frames = int(var[1])
+                    print(f"Frame averaging: mean of {var[1]} frames per trigger"
+                          f"{' with variance' if self.__camera.accumulate_variance else ''}")
+
+                elif var[0] == "quality":
+                    gate = self.__camera.quality_gate
+                    if len(var) < 2 or var[1] not in ("on", "off", "retries"):
+                        print("Missing argument! Usage: quality on|off [min mean %] [max saturated %] "
+                              "[max similarity] or quality retries <n>")
+                        continue
+                    if var[1] == "retries":
+                        if len(var) < 3 or not var[2].isdigit():
+                            print("Missing argument! Usage: quality retries <n>")
+                            continue
+                        self.__camera.quality_retries = int(var[2])
+                        print(f"Quality gate retries: {var[2]}")
+                        continue
+                    gate.enabled = var[1] == "on"
+                    try:
+                        # "-" keeps a limit, "none" disables the check
+                        limits = [gate.min_mean, gate.max_saturated, gate.max_similarity]
+                        scales = [100.0, 100.0, 1.0]
+                        for i, value in enumerate(var[2:5]):
+                            if value == "none":
+                                limits[i] = None
+                            elif value != "-":
+                                limits[i] = float(value) / scales[i]
+                        gate.min_mean, gate.max_saturated, gate.max_similarity = limits
+                    except ValueError:
+                        print("Limits must be numbers, \"-\" or \"none\"")
+                        continue
+                    gate.reset()
+                    print(f"Quality gate: {'Enabled' if gate.enabled else 'Disabled'} ({gate.summary()})")
+
+                elif var[0] == "calibrate":
+                    if len(var) < 3 or var[1] not in ("dark", "flat") or not var[2].isdigit():
+                        print("Missing argument! Usage: calibrate dark|flat <frames>")
+                        continue
+                    if not self.acquisition_check_and_set():
+                        continue
+                    if var[1] == "dark":
+                        input("Switch the illumination off and press Enter")
+                    else:
+                        input("Set up uniform illumination without sample and press Enter")
+                    try:
+                        if var[1] == "dark":
+                            self.__camera.calibrate_dark(int(var[2]))
+                        else:
+                            self.__camera.calibrate_flat(int(var[2]))
+                    except Exception as e:
+                        print(f"Calibration failed: {str(e)}")
+
+                elif var[0] == "correction":
+                    if len(var) < 2 or var[1] not in ("on", "off"):
+                        print("Missing argument! Usage: correction on|off")
+                        continue
+                    self.__camera.flat_field = var[1] == "on"
+                    print(f"Dark/flat correction: {'Enabled' if self.__camera.flat_field else 'Disabled'}")
+
+                elif var[0] == "storage":
+                    if len(var) < 2 or var[1] not in RAW_STORAGE_MODES:
+                        print(f"Missing argument! Usage: storage {'|'.join(RAW_STORAGE_MODES)}")
+                        continue
+                    self.__camera.raw_storage = var[1]
+                    print(f"Frame storage: {var[1]}")
+                    if var[1] == "packed":
+                        packed_format = self.__camera.packed_pixel_format()
+                        if packed_format is not None:
+                            print(f"Tip: select {packed_format} with \"pixelformat\" to let the camera "
+                                  f"pack the frames, they are then stored without packing on the host.")
+
+                elif var[0] == "loadtest":
+                    self.load_test(var[1:])
+
+                elif var[0] == "memory":
+                    memory = self.__camera.memory
+                    if len(var) >= 4 and var[1] == "policy":
+                        try:
+                            memory.set_policy(var[2], var[3])
+                        except (KeyError, ValueError) as e:
+                            print(f"Cannot set memory policy: {str(e)}")
+                            continue
+                    print(memory.status_text())
+                    for name, stage in memory.report()["stages"].items():
+                        print(f"  {name}: " + ", ".join(f"{key}: {value}" for key, value in stage.items()))
+
+                elif var[0] == "profile":
+                    if len(var) < 2 or var[1] not in ("start", "stop"):
+                        print("Missing argument! Usage: profile start [directory] [nomemory]|stop")
+                        continue
+                    if var[1] == "stop":
+                        if profiler.stop() is None:
+                            print("Profiling is not running.")
+                        continue
+                    options = var[2:]
+                    trace_memory = "nomemory" not in options
+                    directories = [option for option in options if option != "nomemory"]
+                    profiler.start(directories[0] if directories else None, trace_memory)
+
+                elif var[0] == "stats":
+                    stats = self.__camera.statistics.last
+                    if stats is None:
+                        print("No frame captured yet.")
+                        continue
+                    print(stats.summary())
+                    print(f"99th percentile: {stats.percentile(99):.1f} of {stats.max_value}")
+
+                elif var[0] == "frames":
+                    sequence = self.__camera.sequence
+                    print(", ".join(f"{key}: {value}"
+                                    for key, value in sequence.counters().items()))
+                    if sequence.missing_indices:
+                        print(f"Missing positions: {sequence.missing_indices}")
+                    print(", ".join(f"{key}: {value}"
+                                    for key, value in self.__camera.chunks.counters().items()))
+                    print(", ".join(f"{key}: {value}"
+                                    for key, value in self.__camera.wait_policy.counters().items()))
+                    for name, counters in self.__camera.frame_bus.statistics().items():
+                        print(f"Subscriber {name}: " + ", ".join(
+                            f"{key}: {value}" for key, value in counters.items()))
+
+                elif var[0] == "stream":
+                    if len(var) < 2:
+                        print("Missing argument! Usage: stream host:port|unix:/path [zlib|lz4]|off")
+                        continue
+                    if var[1] == "off":
+                        self.__camera.stop_frame_server()
+                        print("Streaming: Disabled")
+                        continue
+                    try:
+                        self.__camera.start_frame_server(
+                            var[1], var[2] if len(var) > 2 else None)
+                    except (OSError, ValueError) as e:
+                        print(f"Cannot start streaming: {str(e)}")
+
                 elif var[0] == "exit":
                     break
                 else:
@@ -157,6 +413,12 @@ class Interface:
     def on_image_received(self, image):
         pass
 
+    def on_statistics(self, stats):
+        if stats.empty:
+            print("Warning: frame is (nearly) empty")
+        elif stats.saturated_fraction > 0.01:
+            print(f"Warning: {stats.saturated_fraction * 100:.1f} % of the pixels are saturated")
+
     def warning(self, message: str):
         print(f"Warning: {message}")
 
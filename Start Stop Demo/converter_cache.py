@@ -0,0 +1,58 @@
+# \file    converter_cache.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Small LRU cache of pre-allocated image converters, so switching
+#          between pixel formats does not re-allocate conversion buffers
+#
+# \version 1.0
+
+import collections
+
+from ids_peak_ipl import ids_peak_ipl
+
+
+DEFAULT_CAPACITY = 4
+
+
+class ConverterCache:
+    """
+    One ImageConverter per (input format, output format, width, height),
+    with its conversion buffers pre-allocated. The least recently used
+    converter is dropped, which frees its buffers, once more than
+    `capacity` configurations were used.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._converters = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._converters)
+
+    def get(self, input_format: int, output_format: int, width: int, height: int):
+        """
+        :param input_format: value of the camera's PixelFormat entry
+        :param output_format: ids_peak_ipl pixel format name of the converted image
+        :return: an ImageConverter prepared for the conversion
+        """
+        key = (input_format, output_format, width, height)
+        converter = self._converters.get(key)
+        if converter is not None:
+            self._converters.move_to_end(key)
+            self.hits += 1
+            return converter
+
+        self.misses += 1
+        converter = ids_peak_ipl.ImageConverter()
+        converter.PreAllocateConversion(
+            ids_peak_ipl.PixelFormat(input_format), output_format, width, height)
+        self._converters[key] = converter
+        while len(self._converters) > self.capacity:
+            self._converters.popitem(last=False)
+        return converter
+
+    def clear(self):
+        self._converters.clear()
@@ -0,0 +1,251 @@
+# \file    dataset.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Reader for acquisition runs: frames as a lazily loaded, indexable
+#          sequence with metadata, background prefetching and an LRU decode
+#          cache with a byte budget
+#
+# \version 1.0
+#
+# Usage:
+#     with open_run(run_dir) as frames:
+#         stack = frames[0:49]            # (49, h, w) numpy stack
+#         image, metadata = frames[7], frames.metadata(7)
+
+import collections
+import glob
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+from bitpack import EXTENSION as BITPACK_EXTENSION, read_packed
+from capture_journal import JOURNAL_NAME, read_journal
+
+
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+DEFAULT_PREFETCH_THREADS = 2
+# Frames decoded ahead of the last accessed one
+DEFAULT_PREFETCH_AHEAD = 8
+
+
+def decode_file(path: str) -> np.ndarray:
+    """
+    Read one frame file (.tif, .png, .npy, .bitpack) into a numpy array
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return np.load(path)
+    if extension == BITPACK_EXTENSION:
+        # 10/12 bit packed frames are unpacked to uint16
+        return read_packed(path)
+    if extension in (".tif", ".tiff") and tifffile is not None:
+        return tifffile.imread(path)
+    with Image.open(path) as image:
+        return np.asarray(image)
+
+
+def _legacy_entries(run_dir: str):
+    """
+    Entries of a run recorded before the capture journal existed, ordered by
+    the number in the file name
+    """
+    entries = {}
+    for path in glob.glob(os.path.join(run_dir, "image_*.tif")):
+        match = re.fullmatch(r"image_(\d+)\.tif", os.path.basename(path))
+        if match:
+            entries[int(match.group(1))] = {"index": int(match.group(1)),
+                                            "file": os.path.basename(path), "metadata": {}}
+    return entries
+
+
+class _DecodeCache:
+    """
+    LRU cache of decoded frames, bounded by their total size in bytes
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._frames = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, index: int):
+        with self._lock:
+            frame = self._frames.get(index)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(index)
+            self.hits += 1
+            return frame
+
+    def __contains__(self, index: int):
+        with self._lock:
+            return index in self._frames
+
+    def __len__(self):
+        return len(self._frames)
+
+    def put(self, index: int, frame: np.ndarray):
+        if frame.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if index in self._frames:
+                return
+            self._frames[index] = frame
+            self.bytes += frame.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self.bytes = 0
+
+
+class Dataset:
+    """
+    The frames of one run directory in journal order. Positions 0..len-1
+    map to the journaled frame indices in ascending order, see `indices`.
+
+    Frames are decoded on first access and returned read-only, since the
+    same array is shared through the cache.
+    """
+
+    def __init__(self, run_dir: str, cache_bytes: int = DEFAULT_CACHE_BYTES,
+                 prefetch_threads: int = DEFAULT_PREFETCH_THREADS,
+                 prefetch_ahead: int = DEFAULT_PREFETCH_AHEAD):
+        """
+        :param cache_bytes: budget of the decode cache, 0 to disable caching
+        :param prefetch_threads: decoder threads, 0 to decode on the calling thread only
+        :param prefetch_ahead: frames decoded in the background after each access
+        """
+        self.run_dir = run_dir
+        journal_path = os.path.join(run_dir, JOURNAL_NAME)
+        if os.path.exists(journal_path):
+            self._entries = read_journal(journal_path)
+        else:
+            self._entries = _legacy_entries(run_dir)
+        self.indices = sorted(self._entries)
+        self.prefetch_ahead = prefetch_ahead if prefetch_threads > 0 else 0
+        self._cache = _DecodeCache(cache_bytes)
+        self._executor = ThreadPoolExecutor(prefetch_threads, thread_name_prefix="dataset") \
+            if prefetch_threads > 0 else None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.read(*key.indices(len(self)))
+        position = key + len(self) if key < 0 else key
+        if not 0 <= position < len(self):
+            raise IndexError(f"Frame {key} out of range for {len(self)} frames")
+        frame = self._load(position)
+        self._prefetch(range(position + 1, min(position + 1 + self.prefetch_ahead, len(self))))
+        return frame
+
+    def path(self, position: int) -> str:
+        return os.path.join(self.run_dir, self._entries[self.indices[position]]["file"])
+
+    def metadata(self, position: int) -> dict:
+        """
+        Journal entry of the frame: frame index, file, checksum and the
+        capture metadata (frame ID, timestamp, exposure, ...)
+        """
+        return self._entries[self.indices[position]]
+
+    def _decode(self, position: int) -> np.ndarray:
+        frame = decode_file(self.path(position))
+        frame.flags.writeable = False
+        self._cache.put(position, frame)
+        return frame
+
+    def _decode_pending(self, position: int):
+        try:
+            return self._decode(position)
+        finally:
+            with self._lock:
+                self._pending.pop(position, None)
+
+    def _load(self, position: int) -> np.ndarray:
+        frame = self._cache.get(position)
+        if frame is not None:
+            return frame
+        with self._lock:
+            future = self._pending.get(position)
+        if future is not None:
+            return future.result()
+        return self._decode(position)
+
+    def _prefetch(self, positions):
+        if self._executor is None:
+            return
+        with self._lock:
+            for position in positions:
+                if position not in self._pending and position not in self._cache:
+                    self._pending[position] = self._executor.submit(self._decode_pending, position)
+
+    def read(self, start: int, stop: int, step: int = 1, out: np.ndarray = None) -> np.ndarray:
+        """
+        Read frames start:stop:step into one (n, ...) stack, decoding in
+        parallel on the prefetch threads
+
+        :param out: preallocated stack to fill, allocated from the first frame if None
+        """
+        positions = range(start, stop, step)
+        if len(positions) == 0:
+            raise ValueError("Empty frame range")
+        first = self._load(positions[0])
+        if out is None:
+            out = np.empty((len(positions),) + first.shape, first.dtype)
+        elif out.shape != (len(positions),) + first.shape:
+            raise ValueError(f"Output shape {out.shape} does not match "
+                             f"{(len(positions),) + first.shape}")
+        out[0] = first
+        self._prefetch(positions[1:])
+        for slot, position in enumerate(positions[1:], 1):
+            out[slot] = self._load(position)
+        return out
+
+    def cache_info(self):
+        return {"frames": len(self._cache), "bytes": self._cache.bytes,
+                "hits": self._cache.hits, "misses": self._cache.misses}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._cache.clear()
+
+
+def open_run(run_dir: str, **kwargs) -> Dataset:
+    """
+    See Dataset
+    """
+    return Dataset(run_dir, **kwargs)
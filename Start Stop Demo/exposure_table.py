@@ -0,0 +1,140 @@
+# \file    exposure_table.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Per-LED-position exposure table: auto-exposure calibration and an
+#          on-disk cache keyed by the camera configuration
+#
+# \version 1.0
+
+import json
+import os
+
+
+TABLE_DIRECTORY = "exposure_tables"
+DEFAULT_TARGET = 0.7
+DEFAULT_PERCENTILE = 99.0
+DEFAULT_TOLERANCE = 0.05
+MAX_ITERATIONS = 8
+# Largest correction applied in one iteration, keeps noisy frames from overshooting
+MAX_STEP_FACTOR = 4.0
+# More saturated pixels than this make the percentile meaningless: cut the exposure hard
+SATURATION_LIMIT = 0.002
+
+
+def table_path(key: dict, directory: str = TABLE_DIRECTORY) -> str:
+    """
+    :param key: camera configuration, see Camera.configuration_key
+    :return: cache file of the exposure table for `key`
+    """
+    name = "{serial}_{pixel_format}_{width}x{height}+{offset_x}+{offset_y}.json".format(**key)
+    return os.path.join(directory, name)
+
+
+class ExposureTable:
+    def __init__(self, key: dict = None, exposures: dict = None, target: float = DEFAULT_TARGET,
+                 percentile: float = DEFAULT_PERCENTILE):
+        """
+        :param key: camera configuration the table was calibrated for
+        :param exposures: LED position -> exposure time in microseconds
+        :param target: target level of `percentile` as a fraction of full scale
+        """
+        self.key = key or {}
+        self.exposures = exposures or {}
+        self.target = target
+        self.percentile = percentile
+
+    def __len__(self):
+        return len(self.exposures)
+
+    def get(self, position: int, default: float = None):
+        return self.exposures.get(position, default)
+
+    def save(self, path: str = None):
+        path = path or table_path(self.key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump({
+                "key": self.key,
+                "target": self.target,
+                "percentile": self.percentile,
+                "exposures": {str(position): exposure
+                              for position, exposure in sorted(self.exposures.items())},
+            }, file, indent=2)
+        os.replace(temp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, "r") as file:
+            data = json.load(file)
+        return cls(data["key"], {int(position): exposure
+                                 for position, exposure in data["exposures"].items()},
+                   data["target"], data["percentile"])
+
+    @classmethod
+    def load_cached(cls, key: dict, directory: str = TABLE_DIRECTORY):
+        """
+        :return: the cached table for `key`, or None if there is none
+        """
+        path = table_path(key, directory)
+        if not os.path.exists(path):
+            return None
+        return cls.load(path)
+
+
+def converge_exposure(measure, initial_us: float, limits, target: float = DEFAULT_TARGET,
+                      percentile: float = DEFAULT_PERCENTILE, tolerance: float = DEFAULT_TOLERANCE,
+                      max_iterations: int = MAX_ITERATIONS):
+    """
+    Find the exposure that puts the `percentile` pixel level at `target`
+
+    :param measure: callable(exposure_us) -> FrameStatistics of a frame taken at that exposure
+    :param initial_us: first trial exposure
+    :param limits: (minimum, maximum) exposure supported by the camera
+    :return: the converged (or best effort) exposure in microseconds
+    """
+    minimum, maximum = limits
+    exposure = min(max(initial_us, minimum), maximum)
+    for _ in range(max_iterations):
+        stats = measure(exposure)
+        if stats.saturated_fraction > SATURATION_LIMIT:
+            new_exposure = exposure / MAX_STEP_FACTOR
+        else:
+            level = stats.percentile(percentile) / stats.max_value
+            if abs(level - target) <= tolerance * target:
+                return exposure
+            # The sensor response is linear in the exposure time
+            factor = target / max(level, 1.0 / stats.max_value)
+            factor = min(max(factor, 1.0 / MAX_STEP_FACTOR), MAX_STEP_FACTOR)
+            new_exposure = exposure * factor
+        new_exposure = min(max(new_exposure, minimum), maximum)
+        if new_exposure == exposure:
+            # Clamped at a limit, more iterations will not change anything
+            return exposure
+        exposure = new_exposure
+    return exposure
+
+
+def calibrate_exposure_table(measure, positions, initial_us: float, limits, key: dict = None,
+                             target: float = DEFAULT_TARGET, percentile: float = DEFAULT_PERCENTILE,
+                             tolerance: float = DEFAULT_TOLERANCE, set_position=None) -> ExposureTable:
+    """
+    Run the auto-exposure pass over all LED positions
+
+    :param measure: callable(exposure_us) -> FrameStatistics
+    :param positions: LED positions to calibrate
+    :param set_position: callable(position) that switches to the LED position
+    :return: the calibrated ExposureTable
+    """
+    table = ExposureTable(key, target=target, percentile=percentile)
+    exposure = initial_us
+    for position in positions:
+        if set_position is not None:
+            set_position(position)
+        # Neighbouring LEDs need similar exposures, start from the previous result
+        exposure = converge_exposure(measure, exposure, limits, target, percentile, tolerance)
+        table.exposures[position] = exposure
+        print(f"Position {position}: {exposure:.0f} us")
+    return table
@@ -0,0 +1,246 @@
+# \file    frame_bus.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Publish/subscribe bus that hands every frame to independent
+#          consumers (display, streaming, writers, ...), each with its own
+#          queue, drop policy and thread
+#
+# \version 1.0
+
+import collections
+import threading
+
+
+POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class SharedFrame:
+    """
+    A frame shared by reference between subscribers. The arrays are
+    read-only views, the release callback (e.g. re-queueing the camera
+    buffer) runs once when the last reference is released.
+    """
+
+    def __init__(self, image, metadata: dict, raw=None, release=None, references: int = 1):
+        """
+        :param image: converted image (ids_peak_ipl image) owning its memory, may be None
+        :param metadata: per-frame metadata, do not modify
+        :param raw: numpy view of the raw buffer, valid until the last release
+        :param release: callable() run when the last reference is released
+        """
+        if raw is not None:
+            raw = raw.view()
+            raw.flags.writeable = False
+        self.image = image
+        self.metadata = metadata
+        self.raw = raw
+        # Memory held while the frame is queued: converted image plus raw buffer
+        self.nbytes = (0 if raw is None else raw.nbytes) + (
+            0 if image is None else image.get_numpy_1D().nbytes)
+        self._release = release
+        self._references = references
+        # Memory budget reservation of the frame, one for all subscribers
+        self.reservation = None
+        self._lock = threading.Lock()
+
+    def acquire(self, count: int = 1):
+        with self._lock:
+            if self._references <= 0:
+                raise RuntimeError("The frame was already released")
+            self._references += count
+        return self
+
+    def release(self):
+        with self._lock:
+            self._references -= 1
+            last = self._references == 0
+        if last:
+            # The raw view must not be used once the buffer is back in the datastream
+            self.raw = None
+            if self.reservation is not None:
+                self.reservation.release()
+            if self._release is not None:
+                self._release()
+
+
+class Subscription:
+    """
+    One consumer of the bus. Its callback runs on the subscription's own
+    thread, so a slow consumer only delays itself.
+    """
+
+    def __init__(self, name: str, callback, queue_size: int = 2, policy: str = "drop_oldest",
+                 needs_raw: bool = False):
+        """
+        :param callback: callable(SharedFrame), the frame is released after it returns
+        :param queue_size: frames waiting for the callback
+        :param policy: "drop_oldest", "drop_newest" or "block" (the publisher
+                       waits for space, use for consumers that must see every frame)
+        :param needs_raw: the callback reads SharedFrame.raw, so every queued
+                          frame keeps its camera buffer out of the datastream
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown drop policy {policy!r}, use one of {', '.join(POLICIES)}")
+        self.name = name
+        self.callback = callback
+        self.queue_size = max(1, queue_size)
+        self.policy = policy
+        self.needs_raw = needs_raw
+        self.delivered = 0
+        self.dropped = 0
+        self.errors = 0
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"frame-bus-{name}", daemon=True)
+        self._thread.start()
+
+    def put(self, frame: SharedFrame):
+        """
+        Queue a frame that holds one reference for this subscription
+        """
+        dropped = None
+        with self._condition:
+            if self._closed:
+                dropped = frame
+            elif len(self._queue) >= self.queue_size:
+                if self.policy == "drop_oldest":
+                    dropped = self._queue.popleft()
+                    self._queue.append(frame)
+                elif self.policy == "drop_newest":
+                    dropped = frame
+                else:
+                    while len(self._queue) >= self.queue_size and not self._closed:
+                        self._condition.wait()
+                    if self._closed:
+                        dropped = frame
+                    else:
+                        self._queue.append(frame)
+            else:
+                self._queue.append(frame)
+            if dropped is not None and not self._closed:
+                self.dropped += 1
+            self._condition.notify_all()
+        if dropped is not None:
+            dropped.release()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                frame = self._queue.popleft()
+                self._condition.notify_all()
+            try:
+                self.callback(frame)
+                self.delivered += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Frame bus subscriber {self.name} failed: {str(e)}")
+            finally:
+                frame.release()
+
+    def close(self, wait: bool = True):
+        """
+        Stop the thread after the queued frames were handled
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+    @property
+    def backlog(self):
+        return len(self._queue)
+
+
+class FrameBus:
+    def __init__(self, budget=None, stage: str = "frame_bus"):
+        """
+        :param budget: memory_budget.MemoryBudget, every published frame is
+                       reserved once against its `stage`, however many
+                       subscribers share it. Frames over budget are dropped
+                       for all subscribers.
+        """
+        self._subscriptions = []
+        self._lock = threading.Lock()
+        self.budget = budget
+        self.stage = stage
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self, name: str, callback, queue_size: int = 2,
+                  policy: str = "drop_oldest", needs_raw: bool = False) -> Subscription:
+        """
+        See Subscription
+        """
+        subscription = Subscription(name, callback, queue_size, policy, needs_raw)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription, wait: bool = True):
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+        subscription.close(wait)
+
+    def needs_raw(self) -> bool:
+        """
+        :return: True if any subscriber reads the raw buffer, otherwise
+                 publish without raw and re-queue the buffer right away
+        """
+        with self._lock:
+            return any(subscription.needs_raw for subscription in self._subscriptions)
+
+    def held_buffers(self) -> int:
+        """
+        :return: camera buffers the raw subscribers can hold at most: a full
+                 queue plus the frame in their callback each
+        """
+        with self._lock:
+            return sum(subscription.queue_size + 1 for subscription in self._subscriptions
+                       if subscription.needs_raw)
+
+    def publish(self, image, metadata: dict, raw=None, release=None) -> SharedFrame:
+        """
+        Hand a frame to every subscriber. The publisher keeps one reference
+        and must release() the returned frame once it is done with it.
+        """
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        frame = SharedFrame(image, metadata, raw, release, 1 + len(subscriptions))
+        if self.budget is not None and subscriptions:
+            frame.reservation = self.budget.reserve(self.stage, frame.nbytes)
+            if frame.reservation is None:
+                # Over the memory budget, the stage's policy is to drop
+                self.dropped += 1
+                for _ in subscriptions:
+                    frame.release()
+                self.published += 1
+                return frame
+        for subscription in subscriptions:
+            subscription.put(frame)
+        self.published += 1
+        return frame
+
+    def statistics(self):
+        with self._lock:
+            return {subscription.name: {
+                "delivered": subscription.delivered,
+                "dropped": subscription.dropped,
+                "errors": subscription.errors,
+                "backlog": subscription.backlog,
+                "queue_size": subscription.queue_size,
+            } for subscription in self._subscriptions}
+
+    def close(self):
+        with self._lock:
+            subscriptions = self._subscriptions
+            self._subscriptions = []
+        for subscription in subscriptions:
+            subscription.close()
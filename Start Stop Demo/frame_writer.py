@@ -0,0 +1,41 @@
+# \file    frame_writer.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Writes numpy frames (fused, averaged, corrected) to disk
+#
+# \version 1.0
+
+import numpy as np
+from PIL import Image
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+
+# dtypes PIL can write as single channel TIFF
+PIL_TIFF_DTYPES = (np.uint8, np.uint16, np.int32, np.float32)
+
+
+def write_array(path_base: str, array: np.ndarray) -> str:
+    """
+    Write `array` as TIFF if possible, as .npy otherwise
+
+    :param path_base: file path without extension
+    :return: path of the written file
+    """
+    if tifffile is not None:
+        path = path_base + ".tif"
+        tifffile.imwrite(path, array)
+        return path
+    if (array.ndim == 2 and array.dtype.type in PIL_TIFF_DTYPES) or \
+            (array.ndim == 3 and array.shape[2] in (3, 4) and array.dtype == np.uint8):
+        path = path_base + ".tif"
+        Image.fromarray(np.ascontiguousarray(array)).save(path)
+        return path
+    # e.g. float32 colour frames, which PIL cannot store as TIFF
+    path = path_base + ".npy"
+    np.save(path, array)
+    return path
@@ -0,0 +1,90 @@
+# \file    hdr.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Fusion of exposure brackets into one high dynamic range frame
+#
+# \version 1.0
+
+import numpy as np
+
+
+# Pixels at or above this fraction of full scale are treated as clipped
+CLIP_FRACTION = 0.98
+# Weight floor, so pixels that are dark in every bracket still get a value
+MIN_WEIGHT = 1e-3
+
+
+class HdrFuser:
+    """
+    Weighted radiance average of K exposures of a static scene.
+
+    Every bracket contributes value / exposure with a hat-shaped weight
+    that favours mid-range pixels and ignores clipped ones. The result is
+    scaled to the shortest exposure, so unclipped pixels keep their value
+    range while dark pixels gain the precision of the long exposures.
+
+    The float32 work buffers are allocated once per frame shape and re-used
+    for every fusion.
+    """
+
+    def __init__(self):
+        self._shape = None
+        self._numerator = None
+        self._denominator = None
+        self._value = None
+        self._weight = None
+
+    def _allocate(self, shape):
+        if self._shape != shape:
+            self._shape = shape
+            self._numerator = np.empty(shape, np.float32)
+            self._denominator = np.empty(shape, np.float32)
+            self._value = np.empty(shape, np.float32)
+            self._weight = np.empty(shape, np.float32)
+
+    def fuse(self, frames, exposures_us, max_value: int, dtype=np.float32) -> np.ndarray:
+        """
+        :param frames: K integer frames of the same shape
+        :param exposures_us: exposure time of each frame
+        :param max_value: full scale of the raw pixel format
+        :param dtype: np.float32 for radiance in counts at the shortest exposure,
+                      np.uint16 for the same scaled to the full 16 bit range
+        :return: the fused frame (a new array)
+        """
+        if len(frames) != len(exposures_us) or not frames:
+            raise ValueError("Need one exposure time per bracket")
+        self._allocate(frames[0].shape)
+        numerator, denominator = self._numerator, self._denominator
+        value, weight = self._value, self._weight
+        numerator.fill(0)
+        denominator.fill(0)
+        reference_us = min(exposures_us)
+        clip = CLIP_FRACTION * max_value
+
+        for frame, exposure_us in zip(frames, exposures_us):
+            np.copyto(value, frame, casting="unsafe")
+            # Hat weight 1 - |2 v / max - 1|, zero for clipped pixels
+            np.multiply(value, 2.0 / max_value, out=weight)
+            weight -= 1.0
+            np.abs(weight, out=weight)
+            np.subtract(1.0, weight, out=weight)
+            np.maximum(weight, MIN_WEIGHT, out=weight)
+            weight[value >= clip] = 0.0
+            denominator += weight
+            # Radiance at the reference exposure
+            value *= reference_us / exposure_us
+            value *= weight
+            numerator += value
+
+        # Pixels clipped in every bracket: take the shortest exposure as is
+        shortest = frames[int(np.argmin(exposures_us))]
+        unresolved = denominator == 0
+        np.divide(numerator, denominator, out=numerator, where=~unresolved)
+        numerator[unresolved] = shortest[unresolved]
+
+        if np.dtype(dtype) == np.float32:
+            return numerator.copy()
+        np.multiply(numerator, 65535.0 / max_value, out=numerator)
+        np.clip(numerator, 0, 65535, out=numerator)
+        return numerator.astype(np.uint16)
@@ -0,0 +1,148 @@
+# \file    image_stats.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Live exposure statistics (histogram, saturation, per-channel
+#          min/max/mean) computed with numpy on a strided subsample
+#
+# \version 1.0
+
+import time
+
+import numpy as np
+
+
+HISTOGRAM_BINS = 256
+DEFAULT_BUDGET_US = 2000
+MAX_STEP = 64
+# Frames darker than this fraction of the full scale count as "empty"
+EMPTY_MEAN_FRACTION = 0.01
+
+
+def subsample(array: np.ndarray, step: int) -> np.ndarray:
+    """
+    Strided view of every `step`-th row and column, no copy
+    """
+    return array[::step, ::step]
+
+
+def channel_planes(array: np.ndarray, channels: int = None) -> np.ndarray:
+    """
+    Copy a (h, w) or (h, w, c) frame into contiguous (channels, pixels)
+    planes, dropping channels beyond `channels` (e.g. the alpha channel of
+    BGRa8). Reductions along contiguous planes are much faster than along
+    the interleaved channel axis.
+    """
+    if array.ndim == 2:
+        return np.ascontiguousarray(array).reshape(1, -1)
+    if channels is not None:
+        array = array[..., :channels]
+    return np.ascontiguousarray(np.moveaxis(array, -1, 0)).reshape(array.shape[-1], -1)
+
+
+class FrameStatistics:
+    def __init__(self, histogram, saturated_fraction, minimum, maximum, mean,
+                 max_value, step, elapsed_us):
+        self.histogram = histogram
+        self.saturated_fraction = saturated_fraction
+        self.minimum = minimum
+        self.maximum = maximum
+        self.mean = mean
+        self.max_value = max_value
+        self.step = step
+        self.elapsed_us = elapsed_us
+
+    @property
+    def empty(self):
+        """
+        True for a near-black frame, e.g. an LED that did not fire
+        """
+        return max(self.mean) < EMPTY_MEAN_FRACTION * self.max_value
+
+    def percentile(self, percent: float) -> float:
+        """
+        Pixel value below which `percent` % of the subsampled pixels fall,
+        interpolated from the histogram
+        """
+        cumulative = np.cumsum(self.histogram)
+        if cumulative[-1] == 0:
+            return 0.0
+        bin_index = int(np.searchsorted(cumulative, cumulative[-1] * percent / 100.0))
+        return (bin_index + 0.5) * (self.max_value + 1) / len(self.histogram)
+
+    def summary(self):
+        channels = ", ".join(f"{minimum}/{maximum}/{mean:.1f}" for minimum, maximum, mean
+                             in zip(self.minimum, self.maximum, self.mean))
+        return (f"min/max/mean: {channels}; saturated: {self.saturated_fraction * 100:.2f} %"
+                f"{' (empty frame)' if self.empty else ''}; "
+                f"step {self.step}, {self.elapsed_us:.0f} us")
+
+
+def compute_statistics(array: np.ndarray, max_value: int = 255, step: int = 1,
+                       channels: int = None, bins: int = HISTOGRAM_BINS) -> FrameStatistics:
+    """
+    :param array: (h, w) or (h, w, c) frame
+    :param max_value: full scale of the pixel format, e.g. 255 or 4095
+    :param step: subsampling stride in both directions
+    :param channels: number of colour channels to evaluate, None for all
+    :param bins: histogram bins over [0, max_value]
+    """
+    start = time.perf_counter()
+    planes = channel_planes(subsample(array, step), channels)
+
+    minimum = planes.min(axis=1)
+    maximum = planes.max(axis=1)
+    mean = planes.mean(axis=1, dtype=np.float64)
+    saturated = np.count_nonzero(np.logical_or.reduce(planes >= max_value, axis=0)) / max(planes.shape[1], 1)
+
+    # Integer pixel values map to bins with a scale instead of np.histogram
+    if max_value + 1 == bins:
+        histogram = np.bincount(planes.ravel(), minlength=bins)
+    else:
+        scaled = (planes.ravel().astype(np.uint32) * bins) // (max_value + 1)
+        histogram = np.bincount(np.minimum(scaled, bins - 1), minlength=bins)
+
+    elapsed_us = (time.perf_counter() - start) * 1e6
+    return FrameStatistics(histogram, saturated, minimum.tolist(), maximum.tolist(),
+                           mean.tolist(), max_value, step, elapsed_us)
+
+
+def clipping_mask(array: np.ndarray, max_value: int = 255, channels: int = None) -> np.ndarray:
+    """
+    :return: (h, w) bool mask of pixels where any channel is at full scale
+    """
+    if array.ndim == 2:
+        return array >= max_value
+    if channels is not None:
+        array = array[..., :channels]
+    return (array >= max_value).any(axis=2)
+
+
+def overlay_clipping(bgra: np.ndarray, max_value: int = 255) -> np.ndarray:
+    """
+    Paint clipped pixels of a (h, w, 4) BGRa8 preview frame red, in place
+    """
+    bgra[clipping_mask(bgra, max_value, channels=3)] = (0, 0, 255, 255)
+    return bgra
+
+
+class StatisticsStage:
+    """
+    Per-frame statistics within a time budget. The subsampling stride adapts
+    between frames: it doubles while the computation exceeds the budget and
+    halves again once it needs less than a quarter of it.
+    """
+
+    def __init__(self, budget_us: float = DEFAULT_BUDGET_US):
+        self.budget_us = budget_us
+        self.step = 4
+        self.last = None
+
+    def process(self, array: np.ndarray, max_value: int = 255, channels: int = None):
+        stats = compute_statistics(array, max_value, self.step, channels)
+        if stats.elapsed_us > self.budget_us and self.step < MAX_STEP:
+            self.step *= 2
+        elif stats.elapsed_us < self.budget_us / 4 and self.step > 1:
+            self.step //= 2
+        self.last = stats
+        return stats
@@ -0,0 +1,221 @@
+# \file    load_test.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Synthetic trigger storms: fire software triggers at a fixed rate or
+#          a ramp, measure drops and trigger-to-frame latency, and binary
+#          search the highest sustainable trigger rate
+#
+# \version 1.0
+
+import collections
+import threading
+import time
+
+import numpy as np
+from ids_peak import ids_peak
+
+
+DEFAULT_DURATION_S = 5.0
+# A rate is sustainable if the 99th percentile latency stays below this
+DEFAULT_MAX_LATENCY_S = 0.5
+# Frames still in flight after the last trigger must arrive within this time
+DRAIN_TIMEOUT_S = 2.0
+RECEIVE_TIMEOUT_MS = 500
+
+
+class LoadResult:
+    def __init__(self, rate_hz, triggered, received, dropped, incomplete, timeouts,
+                 latencies, max_in_flight, first_drop_rate_hz=None, max_latency_s=DEFAULT_MAX_LATENCY_S,
+                 bus_queues=None):
+        self.rate_hz = rate_hz
+        self.triggered = triggered
+        self.received = received
+        self.dropped = dropped
+        self.incomplete = incomplete
+        self.timeouts = timeouts
+        self.latencies = np.asarray(latencies, np.float64)
+        self.max_in_flight = max_in_flight
+        # Ramps only: trigger rate at which the first frame was lost
+        self.first_drop_rate_hz = first_drop_rate_hz
+        self.max_latency_s = max_latency_s
+        # Frame bus subscriber -> (deepest backlog seen, queue size)
+        self.bus_queues = bus_queues or {}
+
+    def percentile(self, percent: float) -> float:
+        if self.latencies.size == 0:
+            return float("inf")
+        return float(np.percentile(self.latencies, percent))
+
+    @property
+    def sustained(self):
+        return (self.dropped == 0 and self.incomplete == 0 and self.timeouts == 0
+                and self.received >= self.triggered
+                and self.percentile(99) <= self.max_latency_s)
+
+    def summary(self):
+        queues = "".join(f", {name} queue {depth}/{size}"
+                         for name, (depth, size) in self.bus_queues.items())
+        return (f"{self.rate_hz:.1f} Hz: triggered {self.triggered}, received {self.received}, "
+                f"dropped {self.dropped}, incomplete {self.incomplete}, timeouts {self.timeouts}, "
+                f"max in flight {self.max_in_flight}{queues}, latency p50/p95/p99/max "
+                f"{self.percentile(50) * 1000:.1f}/{self.percentile(95) * 1000:.1f}/"
+                f"{self.percentile(99) * 1000:.1f}/{self.percentile(100) * 1000:.1f} ms"
+                f" -> {'sustained' if self.sustained else 'NOT sustained'}")
+
+
+class LoadTest:
+    """
+    Drives a running Camera directly: one thread fires software triggers on
+    schedule, a second one receives (and optionally saves) the frames, so
+    a slow receive path shows up as frames in flight, latency and drops
+    instead of slowing the trigger rate down.
+    """
+
+    def __init__(self, camera, save: bool = False, max_latency_s: float = DEFAULT_MAX_LATENCY_S):
+        """
+        :param camera: Camera with acquisition running
+        :param save: receive through save_image (journal + files) instead of conversion only
+        """
+        self.camera = camera
+        self.save = save
+        self.max_latency_s = max_latency_s
+
+    def run(self, rate_hz: float, duration_s: float = DEFAULT_DURATION_S,
+            end_rate_hz: float = None) -> LoadResult:
+        """
+        :param rate_hz: trigger rate, the start rate of a ramp
+        :param end_rate_hz: ramp linearly up to this rate over `duration_s`, None for a fixed rate
+        """
+        schedule = _schedule(rate_hz, duration_s, end_rate_hz)
+        # Trigger times of the frames not received yet, oldest first: frames
+        # arrive in trigger order, so each frame belongs to the oldest one
+        pending_triggers = collections.deque()
+        state = {"triggered": 0, "received": 0, "timeouts": 0, "max_in_flight": 0}
+        latencies = []
+        bus_queues = {}
+        lock = threading.Lock()
+        triggers_done = threading.Event()
+
+        self.camera.sequence.reset()
+
+        def fire():
+            start = time.perf_counter()
+            for index, offset in enumerate(schedule):
+                delay = start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                triggered_at = time.perf_counter()
+                self.camera.software_trigger()
+                with lock:
+                    pending_triggers.append(triggered_at)
+                    state["triggered"] += 1
+                    state["max_in_flight"] = max(state["max_in_flight"],
+                                                 state["triggered"] - state["received"])
+            triggers_done.set()
+
+        trigger_thread = threading.Thread(target=fire, name="load-test-trigger")
+        trigger_thread.start()
+        drain_deadline = None
+        for name, counters in self.camera.frame_bus.statistics().items():
+            bus_queues[name] = (0, counters["queue_size"])
+        while True:
+            with lock:
+                if triggers_done.is_set() and state["received"] >= state["triggered"]:
+                    break
+            if triggers_done.is_set():
+                drain_deadline = drain_deadline or time.perf_counter() + DRAIN_TIMEOUT_S
+                if time.perf_counter() > drain_deadline:
+                    break
+            try:
+                if self.save:
+                    result = self.camera.save_image(RECEIVE_TIMEOUT_MS)
+                    metadata = None if result is None else result[1]
+                else:
+                    metadata = self.camera.acquire(RECEIVE_TIMEOUT_MS)[1]
+            except ids_peak.Exception:
+                # Timeout: a frame in flight was lost or is late
+                with lock:
+                    if state["triggered"] > state["received"]:
+                        state["timeouts"] += 1
+                continue
+            received_at = time.perf_counter()
+            with lock:
+                state["received"] += 1
+                # Triggers of frames the sequence check reports as lost never get a frame
+                for _ in range(0 if metadata is None else metadata["missing_before"]):
+                    if pending_triggers:
+                        pending_triggers.popleft()
+                triggered_at = pending_triggers.popleft() if pending_triggers else None
+            if metadata is not None and triggered_at is not None:
+                latencies.append(received_at - triggered_at)
+            for name, counters in self.camera.frame_bus.statistics().items():
+                depth, size = bus_queues.get(name, (0, counters["queue_size"]))
+                bus_queues[name] = (max(depth, counters["backlog"]), size)
+        trigger_thread.join()
+
+        counters = self.camera.sequence.counters()
+        # Frames that did not arrive while draining were lost
+        lost = max(0, state["triggered"] - state["received"])
+        first_drop_rate_hz = None
+        if end_rate_hz is not None:
+            missing = self.camera.sequence.missing_indices
+            first_lost = min(missing) if missing else (state["received"] if lost else None)
+            if first_lost is not None and first_lost < len(schedule):
+                first_drop_rate_hz = _rate_at(rate_hz, end_rate_hz, duration_s, schedule[first_lost])
+        return LoadResult(
+            rate_hz if end_rate_hz is None else end_rate_hz,
+            state["triggered"], state["received"], max(counters["dropped"], lost),
+            counters["incomplete"], state["timeouts"],
+            latencies, state["max_in_flight"], first_drop_rate_hz,
+            self.max_latency_s, bus_queues)
+
+    def find_capacity(self, low_hz: float, high_hz: float, duration_s: float = DEFAULT_DURATION_S,
+                      tolerance: float = 0.05, max_iterations: int = 10) -> float:
+        """
+        Binary search the highest trigger rate that is sustained for `duration_s`
+
+        :param tolerance: stop once the bracket is narrower than this fraction of the rate
+        :return: the capacity in Hz, 0 if even `low_hz` is not sustained
+        """
+        result = self.run(low_hz, duration_s)
+        print(result.summary())
+        if not result.sustained:
+            return 0.0
+        result = self.run(high_hz, duration_s)
+        print(result.summary())
+        if result.sustained:
+            print(f"{high_hz:.1f} Hz is sustained, the capacity may be higher")
+            return high_hz
+        for _ in range(max_iterations):
+            if high_hz - low_hz <= tolerance * low_hz:
+                break
+            rate_hz = (low_hz + high_hz) / 2
+            result = self.run(rate_hz, duration_s)
+            print(result.summary())
+            if result.sustained:
+                low_hz = rate_hz
+            else:
+                high_hz = rate_hz
+        return low_hz
+
+
+def _schedule(rate_hz: float, duration_s: float, end_rate_hz: float = None):
+    """
+    :return: trigger times in seconds from the start
+    """
+    if rate_hz <= 0 or (end_rate_hz is not None and end_rate_hz <= 0):
+        raise ValueError("Trigger rates must be positive")
+    if end_rate_hz is None:
+        return list(np.arange(int(rate_hz * duration_s)) / rate_hz)
+    # For a linear ramp the trigger count is the integral of the rate
+    times = []
+    t = 0.0
+    while t < duration_s:
+        times.append(t)
+        t += 1.0 / _rate_at(rate_hz, end_rate_hz, duration_s, t)
+    return times
+
+
+def _rate_at(rate_hz: float, end_rate_hz: float, duration_s: float, t: float) -> float:
+    return rate_hz + (end_rate_hz - rate_hz) * min(t / duration_s, 1.0)
@@ -227,7 +227,30 @@ def start(camera_device, ui):
     ui.start_interface()
 
 
+def main_remote(interface):
+    # The acquisition server process owns the camera, this process only runs the interface
+    from acquisition_server import RemoteCamera
+    camera_device = None
+    try:
+        camera_device = RemoteCamera.spawn(interface)
+        start(camera_device, interface)
+
+    except KeyboardInterrupt:
+        print("User interrupt: Exiting...")
+    except Exception as e:
+        print(f"Exception (main): {str(e)}")
+
+    finally:
+        if camera_device is not None:
+            camera_device.close()
+
+
 def main(interface):
+    # Run capture and writing in a separate process, see acquisition_server.py
+    if os.environ.get("FPM_ACQUISITION_SERVER") == "1":
+        main_remote(interface)
+        return
+
     # Initialize library and device manager
     ids_peak.Library.Initialize()
     device_manager = ids_peak.DeviceManager.Instance()
@@ -237,6 +260,14 @@ def main(interface):
         camera_device = camera.Camera(device_manager, interface)
         # Initialize software trigger and acquisition
         camera_device.init_software_trigger()
+        # Optionally stream frames to a remote machine, e.g. FPM_STREAM_ADDRESS=0.0.0.0:5555
+        if os.environ.get("FPM_STREAM_ADDRESS"):
+            try:
+                camera_device.start_frame_server(os.environ["FPM_STREAM_ADDRESS"],
+                                                 os.environ.get("FPM_STREAM_COMPRESSION"))
+            except (OSError, ValueError) as e:
+                # Streaming is optional, capture works without it
+                interface.warning(f"Cannot start streaming: {str(e)}")
         start(camera_device, interface)
 
     except KeyboardInterrupt:
@@ -0,0 +1,207 @@
+# \file    memory_budget.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Global memory accountant for frame-holding stages (frame bus
+#          queues, write queues, ...) with per-stage watermarks and an
+#          overflow policy per stage
+#
+# \version 1.0
+
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+
+
+POLICIES = ("block", "drop", "spill")
+DEFAULT_CAP_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_SPILL_DIRECTORY = os.path.join(tempfile.gettempdir(), "fpm_spill")
+
+
+class Reservation:
+    """
+    Bytes reserved by one frame (or job) of a stage, release() when the
+    frame is gone. Spilled reservations hold no RAM: the caller has to move
+    the data to disk, see spill_array.
+    """
+
+    def __init__(self, budget, stage, nbytes: int, spilled: bool = False):
+        self._budget = budget
+        self.stage = stage
+        self.nbytes = nbytes
+        self.spilled = spilled
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._budget._release(self)
+
+
+class _Stage:
+    def __init__(self, name, policy, high, low):
+        self.name = name
+        self.policy = policy
+        self.high = high
+        self.low = low
+        self.bytes = 0
+        self.peak = 0
+        self.frames = 0
+        self.drops = 0
+        self.spills = 0
+        self.blocked_s = 0.0
+        # Set above the high watermark, cleared below the low one
+        self.throttled = False
+
+
+class MemoryBudget:
+    """
+    Every stage reserves the bytes of a frame before holding it and
+    releases them when done. A reservation is refused when it would exceed
+    the global cap, or while the stage is throttled: from crossing its high
+    watermark until it is back below its low watermark. Refused
+    reservations follow the stage's policy:
+
+      "block" - wait for memory, e.g. the trigger path waits for the writer
+      "drop"  - the caller drops the frame, e.g. preview and streaming
+      "spill" - the caller writes the data to the spill directory instead
+    """
+
+    def __init__(self, cap_bytes: int = DEFAULT_CAP_BYTES,
+                 spill_directory: str = DEFAULT_SPILL_DIRECTORY):
+        self.cap_bytes = cap_bytes
+        self.spill_directory = spill_directory
+        self.bytes = 0
+        self.peak = 0
+        self._stages = {}
+        self._condition = threading.Condition()
+
+    def add_stage(self, name: str, policy: str = "drop", high: int = None, low: int = None):
+        """
+        :param high: stage watermark in bytes, None for the global cap only
+        :param low: the stage accepts frames again below this, defaults to high / 2
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown memory policy {policy!r}, use one of {', '.join(POLICIES)}")
+        high = high if high is not None else self.cap_bytes
+        low = low if low is not None else high // 2
+        with self._condition:
+            self._stages[name] = _Stage(name, policy, high, low)
+
+    def set_policy(self, name: str, policy: str):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown memory policy {policy!r}, use one of {', '.join(POLICIES)}")
+        with self._condition:
+            self._stages[name].policy = policy
+            self._condition.notify_all()
+
+    def _fits(self, stage: _Stage, nbytes: int):
+        if stage.throttled and stage.bytes <= stage.low:
+            stage.throttled = False
+        if not stage.throttled and stage.bytes + nbytes > stage.high:
+            stage.throttled = True
+        # A single frame larger than the whole watermark is let through on an empty stage
+        within_stage = not stage.throttled or stage.bytes == 0
+        return within_stage and (self.bytes + nbytes <= self.cap_bytes or self.bytes == 0)
+
+    def reserve(self, name: str, nbytes: int, timeout: float = None):
+        """
+        :param timeout: longest wait of a "block" stage, None to wait forever
+        :return: a Reservation, None if the frame has to be dropped
+        """
+        with self._condition:
+            stage = self._stages[name]
+            if not self._fits(stage, nbytes):
+                if stage.policy == "drop":
+                    stage.drops += 1
+                    return None
+                if stage.policy == "spill":
+                    stage.spills += 1
+                    return Reservation(self, stage, nbytes, spilled=True)
+                start = time.perf_counter()
+                deadline = None if timeout is None else start + timeout
+                while not self._fits(stage, nbytes):
+                    remaining = None if deadline is None else deadline - time.perf_counter()
+                    if remaining is not None and remaining <= 0:
+                        stage.blocked_s += time.perf_counter() - start
+                        stage.drops += 1
+                        return None
+                    self._condition.wait(remaining)
+                stage.blocked_s += time.perf_counter() - start
+            stage.bytes += nbytes
+            stage.frames += 1
+            stage.peak = max(stage.peak, stage.bytes)
+            self.bytes += nbytes
+            self.peak = max(self.peak, self.bytes)
+            return Reservation(self, stage, nbytes)
+
+    def _release(self, reservation: Reservation):
+        if reservation.spilled:
+            return
+        with self._condition:
+            reservation.stage.bytes -= reservation.nbytes
+            reservation.stage.frames -= 1
+            self.bytes -= reservation.nbytes
+            self._condition.notify_all()
+
+    def report(self):
+        """
+        :return: bytes in flight and counters, globally and per stage
+        """
+        with self._condition:
+            return {
+                "bytes": self.bytes,
+                "peak": self.peak,
+                "cap": self.cap_bytes,
+                "stages": {name: {
+                    "policy": stage.policy,
+                    "bytes": stage.bytes,
+                    "frames": stage.frames,
+                    "peak": stage.peak,
+                    "high": stage.high,
+                    "low": stage.low,
+                    "drops": stage.drops,
+                    "spills": stage.spills,
+                    "blocked_s": round(stage.blocked_s, 3),
+                } for name, stage in self._stages.items()},
+            }
+
+    def status_text(self):
+        report = self.report()
+        stages = ", ".join(f"{name} {stage['bytes'] / 2 ** 20:.0f} MB" + (
+            f" ({stage['drops']} dropped)" if stage["drops"] else "") + (
+            f" ({stage['spills']} spilled)" if stage["spills"] else "")
+            for name, stage in report["stages"].items())
+        return (f"Memory: {report['bytes'] / 2 ** 20:.0f} of {report['cap'] / 2 ** 20:.0f} MB "
+                f"in flight (peak {report['peak'] / 2 ** 20:.0f} MB); {stages}")
+
+
+class SpilledArray:
+    """
+    A numpy array moved to the spill directory, load() reads and deletes it
+    """
+
+    def __init__(self, array: np.ndarray, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{uuid.uuid4().hex}.npy")
+        np.save(self.path, array)
+
+    def load(self) -> np.ndarray:
+        array = np.load(self.path)
+        os.remove(self.path)
+        return array
+
+
+def spill_array(array: np.ndarray, budget: MemoryBudget) -> SpilledArray:
+    return SpilledArray(array, budget.spill_directory)
+
+
+def unspill(value):
+    """
+    :return: the array itself, or the loaded array of a SpilledArray
+    """
+    return value.load() if isinstance(value, SpilledArray) else value
@@ -0,0 +1,206 @@
+# \file    profiling.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Opt-in profiling of the acquisition hot path: timed sections, a
+#          sampling profiler writing flamegraph-compatible collapsed stacks
+#          and tracemalloc top allocators
+#
+# \version 1.0
+#
+# Enable with FPM_PROFILE=1 (or FPM_PROFILE=<report directory>), the CLI
+# command "profile start|stop" or the Qt menu. The report is written when
+# profiling stops, at the latest when the camera is closed. Render the
+# .collapsed file with flamegraph.pl or speedscope.
+
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+
+DEFAULT_DIRECTORY = "profiles"
+SAMPLE_INTERVAL_S = 0.005
+TRACEMALLOC_FRAMES = 16
+TOP_ALLOCATORS = 20
+
+
+class _SectionStats:
+    def __init__(self):
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+
+
+class _Section:
+    def __init__(self, profiler, name: str):
+        self._profiler = profiler
+        self._name = name
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        # Profiling may have stopped inside the section
+        if self._profiler.active:
+            self._profiler._record(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class _NoSection:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NO_SECTION = _NoSection()
+
+
+class Profiler:
+    """
+    While profiling is inactive section() returns a shared no-op context
+    manager, so a section costs a method call and an empty with block and
+    stays in the hot path permanently. Active sections add an object and
+    two clock reads.
+
+    Memory is reported as the top allocators of tracemalloc snapshots, not
+    per section: the traced memory is process-wide, so a per-section
+    difference would include allocations of all other threads.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.trace_memory = False
+        self.directory = DEFAULT_DIRECTORY
+        self._sections = collections.defaultdict(_SectionStats)
+        self._stacks = collections.Counter()
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._stop = threading.Event()
+        self._snapshot = None
+        self._started = 0.0
+        self._samples = 0
+
+    def section(self, name: str) -> _Section:
+        """
+        with profiler.section("convert"): ...
+        """
+        if not self.active:
+            return _NO_SECTION
+        return _Section(self, name)
+
+    def _record(self, name: str, elapsed: float):
+        with self._lock:
+            stats = self._sections[name]
+            stats.count += 1
+            stats.total_s += elapsed
+            stats.max_s = max(stats.max_s, elapsed)
+
+    def start(self, directory: str = None, trace_memory: bool = True):
+        """
+        :param directory: where stop() writes the report
+        :param trace_memory: run tracemalloc, which slows allocations down noticeably
+        """
+        if self.active:
+            return
+        self.directory = directory or self.directory
+        self._sections.clear()
+        self._stacks.clear()
+        self._samples = 0
+        self.trace_memory = trace_memory
+        if trace_memory:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._snapshot = tracemalloc.take_snapshot()
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+        self._started = time.perf_counter()
+        self.active = True
+        self._sampler.start()
+        print(f"Profiling started, report goes to {self.directory}")
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(SAMPLE_INTERVAL_S):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[";".join(reversed(stack))] += 1
+            self._samples += 1
+
+    def stop(self):
+        """
+        Stop profiling and write the report
+
+        :return: (collapsed stacks path, text report path), None if profiling was not active
+        """
+        if not self.active:
+            return None
+        self.active = False
+        self._stop.set()
+        self._sampler.join()
+        elapsed = time.perf_counter() - self._started
+
+        top = []
+        if self.trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            top = snapshot.compare_to(self._snapshot, "lineno")[:TOP_ALLOCATORS]
+            self._snapshot = None
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, "profile_" + time.strftime("%Y%m%d_%H%M%S"))
+        with open(base + ".collapsed", "w") as file:
+            for stack, count in self._stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        with open(base + ".txt", "w") as file:
+            file.write(self.report(elapsed, top))
+        print(f"Profile written to {base}.collapsed and {base}.txt")
+        return base + ".collapsed", base + ".txt"
+
+    def report(self, elapsed: float = None, top=()):
+        lines = []
+        if elapsed is not None:
+            lines.append(f"Profiled {elapsed:.1f} s, {self._samples} stack samples "
+                         f"every {SAMPLE_INTERVAL_S * 1000:.0f} ms")
+        lines.append("")
+        lines.append(f"{'section':<20}{'count':>8}{'total s':>10}{'mean ms':>10}{'max ms':>10}")
+        with self._lock:
+            sections = sorted(self._sections.items(), key=lambda item: -item[1].total_s)
+            for name, stats in sections:
+                lines.append(f"{name:<20}{stats.count:>8}{stats.total_s:>10.3f}"
+                             f"{stats.total_s / stats.count * 1000:>10.2f}{stats.max_s * 1000:>10.2f}")
+        if top:
+            lines.append("")
+            lines.append("Top allocators (growth since profiling started):")
+            for statistic in top:
+                lines.append(str(statistic))
+        return "\n".join(lines) + "\n"
+
+
+# One profiler for the process, shared by all hot-path sections
+profiler = Profiler()
+
+
+def start_from_environment():
+    """
+    Start profiling if FPM_PROFILE is set: "1" for the default report
+    directory, any other value is used as the directory
+    """
+    value = os.environ.get("FPM_PROFILE")
+    if value and value != "0":
+        profiler.start(None if value == "1" else value)
@@ -25,8 +25,10 @@
 import sys
 
 
-from camera import Camera
+from camera import Camera, bgra_array
+from image_stats import overlay_clipping
 from display import Display
+from profiling import profiler
 from ids_peak import ids_peak
 try:
     from PySide6 import QtCore, QtWidgets, QtGui
@@ -45,6 +47,7 @@ class Interface(QtWidgets.QMainWindow):
 
     messagebox_signal = QtCore.Signal((str, str))
     start_button_signal = QtCore.Signal()
+    statistics_signal = QtCore.Signal(str)
 
     def __init__(self, cam_module: Camera = None):
         """
@@ -67,12 +70,15 @@ class Interface(QtWidgets.QMainWindow):
         self._button_start_acquisition = None
         self._button_stop_acquisition = None
         self._checkbox_save = None
+        self._checkbox_clipping = None
         self._button_exit = None
         self._dropdown_pixel_format = None
+        self._action_profile = None
 
         self.messagebox_signal[str, str].connect(self.message)
 
         self._label_infos = None
+        self._label_statistics = None
         self._label_version = None
         self._label_aboutqt = None
 
@@ -90,6 +96,9 @@ class Interface(QtWidgets.QMainWindow):
         self._checkbox_save = QtWidgets.QCheckBox("save image to computer")
         self._checkbox_save.setChecked(False)
 
+        self._checkbox_clipping = QtWidgets.QCheckBox("show clipped pixels")
+        self._checkbox_clipping.setChecked(False)
+
         self._dropdown_pixel_format = QtWidgets.QComboBox()
         formats = self.__camera.node_map.FindNode("PixelFormat").Entries()
         for idx in formats:
@@ -120,14 +129,40 @@ class Interface(QtWidgets.QMainWindow):
         button_bar_layout.addWidget(self._button_software_trigger, 1, 0, 1, 2)
         button_bar_layout.addWidget(self._dropdown_pixel_format, 1, 2, 1, 1)
         button_bar_layout.addWidget(self._checkbox_save, 1, 3, 1, 1)
+        button_bar_layout.addWidget(self._checkbox_clipping, 2, 3, 1, 1)
 
         button_bar.setLayout(button_bar_layout)
         self.__layout.addWidget(button_bar)
 
+    def _create_menu(self):
+        menu = self.menuBar().addMenu("Tools")
+        self._action_profile = menu.addAction("Profile acquisition")
+        self._action_profile.setCheckable(True)
+        self._action_profile.setChecked(profiler.active)
+        self._action_profile.toggled.connect(self._toggle_profiling)
+
+    def _toggle_profiling(self, checked: bool):
+        if checked:
+            profiler.start()
+            return
+        paths = profiler.stop()
+        if paths is not None:
+            self.information(f"Profile written to\n{paths[0]}\n{paths[1]}")
+
     def _create_statusbar(self):
         status_bar = QtWidgets.QWidget(self.centralWidget())
         status_bar_layout = QtWidgets.QHBoxLayout()
         status_bar_layout.setContentsMargins(0, 0, 0, 0)
+
+        self._label_infos = QtWidgets.QLabel(status_bar)
+        self._label_infos.setAlignment(Qt.AlignLeft)
+        status_bar_layout.addWidget(self._label_infos)
+        self.display.frame_rates_changed.connect(self.on_frame_rates_changed)
+
+        self._label_statistics = QtWidgets.QLabel(status_bar)
+        self._label_statistics.setAlignment(Qt.AlignLeft)
+        status_bar_layout.addWidget(self._label_statistics)
+        self.statistics_signal.connect(self._label_statistics.setText)
         status_bar_layout.addStretch()
 
         self._label_version = QtWidgets.QLabel(status_bar)
@@ -153,6 +188,7 @@ class Interface(QtWidgets.QMainWindow):
     def start_window(self):
         self.display = Display()
         self.__layout.addWidget(self.display)
+        self._create_menu()
         self._create_button_bar()
         self._create_statusbar()
 
@@ -194,13 +230,19 @@ class Interface(QtWidgets.QMainWindow):
         :param image: takes an image for the video preview seen onscreen
         """
         # `get_numpy_1D` uses the image's underlying memory, so we make
-        # a copy here
-        image_numpy = image.get_numpy_1D().copy()
+        # a copy here. This runs on the frame bus display thread: the display
+        # only stores the image and paints it on its next refresh in the GUI thread
+        image_numpy = image.get_numpy_1D()
+        if self._checkbox_clipping.isChecked():
+            image_numpy = overlay_clipping(bgra_array(image).copy())
         qt_image = QtGui.QImage(image_numpy,
                                 image.Width(), image.Height(),
-                                QtGui.QImage.Format_RGB32)
+                                QtGui.QImage.Format_RGB32).copy()
         self.display.on_image_received(qt_image)
-        self.display.update()
+
+    def on_statistics(self, stats):
+        # Called on the camera thread, the label is updated through a signal
+        self.statistics_signal.emit(stats.summary())
 
     def warning(self, message: str):
         self.messagebox_signal.emit("Warning", message)
@@ -208,6 +250,11 @@ class Interface(QtWidgets.QMainWindow):
     def information(self, message: str):
         self.messagebox_signal.emit("Information", message)
 
+    @Slot(float, float)
+    def on_frame_rates_changed(self, displayed_fps: float, acquired_fps: float):
+        self._label_infos.setText(
+            f"Displayed: {displayed_fps:.1f} fps / Acquired: {acquired_fps:.1f} fps")
+
     @Slot(str)
     def on_aboutqt_link_activated(self, link: str):
         if link == "#aboutQt":
@@ -0,0 +1,146 @@
+# \file    quality_gate.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Frame quality gate: rejects blank, saturated or repeated frames on
+#          a subsampled view of the raw buffer, before conversion and writing
+#
+# \version 1.0
+
+import json
+import os
+import time
+
+import numpy as np
+
+
+DEFAULT_STEP = 8
+# An LED that did not fire leaves the frame darker than this fraction of full
+# scale. Dark-field frames of the outer LEDs are dim too, keep this low
+DEFAULT_MIN_MEAN = 0.002
+# Larger fractions of clipped pixels make the frame useless for reconstruction
+DEFAULT_MAX_SATURATED = 0.5
+REJECT_LOG_NAME = "rejected_frames.jsonl"
+
+
+class QualityResult:
+    def __init__(self, reasons, mean, saturated_fraction, similarity, elapsed_us):
+        self.reasons = reasons
+        self.mean = mean
+        self.saturated_fraction = saturated_fraction
+        self.similarity = similarity
+        self.elapsed_us = elapsed_us
+
+    @property
+    def passed(self):
+        return not self.reasons
+
+    def as_dict(self):
+        return {
+            "reasons": self.reasons,
+            "mean_fraction": self.mean,
+            "saturated_fraction": self.saturated_fraction,
+            "similarity": self.similarity,
+        }
+
+
+class QualityGate:
+    """
+    Checks a raw frame against the configured limits. Each check can be
+    disabled with None. The similarity check compares the frame with the
+    last accepted one, which catches a trigger misfire that delivers the
+    previous frame again.
+    """
+
+    def __init__(self, min_mean: float = DEFAULT_MIN_MEAN,
+                 max_saturated: float = DEFAULT_MAX_SATURATED,
+                 max_similarity: float = None, step: int = DEFAULT_STEP):
+        """
+        :param min_mean: minimum mean level as a fraction of full scale
+        :param max_saturated: maximum fraction of pixels at full scale
+        :param max_similarity: maximum correlation with the last accepted frame, e.g. 0.999
+        :param step: subsampling stride in both directions
+        """
+        self.min_mean = min_mean
+        self.max_saturated = max_saturated
+        self.max_similarity = max_similarity
+        self.step = step
+        # Off by default, FPM runs differ too much for one set of limits
+        self.enabled = False
+        self.accepted = 0
+        self.rejected = 0
+        self._previous = None
+
+    def reset(self):
+        self._previous = None
+
+    def check(self, array: np.ndarray, max_value: int) -> QualityResult:
+        """
+        :param array: raw frame, may be a view of the camera buffer
+        :param max_value: full scale of the raw pixel format
+        """
+        return self.check_sample(array[::self.step, ::self.step], max_value)
+
+    def check_sample(self, sample: np.ndarray, max_value: int) -> QualityResult:
+        """
+        :param sample: the frame subsampled by `step` in both directions,
+                       for callers that can sample cheaper than check()
+        :param max_value: full scale of the raw pixel format
+        """
+        start = time.perf_counter()
+        sample = np.ascontiguousarray(sample).reshape(-1)
+        reasons = []
+
+        mean = float(sample.mean(dtype=np.float64)) / max_value
+        if self.min_mean is not None and mean < self.min_mean:
+            reasons.append("blank")
+        saturated = float(np.count_nonzero(sample >= max_value)) / max(sample.size, 1)
+        if self.max_saturated is not None and saturated > self.max_saturated:
+            reasons.append("saturated")
+
+        similarity = None
+        if self.max_similarity is not None:
+            values = sample.astype(np.float32)
+            if self._previous is not None and self._previous.shape == values.shape:
+                similarity = _correlation(values, self._previous)
+                if similarity > self.max_similarity:
+                    reasons.append("repeated")
+            if not reasons:
+                self._previous = values
+
+        if reasons:
+            self.rejected += 1
+        else:
+            self.accepted += 1
+        return QualityResult(reasons, mean, saturated, similarity,
+                             (time.perf_counter() - start) * 1e6)
+
+    def summary(self):
+        limits = []
+        if self.min_mean is not None:
+            limits.append(f"mean >= {self.min_mean * 100:g} %")
+        if self.max_saturated is not None:
+            limits.append(f"saturated <= {self.max_saturated * 100:g} %")
+        if self.max_similarity is not None:
+            limits.append(f"similarity <= {self.max_similarity:g}")
+        return (f"{', '.join(limits) or 'no limits'}; "
+                f"accepted {self.accepted}, rejected {self.rejected}")
+
+
+def _correlation(a: np.ndarray, b: np.ndarray) -> float:
+    a = a - a.mean()
+    b = b - b.mean()
+    energy_a, energy_b = float(np.dot(a, a)), float(np.dot(b, b))
+    if energy_a == 0 or energy_b == 0:
+        # Two flat frames are identical as far as the gate is concerned
+        return 1.0 if energy_a == energy_b else 0.0
+    return float(np.dot(a, b)) / np.sqrt(energy_a * energy_b)
+
+
+def log_rejected(run_dir: str, metadata: dict):
+    """
+    Append the metadata (including the "quality" result) of a rejected frame
+    to the run's reject log
+    """
+    with open(os.path.join(run_dir, REJECT_LOG_NAME), "a") as file:
+        file.write(json.dumps(metadata) + "\n")
@@ -0,0 +1,12 @@
+# \file    conftest.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Makes the demo's modules importable from the tests
+#
+# \version 1.0
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,123 @@
+# \file    test_acquisition_server.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   RemoteCamera proxies against a fake camera served over a Pipe
+#
+# \version 1.0
+
+import gc
+import threading
+from multiprocessing import Pipe
+
+import pytest
+
+from acquisition_server import RemoteCamera, RemoteError, ServerInterface, SharedPreview, _Dispatcher
+
+
+class FakeNode:
+    def __init__(self, value):
+        self._value = value
+
+    def Value(self):
+        return self._value
+
+
+class FakeNodeMap:
+    def __init__(self):
+        self._nodes = {"Width": FakeNode(640), "Height": FakeNode(480)}
+
+    def FindNode(self, name):
+        return self._nodes[name]
+
+
+class FakeSequence:
+    def counters(self):
+        return {"dropped": 0}
+
+
+class FakeCamera:
+    def __init__(self):
+        self.node_map = FakeNodeMap()
+        self.sequence = FakeSequence()
+        self.exposure_us = 1000.0
+
+    def exposure(self):
+        return self.exposure_us
+
+
+class FakeInterface:
+    def set_camera(self, camera):
+        self.camera = camera
+
+
+def _serve(connection, dispatcher):
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request[0] == "close":
+            connection.send(("value", None))
+            break
+        try:
+            reply = dispatcher.handle(request)
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {str(e)}")
+        connection.send(reply)
+
+
+@pytest.fixture
+def remote():
+    client_end, server_end = Pipe()
+    preview = SharedPreview.create(64)
+    dispatcher = _Dispatcher(FakeCamera(), ServerInterface())
+    thread = threading.Thread(target=_serve, args=(server_end, dispatcher), daemon=True)
+    thread.start()
+    camera = RemoteCamera(client_end, preview.name, FakeInterface())
+    yield camera, dispatcher
+    camera.close()
+    thread.join(5)
+    preview.close()
+
+
+def test_values_and_methods(remote):
+    camera, _ = remote
+    assert camera.exposure() == 1000.0
+    camera.exposure_us = 2000.0
+    assert camera.exposure() == 2000.0
+    assert camera.sequence.counters() == {"dropped": 0}
+
+
+def test_chained_calls_on_temporary_proxies(remote):
+    camera, _ = remote
+    # Each intermediate proxy is garbage collected before the call that uses
+    # its method. The values are asserted afterwards, pytest's assertion
+    # rewriting would keep the intermediates alive.
+    width = camera.node_map.FindNode("Width").Value()
+    node_map = camera.node_map
+    height = node_map.FindNode("Height").Value()
+    del node_map
+    method = camera.node_map.FindNode
+    gc.collect()
+    node = method("Width")
+    counters = camera.sequence.counters()
+    assert width == 640
+    assert height == 480
+    assert node.Value() == 640
+    assert counters == {"dropped": 0}
+
+
+def test_released_proxies_free_their_handles(remote):
+    camera, dispatcher = remote
+    for _ in range(50):
+        assert camera.node_map.FindNode("Width").Value() == 640
+    # Releases are sent with the next request
+    camera.exposure()
+    assert set(dispatcher._handles) == {0}
+
+
+def test_server_errors_are_raised(remote):
+    camera, _ = remote
+    with pytest.raises(RemoteError):
+        camera.node_map.FindNode("Missing")
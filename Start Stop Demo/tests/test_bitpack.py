@@ -0,0 +1,69 @@
+# \file    test_bitpack.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   Mono10p/Mono12p pack/unpack round trips and the .bitpack file
+#
+# \version 1.0
+
+import numpy as np
+import pytest
+
+from bitpack import pack, packed_size, read_packed, unpack, unpack_rows, write_packed
+
+
+@pytest.mark.parametrize("bits", [10, 12])
+@pytest.mark.parametrize("shape", [(6, 8), (5, 7), (1, 1)])
+def test_round_trip(bits, shape):
+    rng = np.random.default_rng(bits)
+    frame = rng.integers(0, 1 << bits, shape, dtype=np.uint16)
+    packed = pack(frame, bits)
+    assert packed.size == packed_size(frame.size, bits)
+    assert np.array_equal(unpack(packed, bits, shape), frame)
+
+
+def test_genicam_layout():
+    # Mono12p: two pixels in three bytes, LSB first
+    packed = pack(np.array([[0xABC, 0x123]], np.uint16), 12)
+    assert packed.tolist() == [0xBC, 0x3A, 0x12]
+    # Mono10p: four pixels in five bytes
+    packed = pack(np.array([[0x3FF, 0, 0, 0x3FF]], np.uint16), 10)
+    assert packed.tolist() == [0xFF, 0x03, 0x00, 0xC0, 0xFF]
+
+
+def test_unpack_into_preallocated_output():
+    frame = np.arange(24, dtype=np.uint16).reshape(4, 6)
+    out = np.zeros_like(frame)
+    assert unpack(pack(frame, 12), 12, frame.shape, out) is out
+    assert np.array_equal(out, frame)
+    with pytest.raises(ValueError):
+        unpack(pack(frame, 12), 12, frame.shape, np.zeros((4, 6), np.float32))
+
+
+@pytest.mark.parametrize("bits", [10, 12])
+@pytest.mark.parametrize("shape", [(17, 8), (9, 7)])
+def test_unpack_rows(bits, shape):
+    frame = np.random.default_rng(0).integers(0, 1 << bits, shape, dtype=np.uint16)
+    assert np.array_equal(unpack_rows(pack(frame, bits), bits, shape, 4), frame[::4])
+
+
+def test_too_few_bytes():
+    with pytest.raises(ValueError):
+        unpack(np.zeros(2, np.uint8), 12, (1, 2))
+
+
+def test_file_round_trip(tmp_path):
+    frame = np.random.default_rng(1).integers(0, 1024, (10, 12), dtype=np.uint16)
+    path = write_packed(str(tmp_path / "frame"), pack(frame, 10), 10, frame.shape)
+    assert np.array_equal(read_packed(path), frame)
+
+
+def test_write_packed_rejects_bad_frames(tmp_path):
+    frame = np.zeros((4, 4), np.uint16)
+    base = str(tmp_path / "frame")
+    with pytest.raises(ValueError, match="2-D"):
+        write_packed(base, pack(frame, 12), 12, (4, 4, 1))
+    with pytest.raises(ValueError, match="do not match"):
+        write_packed(base, pack(frame, 12), 12, (4, 5))
+    with pytest.raises(ValueError, match="Unsupported"):
+        write_packed(base, pack(frame, 12), 8, (4, 4))
@@ -0,0 +1,114 @@
+# \file    test_frame_bus.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   FrameBus delivery, drop counting, release and memory reservations
+#
+# \version 1.0
+
+import threading
+
+import numpy as np
+
+from frame_bus import FrameBus
+from memory_budget import MemoryBudget
+
+
+class Release:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+
+
+def test_every_subscriber_gets_the_frame_and_release_runs_once():
+    bus = FrameBus()
+    received = []
+    bus.subscribe("a", lambda frame: received.append(("a", frame.metadata["index"])))
+    bus.subscribe("b", lambda frame: received.append(("b", frame.metadata["index"])))
+    release = Release()
+    bus.publish(None, {"index": 0}, release=release).release()
+    bus.close()
+    assert sorted(received) == [("a", 0), ("b", 0)]
+    assert release.count == 1
+
+
+def _blocked_subscriber(bus, policy):
+    """
+    Subscriber with a one-frame queue whose callback blocks on the first
+    frame until the returned gate is set
+    """
+    entered = threading.Event()
+    gate = threading.Event()
+    received = []
+
+    def callback(frame):
+        entered.set()
+        gate.wait(5)
+        received.append(frame.metadata["index"])
+
+    subscription = bus.subscribe("slow", callback, queue_size=1, policy=policy)
+    bus.publish(None, {"index": 0}).release()
+    assert entered.wait(5)
+    return subscription, gate, received
+
+
+def test_slow_subscriber_drops_oldest():
+    bus = FrameBus()
+    subscription, gate, received = _blocked_subscriber(bus, "drop_oldest")
+    releases = []
+    for index in range(1, 5):
+        release = Release()
+        releases.append(release)
+        bus.publish(None, {"index": index}, release=release).release()
+    assert bus.statistics()["slow"]["dropped"] == 3
+    gate.set()
+    bus.close()
+    assert received == [0, 4]
+    # Dropped frames are released as well
+    assert [release.count for release in releases] == [1, 1, 1, 1]
+
+
+def test_drop_newest_keeps_the_queue():
+    bus = FrameBus()
+    subscription, gate, received = _blocked_subscriber(bus, "drop_newest")
+    for index in range(1, 5):
+        bus.publish(None, {"index": index}).release()
+    assert subscription.dropped == 3
+    gate.set()
+    bus.close()
+    assert received == [0, 1]
+
+
+def test_raw_is_read_only_and_cleared_on_release():
+    bus = FrameBus()
+    seen = []
+    bus.subscribe("raw", lambda frame: seen.append(frame.raw.flags.writeable), needs_raw=True)
+    frame = bus.publish(None, {}, np.zeros((2, 2), np.uint16))
+    frame.release()
+    bus.close()
+    assert seen == [False]
+    assert frame.raw is None
+    assert bus.needs_raw() is False
+
+
+def test_one_reservation_per_frame_and_drop_over_budget():
+    budget = MemoryBudget(100)
+    budget.add_stage("frame_bus", "drop")
+    bus = FrameBus(budget, "frame_bus")
+    gate = threading.Event()
+    for name in ("a", "b", "c"):
+        bus.subscribe(name, lambda frame: gate.wait(5), queue_size=4, needs_raw=True)
+    assert bus.held_buffers() == 15
+    first = bus.publish(None, {}, np.zeros(80, np.uint8))
+    first.release()
+    # Shared by three subscribers, reserved once
+    assert budget.bytes == 80
+    second = Release()
+    bus.publish(None, {}, np.zeros(80, np.uint8), second).release()
+    assert bus.dropped == 1
+    assert second.count == 1
+    gate.set()
+    bus.close()
+    assert budget.bytes == 0
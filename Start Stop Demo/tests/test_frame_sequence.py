@@ -0,0 +1,82 @@
+# \file    test_frame_sequence.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   SequenceTracker gap, duplicate and FrameID wrap-around handling
+#
+# \version 1.0
+
+from frame_sequence import SequenceTracker
+
+INTERVAL_NS = 10_000_000
+
+
+def test_gap_free_run():
+    tracker = SequenceTracker()
+    indices = [tracker.update(frame_id, 1 + frame_id * INTERVAL_NS)["sequence_index"]
+               for frame_id in range(5)]
+    assert indices == [0, 1, 2, 3, 4]
+    assert tracker.run_ok()
+
+
+def test_frame_id_gap():
+    tracker = SequenceTracker()
+    tracker.update(10, 0)
+    tracker.update(11, 0)
+    metadata = tracker.update(14, 0)
+    assert metadata["sequence_index"] == 4
+    assert metadata["missing_before"] == 2
+    assert tracker.missing_indices == [2, 3]
+    assert tracker.counters()["gaps"] == 1
+    assert tracker.counters()["dropped"] == 2
+    assert not tracker.run_ok()
+
+
+def test_duplicate_does_not_advance():
+    tracker = SequenceTracker()
+    tracker.update(0, 0)
+    tracker.update(1, 0)
+    metadata = tracker.update(1, 0)
+    assert metadata["duplicate"]
+    assert tracker.update(2, 0)["sequence_index"] == 2
+    assert tracker.duplicates == 1
+    assert tracker.dropped == 0
+
+
+def test_frame_id_zero_is_valid():
+    tracker = SequenceTracker()
+    assert tracker.update(0, 0)["sequence_index"] == 0
+    assert tracker.update(1, 0)["missing_before"] == 0
+
+
+def test_wrap_around_64_bit():
+    tracker = SequenceTracker()
+    tracker.update((1 << 64) - 2, 0)
+    tracker.update((1 << 64) - 1, 0)
+    metadata = tracker.update(0, 0)
+    assert metadata["sequence_index"] == 2
+    assert metadata["missing_before"] == 0
+
+
+def test_wrap_around_gige_block_ids_skip_zero():
+    tracker = SequenceTracker(id_bits=16)
+    tracker.update(65534, 0)
+    tracker.update(65535, 0)
+    metadata = tracker.update(1, 0)
+    assert metadata["sequence_index"] == 2
+    assert metadata["missing_before"] == 0
+    metadata = tracker.update(3, 0)
+    assert metadata["missing_before"] == 1
+
+
+def test_timestamp_gap_without_frame_ids():
+    tracker = SequenceTracker()
+    timestamp = 1
+    for _ in range(5):
+        tracker.update(None, timestamp)
+        timestamp += INTERVAL_NS
+    # Two intervals without a frame
+    metadata = tracker.update(None, timestamp + 2 * INTERVAL_NS)
+    assert metadata["missing_before"] == 2
+    assert metadata["sequence_index"] == 7
+    assert tracker.missing_indices == [5, 6]
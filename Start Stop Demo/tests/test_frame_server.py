@@ -0,0 +1,43 @@
+# \file    test_frame_server.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   FrameServer loopback: numpy metadata and frames that cannot be encoded
+#
+# \version 1.0
+
+import time
+
+import numpy as np
+import pytest
+
+from frame_server import FrameClient, FrameServer
+
+
+@pytest.fixture
+def loopback():
+    server = FrameServer("127.0.0.1:0")
+    client = FrameClient(server.address, timeout=5)
+    while not server.statistics()["clients"]:
+        time.sleep(0.01)
+    yield server, client
+    client.close()
+    server.close()
+
+
+def test_numpy_metadata_is_streamed(loopback):
+    server, client = loopback
+    server.publish(b"frame", {"mean": np.float32(1.5), "histogram": np.arange(3)})
+    payload, metadata = client.receive()
+    assert payload == b"frame"
+    assert metadata == {"mean": 1.5, "histogram": [0, 1, 2]}
+
+
+def test_unencodable_frame_is_dropped(loopback):
+    server, client = loopback
+    server.publish(b"lost", {"value": object()})
+    server.publish(b"next", {"frame_index": 1})
+    payload, metadata = client.receive()
+    assert payload == b"next"
+    assert metadata == {"frame_index": 1}
+    assert server.statistics()["clients"][0]["dropped"] == 1
@@ -0,0 +1,95 @@
+# \file    test_memory_budget.py
+# \author  FPM-iDS-Camera
+# \date    2026-10-19
+#
+# \brief   MemoryBudget watermarks and the drop, spill and block policies
+#
+# \version 1.0
+
+import threading
+
+import numpy as np
+import pytest
+
+from memory_budget import MemoryBudget, spill_array, unspill
+
+
+def test_drop_at_high_watermark_until_low():
+    budget = MemoryBudget(1000)
+    budget.add_stage("queue", "drop", high=300, low=100)
+    reservations = [budget.reserve("queue", 100) for _ in range(3)]
+    assert all(reservations)
+    assert budget.reserve("queue", 100) is None
+    # Throttled until the stage is back at its low watermark
+    reservations.pop().release()
+    assert budget.reserve("queue", 100) is None
+    reservations.pop().release()
+    assert budget.reserve("queue", 100) is not None
+    assert budget.report()["stages"]["queue"]["drops"] == 2
+
+
+def test_global_cap_applies_across_stages():
+    budget = MemoryBudget(500)
+    budget.add_stage("a", "drop")
+    budget.add_stage("b", "drop")
+    kept = budget.reserve("a", 400)
+    assert budget.reserve("b", 200) is None
+    kept.release()
+    assert budget.reserve("b", 200) is not None
+    assert budget.bytes == 200
+    assert budget.peak == 400
+
+
+def test_release_is_idempotent():
+    budget = MemoryBudget(1000)
+    budget.add_stage("a", "drop")
+    reservation = budget.reserve("a", 100)
+    reservation.release()
+    reservation.release()
+    assert budget.bytes == 0
+
+
+def test_oversized_frame_passes_an_empty_budget():
+    budget = MemoryBudget(100)
+    budget.add_stage("a", "drop", high=50)
+    assert budget.reserve("a", 200) is not None
+
+
+def test_spill(tmp_path):
+    budget = MemoryBudget(100, spill_directory=str(tmp_path))
+    budget.add_stage("writer", "spill")
+    budget.reserve("writer", 100)
+    reservation = budget.reserve("writer", 100)
+    assert reservation.spilled
+    array = np.arange(10)
+    spilled = spill_array(array, budget)
+    assert np.array_equal(unspill(spilled), array)
+    assert not list(tmp_path.iterdir())
+    # Spilled reservations hold no RAM
+    reservation.release()
+    assert budget.bytes == 100
+
+
+def test_block_waits_for_release():
+    budget = MemoryBudget(100)
+    budget.add_stage("writer", "block")
+    held = budget.reserve("writer", 100)
+    timer = threading.Timer(0.05, held.release)
+    timer.start()
+    reservation = budget.reserve("writer", 100, timeout=5)
+    timer.join()
+    assert reservation is not None
+    assert budget.report()["stages"]["writer"]["blocked_s"] > 0
+
+
+def test_block_times_out():
+    budget = MemoryBudget(100)
+    budget.add_stage("writer", "block")
+    budget.reserve("writer", 100)
+    assert budget.reserve("writer", 100, timeout=0.01) is None
+    assert budget.report()["stages"]["writer"]["drops"] == 1
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        MemoryBudget().add_stage("a", "wait")